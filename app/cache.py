@@ -0,0 +1,193 @@
+"""Answer cache for Vibe Math API
+
+Answers are content-addressed: the key is a hash of the decoded image bytes
+together with every model setting that can change the reply. A bounded
+in-memory LRU/TTL tier sits in front of an optional SQLite tier that
+survives restarts.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    image_bytes: bytes,
+    model_name: str,
+    system_prompt: str,
+    max_tokens: int,
+    temperature: float,
+) -> str:
+    """Build a cache key from image content and model settings"""
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    settings = f"{model_name}\x00{system_prompt}\x00{max_tokens}\x00{temperature!r}"
+    digest.update(b"\x00")
+    digest.update(settings.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class AnswerCache:
+    """Two-tier answer cache: in-memory LRU/TTL with optional SQLite backing"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600.0,
+        db_path: Optional[str] = None,
+        db_max_entries: int = 10000,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path or None
+        self.db_max_entries = db_max_entries
+
+        self._memory: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Memory tier
+    def _memory_get(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, answer = entry
+        if expires_at <= time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return answer
+
+    def _memory_set(self, key: str, answer: str) -> None:
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = (time.time() + self.ttl_seconds, answer)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # Disk tier
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, answer TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS answers_accessed_at "
+                "ON answers (accessed_at)"
+            )
+            self._db.commit()
+            logger.info("Answer cache database opened at %s", self.db_path)
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            row = db.execute(
+                "SELECT answer, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            answer, created_at = row
+            if created_at + self.ttl_seconds <= now:
+                db.execute("DELETE FROM answers WHERE key = ?", (key,))
+                db.commit()
+                return None
+            db.execute(
+                "UPDATE answers SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            db.commit()
+            return answer
+
+    def _disk_set(self, key: str, answer: str) -> None:
+        now = time.time()
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, answer, now, now),
+            )
+            db.execute(
+                "DELETE FROM answers WHERE created_at <= ?", (now - self.ttl_seconds,)
+            )
+            # Keep only the most recently used rows
+            cursor = db.execute(
+                "DELETE FROM answers WHERE key IN ("
+                "SELECT key FROM answers ORDER BY accessed_at DESC "
+                "LIMIT -1 OFFSET ?)",
+                (self.db_max_entries,),
+            )
+            self.evictions += max(cursor.rowcount, 0)
+            db.commit()
+
+    # Public API
+    async def get(self, key: str) -> Optional[str]:
+        """Look up an answer, promoting disk hits into memory"""
+        answer = self._memory_get(key)
+        if answer is not None:
+            self.hits += 1
+            return answer
+
+        if self.db_path:
+            try:
+                answer = await run_in_threadpool(self._disk_get, key)
+            except sqlite3.Error as e:
+                logger.warning("Answer cache lookup failed: %s", e)
+                answer = None
+            if answer is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._memory_set(key, answer)
+                return answer
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, answer: str) -> None:
+        """Store an answer in every enabled tier"""
+        self._memory_set(key, answer)
+        if self.db_path:
+            try:
+                await run_in_threadpool(self._disk_set, key, answer)
+            except sqlite3.Error as e:
+                logger.warning("Answer cache write failed: %s", e)
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for the health endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+            "disk_enabled": self.db_path is not None,
+        }
+
+    def close(self) -> None:
+        """Close the SQLite connection if it was opened"""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
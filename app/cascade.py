@@ -0,0 +1,148 @@
+"""Model cascade and structured answer parsing for Vibe Math API
+
+Most problems are answered just as well by a small, fast model. The cascade
+tries the configured models in order and only escalates to the next (larger)
+one when the reply is "Cannot solve", does not follow the
+"Answer: ... Explanation: ..." format, or the call fails with an error a
+different model might not hit. The last model's reply is returned whatever
+it says.
+
+Per-tier counts and latencies show how often the cheap tier is enough, and
+so how much latency and quota the cascade saves.
+"""
+
+import logging
+import re
+import time
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+_ANSWER = re.compile(
+    # The explanation label may follow on the same line ("Answer: 4. Explanation: ...")
+    r"\s*answer\s*:\s*(?P<answer>\S.*?)[\s.;,]*\bexplanation\s*:\s*(?P<explanation>\S.*?)\s*$",
+    re.IGNORECASE | re.DOTALL,
+)
+_CANNOT_SOLVE = re.compile(r"\s*cannot solve\b\s*:?\s*(?P<reason>.*?)\s*$", re.IGNORECASE | re.DOTALL)
+
+OUTCOMES = ("answered", "cannot_solve", "bad_format", "error")
+
+
+class ParsedAnswer(NamedTuple):
+    """Structured fields of a model reply; all None when it does not follow the format"""
+    answer: Optional[str] = None
+    explanation: Optional[str] = None
+    cannot_solve: Optional[str] = None
+
+
+def parse_answer(text: str) -> ParsedAnswer:
+    """Split an "Answer: ... Explanation: ..." or "Cannot solve: ..." reply into fields"""
+    # Models sometimes bold the labels
+    text = text.replace("**", "")
+    match = _CANNOT_SOLVE.match(text)
+    if match:
+        return ParsedAnswer(cannot_solve=match.group("reason"))
+    match = _ANSWER.match(text)
+    if match:
+        return ParsedAnswer(answer=match.group("answer"), explanation=match.group("explanation"))
+    return ParsedAnswer()
+
+
+def classify_reply(parsed: ParsedAnswer) -> str:
+    """Return the cascade outcome for a parsed reply"""
+    if parsed.answer is not None:
+        return "answered"
+    if parsed.cannot_solve is not None:
+        return "cannot_solve"
+    return "bad_format"
+
+
+class _Tier:
+    __slots__ = ("model", "counts", "seconds")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.counts = dict.fromkeys(OUTCOMES, 0)
+        self.seconds = 0.0
+
+    def stats(self) -> dict:
+        calls = sum(self.counts.values())
+        return {
+            "model": self.model,
+            "calls": calls,
+            **self.counts,
+            "hit_rate": round(self.counts["answered"] / calls, 4) if calls else 0.0,
+            "avg_seconds": round(self.seconds / calls, 3) if calls else 0.0,
+        }
+
+
+class ModelCascade:
+    """Tries models cheapest first, escalating on unusable replies"""
+
+    def __init__(
+        self,
+        models: Sequence[str],
+        fatal_errors: Tuple[Type[BaseException], ...] = (),
+        is_fatal: Optional[Callable[[BaseException], bool]] = None,
+        on_result: Optional[Callable[[str, str, float], None]] = None,
+    ):
+        if not models:
+            raise ValueError("Model cascade needs at least one model")
+        self.models = list(models)
+        # Errors that would recur on every tier (e.g. an open circuit breaker)
+        self.fatal_errors = fatal_errors
+        self.is_fatal = is_fatal
+        self.on_result = on_result
+        self._tiers: List[_Tier] = [_Tier(model) for model in self.models]
+        self.requests = 0
+        self.escalations = 0
+
+    @property
+    def final_model(self) -> str:
+        return self.models[-1]
+
+    def _record(self, tier: _Tier, outcome: str, started: float) -> None:
+        elapsed = time.monotonic() - started
+        tier.counts[outcome] += 1
+        tier.seconds += elapsed
+        if self.on_result is not None:
+            self.on_result(tier.model, outcome, elapsed)
+
+    async def _try(self, tier: _Tier, call: Callable[[str], Awaitable[str]]) -> Tuple[str, str]:
+        started = time.monotonic()
+        try:
+            text = await call(tier.model)
+        except Exception:
+            self._record(tier, "error", started)
+            raise
+        outcome = classify_reply(parse_answer(text))
+        self._record(tier, outcome, started)
+        return text, outcome
+
+    async def run(self, call: Callable[[str], Awaitable[str]]) -> str:
+        """Call each model in turn until one answers, returning the reply text"""
+        self.requests += 1
+        for tier in self._tiers[:-1]:
+            try:
+                text, outcome = await self._try(tier, call)
+            except self.fatal_errors:
+                raise
+            except Exception as e:
+                if self.is_fatal is not None and self.is_fatal(e):
+                    raise
+                logger.warning("%s failed (%s), escalating", tier.model, type(e).__name__)
+            else:
+                if outcome == "answered":
+                    return text
+                logger.info("%s reply was %s, escalating", tier.model, outcome)
+            self.escalations += 1
+        text, _ = await self._try(self._tiers[-1], call)
+        return text
+
+    def stats(self) -> dict:
+        """Return per-tier counters for the health endpoint"""
+        return {
+            "requests": self.requests,
+            "escalations": self.escalations,
+            "tiers": [tier.stats() for tier in self._tiers],
+        }
@@ -0,0 +1,120 @@
+"""Pooled upstream clients for bring-your-own-key requests
+
+Each distinct API key gets one long-lived client so repeat callers reuse its
+keep-alive connections. Entries are keyed by a hash of the key (the raw key
+is never stored as a dictionary key), bounded by LRU eviction and an idle
+timeout, and closed once no request is using them.
+"""
+
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, List
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+def hash_api_key(api_key: str) -> str:
+    """Return a stable, non-reversible identifier for an API key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+
+class _PooledClient:
+    __slots__ = ("client", "last_used", "leases", "retired")
+
+    def __init__(self, client: "AsyncOpenAI"):
+        self.client = client
+        self.last_used = time.monotonic()
+        self.leases = 0
+        self.retired = False
+
+
+class ClientPool:
+    """Bounded LRU pool of AsyncOpenAI clients keyed by API key hash"""
+
+    def __init__(
+        self,
+        factory: Callable[[str], "AsyncOpenAI"],
+        max_clients: int = 64,
+        idle_timeout: float = 300.0,
+    ):
+        self.factory = factory
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+
+        self._clients: "OrderedDict[str, _PooledClient]" = OrderedDict()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def _collect_stale(self) -> List[_PooledClient]:
+        """Detach idle and over-capacity entries from the pool"""
+        stale = []
+        cutoff = time.monotonic() - self.idle_timeout
+        for key_hash in list(self._clients):
+            entry = self._clients[key_hash]
+            if entry.leases == 0 and entry.last_used <= cutoff:
+                stale.append(self._clients.pop(key_hash))
+        while len(self._clients) > self.max_clients:
+            _, entry = self._clients.popitem(last=False)
+            stale.append(entry)
+        return stale
+
+    async def _retire(self, entry: _PooledClient) -> None:
+        """Close a detached client once its last lease is released"""
+        entry.retired = True
+        if entry.leases > 0:
+            return
+        try:
+            await entry.client.close()
+        except Exception as e:
+            logger.warning("Failed to close pooled client: %s", e)
+
+    @asynccontextmanager
+    async def acquire(self, api_key: str) -> AsyncIterator["AsyncOpenAI"]:
+        """Lease the client for an API key, creating it if needed"""
+        key_hash = hash_api_key(api_key)
+        entry = self._clients.get(key_hash)
+        if entry is None:
+            entry = _PooledClient(self.factory(api_key))
+            self._clients[key_hash] = entry
+            self.created += 1
+        else:
+            self.reused += 1
+        self._clients.move_to_end(key_hash)
+        entry.leases += 1
+        entry.last_used = time.monotonic()
+
+        for stale in self._collect_stale():
+            self.evicted += 1
+            await self._retire(stale)
+
+        try:
+            yield entry.client
+        finally:
+            entry.leases -= 1
+            entry.last_used = time.monotonic()
+            if entry.retired and entry.leases == 0:
+                await self._retire(entry)
+
+    async def close(self) -> None:
+        """Close every pooled client (used on application shutdown)"""
+        entries = list(self._clients.values())
+        self._clients.clear()
+        for entry in entries:
+            await self._retire(entry)
+
+    def stats(self) -> dict:
+        """Return pool counters for the health endpoint"""
+        return {
+            "size": len(self._clients),
+            "max_clients": self.max_clients,
+            "created": self.created,
+            "reused": self.reused,
+            "evicted": self.evicted,
+        }
@@ -1,44 +1,147 @@
-"""Configuration module for Vibe Math API"""
+"""Configuration module for Vibe Math API
+
+Every setting is read from the environment (and an optional .env file)
+once, into an immutable Settings tuple. Each field's environment variable is
+its name in upper case, parsed according to the field's annotation. This
+deliberately avoids pydantic's BaseSettings: loading settings should cost
+microseconds on a cold start, and a missing GEMINI_API_KEY is reported when
+the server starts rather than when the module is imported.
+"""
 
 import os
-from typing import Optional
-from pydantic import BaseSettings, Field
-
-class Settings(BaseSettings):
-    """Application settings with validation"""
-    
-    # API Configuration
-    gemini_api_key: str = Field(..., env="GEMINI_API_KEY")
-    model_name: str = Field(default="gemini-1.5-flash", env="MODEL_NAME")
-    max_tokens: int = Field(default=500, env="MAX_TOKENS")
-    temperature: float = Field(default=0.2, env="TEMPERATURE")
-    
-    # Server Configuration
-    host: str = Field(default="0.0.0.0", env="HOST")
-    port: int = Field(default=8000, env="PORT")
-    
-    # Logging Configuration
-    log_level: str = Field(default="INFO", env="LOG_LEVEL")
-    
-    # Security
-    cors_origins: list = Field(default=["*"], env="CORS_ORIGINS")
-    
-    class Config:
-        env_file = ".env"
-        case_sensitive = False
-
-# Create settings instance
-settings = Settings()
-
-# Validate critical settings
-if not settings.gemini_api_key:
-    raise ValueError("GEMINI_API_KEY is required")
-
-# Export commonly used settings
-GEMINI_API_KEY = settings.gemini_api_key
-MODEL_NAME = settings.model_name
-MAX_TOKENS = settings.max_tokens
-TEMPERATURE = settings.temperature
-HOST = settings.host
-PORT = settings.port
-LOG_LEVEL = settings.log_level
\ No newline at end of file
+import tempfile
+from functools import lru_cache
+from typing import Mapping, NamedTuple, Optional
+
+TRUE_VALUES = ("1", "true", "yes")
+
+
+class Settings(NamedTuple):
+    """Application settings"""
+
+    # Upstream
+    gemini_api_key: Optional[str] = None
+    gemini_base_url: str = "https://generativelanguage.googleapis.com/v1beta"
+    # Comma-separated models, cheapest first; later models are only tried on escalation
+    model_cascade: str = "models/gemini-2.5-flash"
+
+    # Logging ("text" or "json"); sample rates apply to INFO logs, errors are always kept
+    log_level: str = "INFO"
+    log_format: str = "text"
+    log_sample_rate: float = 1.0
+    log_health_sample_rate: float = 0.0
+
+    # Answer cache
+    cache_max_entries: int = 1024
+    cache_ttl_seconds: float = 86400.0
+    cache_db_path: Optional[str] = None
+    cache_db_max_entries: int = 10000
+
+    # Near-duplicate answer index (TTL defaults to the cache TTL)
+    near_dup_enabled: bool = False
+    near_dup_max_entries: int = 4096
+    near_dup_max_distance: int = 6
+    near_dup_ttl_seconds: Optional[float] = None
+
+    # Local SymPy solver for typed problems
+    symbolic_enabled: bool = True
+    symbolic_workers: int = 2
+    symbolic_cpu_limit: float = 1.0
+    symbolic_max_length: int = 200
+
+    # Asynchronous job API; the default is writable even when the app directory is not
+    jobs_db_path: str = os.path.join(tempfile.gettempdir(), "vibe-math-jobs.db")
+    jobs_workers: int = 4
+    jobs_max_queue: int = 64
+    jobs_ttl_seconds: float = 86400.0
+    jobs_stale_seconds: float = 600.0
+    jobs_max_wait: float = 30.0
+    jobs_retry_after: int = 5
+
+    # Bring-your-own-key client pool
+    client_pool_max_clients: int = 64
+    client_pool_idle_timeout: float = 300.0
+
+    # Image normalization
+    image_normalize: bool = True
+    image_max_edge: int = 1600
+    image_grayscale: bool = False
+    image_format: str = "JPEG"
+    image_quality: int = 85
+
+    # Worksheet mode (pages split into problems in worker processes; gap is a fraction of page height)
+    worksheet_enabled: bool = True
+    worksheet_workers: int = 1
+    worksheet_max_problems: int = 20
+    worksheet_min_gap: float = 0.02
+    worksheet_concurrency: int = 4
+
+    # Batch solve
+    batch_max_images: int = 32
+    batch_concurrency: int = 4
+
+    # Admission control (shared key: /solve, /solve-json; BYO key: /api/solve-with-key)
+    admission_max_in_flight: int = 32
+    admission_max_queue: int = 64
+    admission_byo_max_in_flight: int = 16
+    admission_byo_max_queue: int = 32
+    admission_queue_timeout: float = 10.0
+    admission_retry_after: int = 2
+
+    # Upstream retries, pacing and circuit breaker
+    retry_max_attempts: int = 3
+    retry_base_delay: float = 0.5
+    retry_max_delay: float = 8.0
+    retry_max_retry_after: float = 10.0
+    key_rate_limit_per_second: float = 10.0
+    key_rate_limit_burst: float = 20.0
+    key_rate_limit_max_wait: float = 2.0
+    breaker_failure_threshold: int = 5
+    breaker_cooldown: float = 30.0
+
+    # Hedged upstream requests (a percentile of 0 keeps the delay fixed)
+    hedge_enabled: bool = False
+    hedge_delay: float = 4.0
+    hedge_percentile: float = 0.0
+    hedge_max_ratio: float = 0.05
+
+    # Shared upstream HTTP transport (HTTP/2 needs the optional h2 package)
+    upstream_http2: bool = True
+    upstream_max_connections: int = 64
+    upstream_max_keepalive: int = 32
+    upstream_keepalive_expiry: float = 60.0
+    upstream_connect_timeout: float = 5.0
+    upstream_read_timeout: float = 60.0
+    upstream_warmup: bool = True
+    upstream_warmup_connections: int = 4
+    upstream_warmup_timeout: float = 5.0
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] = os.environ) -> "Settings":
+        """Build settings from environment variables, falling back to the defaults"""
+        values = {}
+        for name, annotation in cls.__annotations__.items():
+            raw = environ.get(name.upper())
+            if raw is None:
+                continue
+            # Optional[X] parses as X
+            kind = next(
+                (arg for arg in getattr(annotation, "__args__", ()) if arg is not type(None)),
+                annotation
+            )
+            if kind is bool:
+                values[name] = raw.lower() in TRUE_VALUES
+            elif kind in (int, float):
+                values[name] = kind(raw)
+            else:
+                values[name] = raw
+        return cls(**values)
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """Load settings once, including any .env file in the working directory"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings.from_env()
@@ -0,0 +1,126 @@
+"""Hedged upstream requests for Vibe Math API
+
+Gemini latency has a long tail: the same kind of image usually takes a few
+seconds but occasionally fifteen or more. When a call has not returned
+within a hedge delay, an identical second call is started; whichever
+succeeds first wins and the other is cancelled.
+
+The delay is either fixed or tracks a percentile of recently observed
+latencies. Hedges draw from a budget that grows by `max_ratio` per call, so
+at most that fraction of calls (plus a small burst) costs double quota.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Latencies needed before the percentile replaces the fixed delay
+MIN_SAMPLES = 20
+
+
+class Hedger:
+    """Fires a backup call when the first one is slower than the hedge delay"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        delay: float = 4.0,
+        percentile: float = 0.0,
+        max_ratio: float = 0.05,
+        burst: float = 5.0,
+        window: int = 500,
+        on_hedge: Optional[Callable[[str], None]] = None,
+    ):
+        self.enabled = enabled
+        self.delay = delay
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.on_hedge = on_hedge
+
+        self._latencies: "deque[float]" = deque(maxlen=window)
+        self._budget = 0.0
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self.skipped = 0
+
+    def current_delay(self) -> float:
+        """Return the hedge delay: a latency percentile once warmed up, else the fixed delay"""
+        if self.percentile > 0 and len(self._latencies) >= MIN_SAMPLES:
+            ordered = sorted(self._latencies)
+            index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+            return ordered[index]
+        return self.delay
+
+    def _take_budget(self) -> bool:
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+    def _emit(self, outcome: str) -> None:
+        if self.on_hedge is not None:
+            self.on_hedge(outcome)
+
+    async def run(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn, hedging it with a second identical call if it is slow"""
+        if not self.enabled:
+            return await fn()
+
+        self.calls += 1
+        self._budget = min(self._budget + self.max_ratio, self.burst)
+        delay = self.current_delay()
+        started = time.monotonic()
+
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._take_budget():
+                if not done:
+                    self.skipped += 1
+                result = await primary
+                self._latencies.append(time.monotonic() - started)
+                return result
+
+            self.fired += 1
+            self._emit("fired")
+            logger.info("Upstream call slower than %.2fs, sending a hedged request", delay)
+            hedge = asyncio.ensure_future(fn())
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        # A lower bound on the primary's latency; keeps the percentile honest
+                        self._latencies.append(time.monotonic() - started)
+                        if task is hedge:
+                            self.won += 1
+                            self._emit("won")
+                        return task.result()
+            # Both calls failed; report the original call's error
+            return primary.result()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        """Return hedging counters for the health endpoint"""
+        return {
+            "enabled": self.enabled,
+            "delay": round(self.current_delay(), 3),
+            "calls": self.calls,
+            "fired": self.fired,
+            "won": self.won,
+            "skipped_budget": self.skipped,
+        }
@@ -0,0 +1,179 @@
+"""Image normalization for Vibe Math API
+
+Phone photos arrive as multi-megabyte JPEG/HEIC files. Before upload to
+Gemini they are sniffed, EXIF-rotated and stripped, downscaled and
+re-encoded to a compact JPEG or WebP. The CPU-bound work runs in the
+threadpool so the event loop stays free.
+"""
+
+import io
+import logging
+from typing import NamedTuple, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# ISO-BMFF brands used by HEIC/HEIF/AVIF containers
+_HEIC_BRANDS = {b"heic", b"heix", b"hevc", b"hevx", b"heim", b"heis"}
+_HEIF_BRANDS = {b"mif1", b"msf1"}
+_AVIF_BRANDS = {b"avif", b"avis"}
+
+_OUTPUT_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+# Image.info keys whose presence means the original bytes carry metadata
+_METADATA_KEYS = ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp")
+
+
+def sniff_image_format(data: bytes) -> Optional[str]:
+    """Return the MIME type of an image from its magic bytes, or None"""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp":
+        brand = data[8:12]
+        if brand in _HEIC_BRANDS:
+            return "image/heic"
+        if brand in _HEIF_BRANDS:
+            return "image/heif"
+        if brand in _AVIF_BRANDS:
+            return "image/avif"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    if data.startswith((b"II*\x00", b"MM\x00*")):
+        return "image/tiff"
+    return None
+
+
+class NormalizedImage(NamedTuple):
+    """Result of normalizing an uploaded image"""
+
+    data: bytes
+    mime_type: str
+    original_size: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_size - len(self.data)
+
+
+def normalize_image(
+    data: bytes,
+    max_edge: int = 1600,
+    grayscale: bool = False,
+    output_format: str = "JPEG",
+    quality: int = 85,
+) -> NormalizedImage:
+    """Downscale, strip metadata and re-encode an image (blocking)
+
+    Raises ValueError if the bytes are not a recognised image format.
+    Formats Pillow cannot decode (e.g. HEIC without a plugin) are passed
+    through unchanged with their real MIME type.
+    """
+    mime_type = sniff_image_format(data)
+    if mime_type is None:
+        raise ValueError("Unrecognised image format")
+
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            has_metadata = any(key in img.info for key in _METADATA_KEYS)
+            resized = max_edge > 0 and max(img.size) > max_edge
+            if resized and img.format == "JPEG":
+                # Let the JPEG decoder downscale by DCT scaling so the full
+                # resolution raster is never allocated
+                img.draft("L" if grayscale else "RGB", (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img)
+            if resized:
+                img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            if grayscale:
+                img = img.convert("L")
+            elif img.mode in ("RGBA", "LA", "P"):
+                # Flatten transparency onto white so text stays legible
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+
+            # Re-encoding without exif/icc drops all metadata
+            buffer = io.BytesIO()
+            img.save(buffer, format=output_format, quality=quality, optimize=True)
+    except Image.DecompressionBombError:
+        raise ValueError("Image dimensions too large")
+    except OSError as e:
+        logger.warning("Could not decode %s image, uploading as-is: %s", mime_type, e)
+        return NormalizedImage(data, mime_type, len(data))
+
+    encoded = buffer.getvalue()
+    if len(encoded) >= len(data) and not (resized or grayscale or has_metadata):
+        # Already compact and clean; keep the original bytes
+        return NormalizedImage(data, mime_type, len(data))
+    return NormalizedImage(encoded, _OUTPUT_MIME_TYPES[output_format], len(data))
+
+
+class ImageNormalizer:
+    """Runs normalize_image off the event loop and tracks bytes saved"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_edge: int = 1600,
+        grayscale: bool = False,
+        output_format: str = "JPEG",
+        quality: int = 85,
+    ):
+        output_format = output_format.upper()
+        if output_format not in _OUTPUT_MIME_TYPES:
+            raise ValueError(f"Unsupported output format: {output_format}")
+        self.enabled = enabled
+        self.max_edge = max_edge
+        self.grayscale = grayscale
+        self.output_format = output_format
+        self.quality = quality
+
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def normalize(self, data: bytes) -> NormalizedImage:
+        """Normalize image bytes in the threadpool"""
+        if self.enabled:
+            result = await run_in_threadpool(
+                normalize_image,
+                data,
+                self.max_edge,
+                self.grayscale,
+                self.output_format,
+                self.quality,
+            )
+        else:
+            mime_type = sniff_image_format(data)
+            if mime_type is None:
+                raise ValueError("Unrecognised image format")
+            result = NormalizedImage(data, mime_type, len(data))
+
+        self.images += 1
+        self.bytes_in += result.original_size
+        self.bytes_out += len(result.data)
+        logger.info(
+            "Normalized image to %s: %d -> %d bytes (%d saved)",
+            result.mime_type, result.original_size, len(result.data), result.bytes_saved,
+        )
+        return result
+
+    def stats(self) -> dict:
+        """Return normalization counters for the health endpoint"""
+        return {
+            "enabled": self.enabled,
+            "images": self.images,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_saved": self.bytes_in - self.bytes_out,
+        }
@@ -0,0 +1,302 @@
+"""Asynchronous solve jobs for Vibe Math API
+
+Clients that cannot hold a request open for a slow Gemini call submit a
+job, get its id back immediately and poll (or long-poll) for the result.
+A fixed pool of asyncio workers drains a bounded in-memory queue, so
+bursts wait in line instead of being rejected by admission control.
+
+Job state and results live in SQLite with a TTL, so any uvicorn worker
+sharing the file can answer a poll and results survive restarts. Queued
+payloads stay in memory only; API keys and images are never written to
+disk. The owning process refreshes its queued and running jobs
+periodically, so a job left queued or running by a process that died is
+reported as failed once it has gone unrefreshed for longer than any solve
+could take, while a job that is merely waiting in line never is.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+JobFunc = Callable[[], Awaitable[dict]]
+
+
+class JobFailed(Exception):
+    """Raised by a job function to record a client-facing error"""
+
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has no room for another job"""
+
+
+class JobStore:
+    """SQLite-backed job records with a TTL"""
+
+    def __init__(self, db_path: str, ttl_seconds: float = 86400.0, stale_seconds: float = 600.0):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, result TEXT, error TEXT, "
+                "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at)"
+            )
+            self._db.commit()
+            logger.info("Job store opened at %s", self.db_path)
+        return self._db
+
+    def open(self) -> None:
+        """Open the database now, so an unusable path fails at startup rather than on the first job"""
+        with self._lock:
+            self._connect()
+
+    def create(self, job_id: str) -> None:
+        now = time.time()
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs (id, status, created_at, updated_at) VALUES (?, 'queued', ?, ?)",
+                (job_id, now, now),
+            )
+            db.execute("DELETE FROM jobs WHERE updated_at <= ?", (now - self.ttl_seconds,))
+            db.commit()
+
+    def update(
+        self,
+        job_id: str,
+        status: str,
+        result: Optional[dict] = None,
+        error: Optional[dict] = None,
+    ) -> None:
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(result) if result is not None else None,
+                    json.dumps(error) if error is not None else None,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            db.commit()
+
+    def touch(self, job_ids: List[str]) -> None:
+        """Mark queued and running jobs as still owned by a live process"""
+        with self._lock:
+            db = self._connect()
+            db.executemany(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+                [(time.time(), job_id) for job_id in job_ids],
+            )
+            db.commit()
+
+    def get(self, job_id: str, owned: bool = False) -> Optional[dict]:
+        """Return a job record; `owned` jobs belong to this process and are never stale"""
+        now = time.time()
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT status, result, error, created_at, updated_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        status, result, error, created_at, updated_at = row
+        if updated_at + self.ttl_seconds <= now:
+            return None
+        error = json.loads(error) if error else None
+        if not owned and status in ("queued", "running") and now - updated_at > self.stale_seconds:
+            # The process that owned the job is gone
+            status = "failed"
+            error = {"detail": "Job was interrupted", "status_code": 500}
+        return {
+            "id": job_id,
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class JobManager:
+    """Bounded job queue drained by a fixed pool of asyncio workers"""
+
+    def __init__(
+        self,
+        store: JobStore,
+        workers: int = 4,
+        max_queue: int = 64,
+        poll_interval: float = 0.25,
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_queue = max_queue
+        self.poll_interval = poll_interval
+
+        self._queue: "Optional[asyncio.Queue[Tuple[str, JobFunc]]]" = None
+        self._tasks: List["asyncio.Task"] = []
+        self._heartbeat_task: "Optional[asyncio.Task]" = None
+        # Jobs owned by this process, so their pollers can wait without the database
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self.running = 0
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self) -> None:
+        """Start the worker tasks on the running event loop"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [
+            asyncio.ensure_future(self._worker(i)) for i in range(self.workers)
+        ]
+        self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+        logger.info("Started %s job workers", self.workers)
+
+    async def close(self) -> None:
+        """Cancel the workers; queued jobs go stale and are reported as interrupted"""
+        tasks = self._tasks + ([self._heartbeat_task] if self._heartbeat_task else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+        self._heartbeat_task = None
+        await run_in_threadpool(self.store.close)
+
+    async def submit(self, fn: JobFunc) -> str:
+        """Queue a job and return its id, or raise JobQueueFull"""
+        if self._queue is None or self._queue.full():
+            self.rejected += 1
+            raise JobQueueFull()
+        job_id = uuid.uuid4().hex
+        await run_in_threadpool(self.store.create, job_id)
+        try:
+            self._queue.put_nowait((job_id, fn))
+        except asyncio.QueueFull:
+            # Another submit took the last slot while the record was written
+            self.rejected += 1
+            error = {"detail": "Job queue is full", "status_code": 503}
+            await run_in_threadpool(self.store.update, job_id, "failed", None, error)
+            raise JobQueueFull()
+        self._done_events[job_id] = asyncio.Event()
+        self.submitted += 1
+        return job_id
+
+    async def _heartbeat(self) -> None:
+        """Keep this process's unfinished jobs from looking stale to other processes"""
+        interval = self.store.stale_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            job_ids = list(self._done_events)
+            if not job_ids:
+                continue
+            try:
+                await run_in_threadpool(self.store.touch, job_ids)
+            except sqlite3.Error as e:
+                logger.error("Could not refresh queued jobs: %s", e)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job_id, fn = await self._queue.get()
+            self.running += 1
+            try:
+                await self._run(job_id, fn)
+            finally:
+                self.running -= 1
+                self._queue.task_done()
+                event = self._done_events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+
+    async def _run(self, job_id: str, fn: JobFunc) -> None:
+        try:
+            await run_in_threadpool(self.store.update, job_id, "running")
+            try:
+                result = await fn()
+            except JobFailed as e:
+                self.failed += 1
+                error = {"detail": e.detail, "status_code": e.status_code}
+                await run_in_threadpool(self.store.update, job_id, "failed", None, error)
+                return
+            except Exception as e:
+                self.failed += 1
+                logger.error("Job %s failed: %s", job_id, e)
+                error = {"detail": "Error processing request", "status_code": 500}
+                await run_in_threadpool(self.store.update, job_id, "failed", None, error)
+                return
+            self.succeeded += 1
+            await run_in_threadpool(self.store.update, job_id, "done", result)
+        except sqlite3.Error as e:
+            logger.error("Could not record job %s: %s", job_id, e)
+
+    async def get(self, job_id: str, wait: float = 0.0) -> Optional[dict]:
+        """Return a job record, waiting up to `wait` seconds for it to finish"""
+        event = self._done_events.get(job_id)
+        job = await run_in_threadpool(self.store.get, job_id, event is not None)
+        if job is None or wait <= 0 or job["status"] in ("done", "failed"):
+            return job
+
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            return await run_in_threadpool(self.store.get, job_id, job_id in self._done_events)
+
+        # Owned by another process; poll the shared database
+        deadline = time.monotonic() + wait
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(self.poll_interval, deadline - time.monotonic()))
+            job = await run_in_threadpool(self.store.get, job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                break
+        return job
+
+    def stats(self) -> dict:
+        """Return job counters for the health endpoint"""
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,174 @@
+"""Non-blocking, structured request logging for Vibe Math API
+
+Log calls on the event loop only put the record on a queue; a background
+QueueListener thread formats it and writes it out, so a slow stdout never
+stalls a request. Records are stamped with the id of the request being
+served (taken from an incoming X-Request-ID header or generated), which
+follows the request through every helper and spawned task via a ContextVar.
+
+Each request ends with one access log carrying its status, duration and the
+time spent in each instrumented stage. INFO records are sampled per request,
+separately for health probes, so high-rate traffic does not flood the logs;
+warnings and errors, including the access log of a failed request, are
+always kept.
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+from app.metrics import current_endpoint, request_stages
+
+logger = logging.getLogger(__name__)
+
+# Id of the request being served, set by RequestLogMiddleware
+request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Whether the current request's INFO records are kept
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+
+# Load balancer and monitoring probes, sampled separately
+HEALTH_ENDPOINTS = frozenset(("/", "/health", "/metrics"))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s"
+JSON_FORMAT = "%(asctime)s %(name)s %(levelname)s %(request_id)s %(message)s"
+
+_VALID_REQUEST_ID = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves message formatting to the listener thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamps records with the request id and drops unsampled INFO records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get() or "-"
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+def configure_logging(level: str = "INFO", json_format: bool = False) -> None:
+    """Route root logging through a queue drained by a background thread"""
+    global _listener
+    stop_logging()
+
+    output = logging.StreamHandler()
+    if json_format:
+        from pythonjsonlogger import jsonlogger
+
+        output.setFormatter(jsonlogger.JsonFormatter(JSON_FORMAT))
+    else:
+        output.setFormatter(logging.Formatter(TEXT_FORMAT))
+
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    handler = _QueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for existing in [h for h in root.handlers if isinstance(h, _QueueHandler)]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(records, output)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+def _stage_name(histogram_name: str) -> str:
+    return re.sub(r"^vibe_math_|_duration_seconds$", "", histogram_name)
+
+
+class RequestLogMiddleware:
+    """ASGI middleware assigning request ids, sampling logs and writing the access log
+
+    Must run inside MetricsMiddleware, which sets the endpoint label.
+    """
+
+    def __init__(self, app, sample_rate: float = 1.0, health_sample_rate: float = 0.0):
+        self.app = app
+        self.sample_rate = sample_rate
+        self.health_sample_rate = health_sample_rate
+
+    def _request_id(self, scope) -> str:
+        for name, value in scope.get("headers", ()):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.fullmatch(candidate):
+                    return candidate
+                break
+        return uuid.uuid4().hex
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rid = self._request_id(scope)
+        endpoint = current_endpoint.get()
+        rate = self.health_sample_rate if endpoint in HEALTH_ENDPOINTS else self.sample_rate
+        stages = {}
+        tokens = (
+            request_id.set(rid),
+            _sampled.set(rate >= 1 or random.random() < rate),
+            request_stages.set(stages),
+        )
+        status_code = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+                message["headers"] = list(message.get("headers", ())) + [
+                    (b"x-request-id", rid.encode("latin-1"))
+                ]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._log(scope, status_code[0], time.perf_counter() - start, stages)
+            request_stages.reset(tokens[2])
+            _sampled.reset(tokens[1])
+            request_id.reset(tokens[0])
+
+    def _log(self, scope, status_code: int, seconds: float, stages: dict) -> None:
+        level = logging.ERROR if status_code >= 500 else logging.INFO
+        if not logger.isEnabledFor(level):
+            return
+        duration_ms = round(seconds * 1000, 1)
+        logger.log(
+            level, "%s %s %s %.1fms", scope["method"], scope["path"], status_code, duration_ms,
+            extra={"http": {
+                "method": scope["method"],
+                "path": scope["path"],
+                "status": status_code,
+                "duration_ms": duration_ms,
+                "stages_ms": {
+                    _stage_name(name): round(value * 1000, 1) for name, value in stages.items()
+                },
+            }},
+        )
@@ -1,36 +1,271 @@
-import os
-import base64
+import json
+import asyncio
+import binascii
 import logging
-from typing import Optional
-from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, List, NamedTuple, Optional, Union
+from contextlib import AsyncExitStack, asynccontextmanager
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, status
+from fastapi import APIRouter, FastAPI, UploadFile, File, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel, validator
-from openai import AsyncOpenAI, APIError, APIConnectionError, RateLimitError
-from dotenv import load_dotenv
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, root_validator, validator
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from app.admission import AdmissionController, AdmissionRejected
+from app.cache import AnswerCache, make_cache_key
+from app.cascade import ModelCascade, parse_answer
+from app.clients import ClientPool, hash_api_key
+from app.config import get_settings
+from app.hedging import Hedger
+from app.imaging import ImageNormalizer, sniff_image_format
+from app.jobs import JobFailed, JobManager, JobQueueFull, JobStore
+from app.logs import RequestLogMiddleware, configure_logging, request_id
+from app.metrics import (
+    FAST_BUCKETS, MetricsMiddleware, MetricsRegistry, Timer, current_endpoint
 )
-logger = logging.getLogger(__name__)
+from app.perceptual import NearDuplicateIndex
+from app.resilience import (
+    CircuitBreaker, CircuitOpenError, LocalRateLimitError, ResilientCaller, is_client_error,
+    parse_retry_after
+)
+from app.singleflight import SingleFlight
+from app.symbolic import SymbolicSolver
+from app.transport import UpstreamTransport
+from app.worksheet import Tile, WorksheetSegmenter
 
-# Load environment variables
-load_dotenv()
-logger.info("Environment variables loaded from .env file")
+logger = logging.getLogger(__name__)
 
-# Configuration
-MODEL_NAME = "models/gemini-2.5-flash"
+# Configuration (environment-driven settings are loaded once into app.config.Settings)
+settings = get_settings()
+MODEL_CASCADE = [model.strip() for model in settings.model_cascade.split(",") if model.strip()]
 MAX_TOKENS = 500
 TEMPERATURE = 0.2
+MAX_IMAGE_BYTES = 5 * 1024 * 1024  # 5MB limit
+UPLOAD_CHUNK_SIZE = 64 * 1024
+MAX_TEXT_CHARS = 2000
 
 # Global variables for client and API key
 client = None
 GEMINI_API_KEY = None
 
+# Shared answer cache (SQLite tier is opened lazily on first use)
+answer_cache = AnswerCache(
+    max_entries=settings.cache_max_entries,
+    ttl_seconds=settings.cache_ttl_seconds,
+    db_path=settings.cache_db_path,
+    db_max_entries=settings.cache_db_max_entries
+)
+
+# Answers for visually identical images, matched by perceptual hash
+near_duplicates = NearDuplicateIndex(
+    enabled=settings.near_dup_enabled,
+    max_entries=settings.near_dup_max_entries,
+    ttl_seconds=(
+        settings.near_dup_ttl_seconds if settings.near_dup_ttl_seconds is not None
+        else settings.cache_ttl_seconds
+    ),
+    max_distance=settings.near_dup_max_distance
+)
+
+# Answers typed arithmetic, equations, derivatives and integrals without Gemini
+symbolic_solver = SymbolicSolver(
+    enabled=settings.symbolic_enabled,
+    workers=settings.symbolic_workers,
+    cpu_limit=settings.symbolic_cpu_limit,
+    max_length=settings.symbolic_max_length
+)
+
+# Background solve jobs with results persisted in SQLite
+jobs = JobManager(
+    JobStore(
+        settings.jobs_db_path,
+        ttl_seconds=settings.jobs_ttl_seconds,
+        stale_seconds=settings.jobs_stale_seconds
+    ),
+    workers=settings.jobs_workers,
+    max_queue=settings.jobs_max_queue
+)
+
+# Pooled HTTP/2 connections with tuned limits and timeouts for the shared-key client
+upstream_transport = UpstreamTransport(
+    http2=settings.upstream_http2,
+    max_connections=settings.upstream_max_connections,
+    max_keepalive=settings.upstream_max_keepalive,
+    keepalive_expiry=settings.upstream_keepalive_expiry,
+    connect_timeout=settings.upstream_connect_timeout,
+    read_timeout=settings.upstream_read_timeout
+)
+
+def make_client(api_key: str, http_client=None):
+    """Create an upstream client; openai is imported here because it is slow to import"""
+    from openai import AsyncOpenAI
+    
+    # Retries are handled by the resilience layer, not the SDK
+    return AsyncOpenAI(
+        base_url=settings.gemini_base_url, api_key=api_key, max_retries=0, http_client=http_client
+    )
+
+def get_client():
+    """Return the shared-key client, creating it on first use"""
+    global client
+    if client is None:
+        client = make_client(GEMINI_API_KEY, http_client=upstream_transport.client())
+        logger.info("OpenAI client initialized successfully")
+    return client
+
+# Pool of per-key clients for /api/solve-with-key
+client_pool = ClientPool(
+    factory=make_client,
+    max_clients=settings.client_pool_max_clients,
+    idle_timeout=settings.client_pool_idle_timeout
+)
+
+# Shrinks uploads before they are sent to Gemini
+image_normalizer = ImageNormalizer(
+    enabled=settings.image_normalize,
+    max_edge=settings.image_max_edge,
+    grayscale=settings.image_grayscale,
+    output_format=settings.image_format,
+    quality=settings.image_quality
+)
+
+# Cuts worksheet pages into separate problems in worker processes
+worksheet_segmenter = WorksheetSegmenter(
+    enabled=settings.worksheet_enabled,
+    workers=settings.worksheet_workers,
+    max_problems=settings.worksheet_max_problems,
+    min_gap=settings.worksheet_min_gap
+)
+
+# Upstream admission control, with separate budgets per key type
+shared_admission = AdmissionController(
+    "shared-key",
+    max_in_flight=settings.admission_max_in_flight,
+    max_queue=settings.admission_max_queue,
+    queue_timeout=settings.admission_queue_timeout
+)
+byo_admission = AdmissionController(
+    "byo-key",
+    max_in_flight=settings.admission_byo_max_in_flight,
+    max_queue=settings.admission_byo_max_queue,
+    queue_timeout=settings.admission_queue_timeout
+)
+
+# Retries, per-key pacing and circuit breaking around every upstream call
+resilience = ResilientCaller(
+    max_attempts=settings.retry_max_attempts,
+    base_delay=settings.retry_base_delay,
+    max_delay=settings.retry_max_delay,
+    max_retry_after=settings.retry_max_retry_after,
+    rate_per_second=settings.key_rate_limit_per_second,
+    burst=settings.key_rate_limit_burst,
+    max_rate_wait=settings.key_rate_limit_max_wait,
+    breaker=CircuitBreaker(
+        failure_threshold=settings.breaker_failure_threshold,
+        cooldown=settings.breaker_cooldown
+    )
+)
+
+# Cheapest model first, escalating on "Cannot solve", malformed replies and
+# transient errors; a rejected key or request would fail on every model
+cascade = ModelCascade(
+    MODEL_CASCADE,
+    fatal_errors=(CircuitOpenError, LocalRateLimitError),
+    is_fatal=is_client_error,
+    on_result=lambda model, outcome, seconds: record_model_result(model, outcome, seconds)
+)
+
+# Backup calls for slow upstream requests, capped to a fraction of traffic
+hedger = Hedger(
+    enabled=settings.hedge_enabled,
+    delay=settings.hedge_delay,
+    percentile=settings.hedge_percentile,
+    max_ratio=settings.hedge_max_ratio,
+    on_hedge=lambda outcome: hedges_total.inc(current_endpoint.get(), outcome)
+)
+
+# Prometheus metrics
+metrics = MetricsRegistry()
+request_seconds = metrics.histogram(
+    "vibe_math_request_duration_seconds", "Total request latency", ("endpoint", "status")
+)
+decode_seconds = metrics.histogram(
+    "vibe_math_image_decode_duration_seconds", "Image read, decode and validation time",
+    ("endpoint",), buckets=FAST_BUCKETS
+)
+normalize_seconds = metrics.histogram(
+    "vibe_math_image_normalize_duration_seconds", "Image normalization time", ("endpoint",)
+)
+upstream_seconds = metrics.histogram(
+    "vibe_math_upstream_duration_seconds", "Gemini call latency including retries", ("endpoint",)
+)
+errors_total = metrics.counter(
+    "vibe_math_errors_total", "Errors returned to clients by class", ("endpoint", "error")
+)
+tokens_total = metrics.counter(
+    "vibe_math_upstream_tokens_total", "Upstream token usage", ("endpoint", "type")
+)
+segment_seconds = metrics.histogram(
+    "vibe_math_worksheet_segment_duration_seconds", "Worksheet page segmentation time",
+    ("endpoint",), buckets=FAST_BUCKETS
+)
+local_solve_seconds = metrics.histogram(
+    "vibe_math_local_solve_duration_seconds", "Local symbolic solve time, including fallbacks",
+    ("endpoint",), buckets=FAST_BUCKETS
+)
+model_seconds = metrics.histogram(
+    "vibe_math_model_duration_seconds", "Latency of each model tier in the cascade", ("model",)
+)
+model_replies_total = metrics.counter(
+    "vibe_math_model_replies_total", "Model replies by cascade tier and outcome", ("endpoint", "model", "outcome")
+)
+hedges_total = metrics.counter(
+    "vibe_math_upstream_hedges_total", "Hedged upstream requests fired and won", ("endpoint", "outcome")
+)
+local_solves_total = metrics.counter(
+    "vibe_math_local_solves_total", "Typed problems by local solver outcome", ("endpoint", "outcome")
+)
+requests_in_flight = metrics.gauge(
+    "vibe_math_requests_in_flight", "Requests currently being served", ("endpoint",)
+)
+metrics.gauge(
+    "vibe_math_upstream_in_flight", "Upstream calls currently admitted", ("budget",),
+    callback=lambda: {
+        ("shared_key",): shared_admission.in_flight,
+        ("byo_key",): byo_admission.in_flight
+    }
+)
+metrics.gauge(
+    "vibe_math_admission_queue_depth", "Requests waiting for an upstream slot", ("budget",),
+    callback=lambda: {
+        ("shared_key",): shared_admission.queue_depth,
+        ("byo_key",): byo_admission.queue_depth
+    }
+)
+metrics.gauge(
+    "vibe_math_job_queue_depth", "Jobs waiting for a job worker",
+    callback=lambda: {(): jobs.queue_depth}
+)
+
+def record_error(kind: str) -> None:
+    """Count an error returned to the client"""
+    errors_total.inc(current_endpoint.get(), kind)
+
+def record_model_result(model: str, outcome: str, seconds: float) -> None:
+    """Count a cascade tier's reply and its latency"""
+    model_seconds.observe(model, value=seconds)
+    model_replies_total.inc(current_endpoint.get(), model, outcome)
+
+def record_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """Count upstream token usage for the current endpoint"""
+    endpoint = current_endpoint.get()
+    if prompt_tokens:
+        tokens_total.inc(endpoint, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        tokens_total.inc(endpoint, "completion", amount=completion_tokens)
+
+# Coalesces concurrent identical upstream calls
+inflight = SingleFlight()
+
 # System prompt
 SYSTEM_PROMPT = (
     "You are an expert science and math tutor who provides clear, thoughtful, and brief explanations. Given an image of a problem, "
@@ -40,27 +275,83 @@ SYSTEM_PROMPT = (
 
 # Pydantic models
 class ImagePayload(BaseModel):
-    image: str
+    image: Optional[str] = None
+    text: Optional[str] = None
+    worksheet: bool = False
     
     @validator('image')
     def validate_image(cls, v):
         if not v or not isinstance(v, str):
             raise ValueError('Image must be a non-empty string')
         return v
+    
+    @validator('text')
+    def validate_text(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Text must be a non-empty string')
+        if len(v) > MAX_TEXT_CHARS:
+            raise ValueError(f'Text must be at most {MAX_TEXT_CHARS} characters')
+        return v
+    
+    @root_validator(skip_on_failure=True)
+    def validate_content(cls, values):
+        if values.get("image") is None and values.get("text") is None:
+            raise ValueError('Either image or text is required')
+        if values.get("worksheet") and values.get("image") is None:
+            raise ValueError('Worksheet mode requires an image')
+        return values
 
-class ImagePayloadWithKey(BaseModel):
-    image: str
+class ImagePayloadWithKey(ImagePayload):
     api_key: str
     
-    @validator('image')
-    def validate_image(cls, v):
+    @validator('api_key')
+    def validate_api_key(cls, v):
         if not v or not isinstance(v, str):
-            raise ValueError('Image must be a non-empty string')
+            raise ValueError('API key must be a non-empty string')
+        return v
+
+class TextPayload(BaseModel):
+    text: str
+    api_key: Optional[str] = None
+    
+    @validator('text')
+    def validate_text(cls, v):
+        if not v or not v.strip():
+            raise ValueError('Text must be a non-empty string')
+        if len(v) > MAX_TEXT_CHARS:
+            raise ValueError(f'Text must be at most {MAX_TEXT_CHARS} characters')
         return v
     
     @validator('api_key')
     def validate_api_key(cls, v):
-        if not v or not isinstance(v, str):
+        if v is not None and not v:
+            raise ValueError('API key must be a non-empty string')
+        return v
+
+class JobPayload(ImagePayload):
+    api_key: Optional[str] = None
+    
+    @validator('api_key')
+    def validate_api_key(cls, v):
+        if v is not None and not v:
+            raise ValueError('API key must be a non-empty string')
+        return v
+
+class BatchPayload(BaseModel):
+    images: List[str]
+    api_key: Optional[str] = None
+    
+    @validator('images')
+    def validate_images(cls, v):
+        if not v:
+            raise ValueError('Images must be a non-empty list')
+        if len(v) > settings.batch_max_images:
+            raise ValueError(f'At most {settings.batch_max_images} images per batch')
+        return v
+    
+    @validator('api_key')
+    def validate_api_key(cls, v):
+        if v is not None and not v:
             raise ValueError('API key must be a non-empty string')
         return v
 
@@ -68,193 +359,747 @@ class ErrorResponse(BaseModel):
     detail: str
     status_code: int
 
+class Solution(NamedTuple):
+    """Answer for one image and where it came from"""
+    answer: str
+    near_duplicate: bool = False
+    solved_locally: bool = False
+    
+    def to_dict(self) -> dict:
+        """Response body: the raw answer, its parsed fields and where it came from"""
+        return {**self._asdict(), "parsed": parse_answer(self.answer)._asdict()}
+
 # Application lifespan management
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Handle application startup and shutdown"""
-    global client, GEMINI_API_KEY
+    global GEMINI_API_KEY, client
     
     logger.info("Starting Vibe Math API")
     
-    # Load and validate environment variables
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    # Validate settings; the upstream client itself is created on first use
+    GEMINI_API_KEY = settings.gemini_api_key
     if not GEMINI_API_KEY:
         logger.error("GEMINI_API_KEY environment variable is not set")
         raise RuntimeError("GEMINI_API_KEY environment variable is required")
     
     logger.info("Environment variables loaded successfully")
     
-    # Initialize OpenAI client
-    try:
-        client = AsyncOpenAI(
-            base_url="https://generativelanguage.googleapis.com/v1beta",
-            api_key=GEMINI_API_KEY
+    # Spawn the SymPy and worksheet workers in the background so startup stays fast
+    symbolic_solver.start()
+    worksheet_segmenter.start()
+    jobs.store.open()
+    jobs.start()
+    
+    # Open upstream connections before reporting healthy
+    if settings.upstream_warmup:
+        await upstream_transport.warm_up(
+            settings.gemini_base_url,
+            connections=settings.upstream_warmup_connections,
+            timeout=settings.upstream_warmup_timeout
         )
-        logger.info("OpenAI client initialized successfully")
-    except Exception as e:
-        logger.error(f"Failed to initialize OpenAI client: {str(e)}")
-        raise RuntimeError(f"Failed to initialize OpenAI client: {str(e)}")
     
     yield
     logger.info("Shutting down Vibe Math API")
+    await jobs.close()
+    symbolic_solver.close()
+    worksheet_segmenter.close()
+    await client_pool.close()
+    if client is not None:
+        await client.close()
+        client = None
+    await upstream_transport.close()
+    answer_cache.close()
 
-# Create FastAPI app
-app = FastAPI(
-    title="Vibe Math API",
-    description="AI-powered math problem solver using Gemini",
-    version="1.0.0",
-    lifespan=lifespan
-)
+# Helper functions
+def image_too_large() -> HTTPException:
+    """Build the 413 error for oversized images"""
+    record_error("image_too_large")
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="Image file too large (max 5MB)"
+    )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def read_upload(file: UploadFile, limit: int = MAX_IMAGE_BYTES) -> bytes:
+    """Read an upload, enforcing the size limit before or while reading"""
+    if file.size is not None:
+        # Size is known up front: reject early, otherwise read in one exact allocation
+        if file.size > limit:
+            raise image_too_large()
+        data = await file.read(limit + 1)
+        if len(data) > limit:
+            raise image_too_large()
+        return data
+    
+    buffer = bytearray()
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(buffer) + len(chunk) > limit:
+            raise image_too_large()
+        buffer += chunk
+    return bytes(buffer)
 
-# Helper functions
-async def process_image(image_data: str) -> str:
-    """Process and validate image data"""
+async def process_image(image_data: str) -> bytes:
+    """Validate base64 image data and return the decoded bytes"""
+    # Reject oversized payloads before decoding anything (slack covers the data URI prefix)
+    if len(image_data) * 3 // 4 > MAX_IMAGE_BYTES + 1024:
+        raise image_too_large()
     try:
-        if image_data.startswith('data:image'):
-            # Handle data URI format
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-        
-        # Validate base64
-        base64.b64decode(image_data)
-        return f"data:image/png;base64,{image_data}"
+        with Timer(decode_seconds, current_endpoint.get()):
+            if image_data.startswith('data:image'):
+                # Handle data URI format
+                comma = image_data.find(',')
+                if comma != -1:
+                    image_data = image_data[comma + 1:]
+            
+            # a2b_base64 reads an ASCII str in place, unlike b64decode which
+            # first copies it into a bytes object
+            return binascii.a2b_base64(image_data)
     except Exception as e:
-        logger.error(f"Invalid image data: {str(e)}")
+        logger.error("Invalid image data: %s", e)
+        record_error("invalid_image")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Invalid image data provided"
         )
 
-async def call_gemini_api_with_key(image_uri: str, api_key: str) -> str:
-    """Make API call to Gemini with custom API key"""
-    try:
-        # Create a new client with the provided API key
-        custom_client = AsyncOpenAI(
-            base_url="https://generativelanguage.googleapis.com/v1beta",
-            api_key=api_key
-        )
-        
-        response = await custom_client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": [
-                    {"type": "image_url", "image_url": {"url": image_uri}},
-                    {"type": "text", "text": "Solve this."}
-                ]}
-            ],
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE
+def build_messages(image_uri: str) -> list:
+    """Build the chat messages for a solve request"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": [
+            {"type": "image_url", "image_url": {"url": image_uri}},
+            {"type": "text", "text": "Solve this."}
+        ]}
+    ]
+
+def build_text_messages(text: str) -> list:
+    """Build the chat messages for a typed problem"""
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Solve this:\n{text}"}
+    ]
+
+def upstream_error(exc: Exception, custom_key: bool = False) -> HTTPException:
+    """Map an exception from the Gemini call path to a client-facing HTTP error"""
+    from openai import APIError, APIConnectionError, RateLimitError
+    
+    if isinstance(exc, HTTPException):
+        return exc
+    if isinstance(exc, CircuitOpenError):
+        logger.error("Circuit breaker open, failing fast")
+        record_error("circuit_open")
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Service temporarily unavailable. Please try again later.",
+            headers={"Retry-After": str(int(exc.retry_after + 0.999))}
         )
-        
-        if not response.choices or not response.choices[0].message.content:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="No response from AI model"
-            )
-            
-        return response.choices[0].message.content.strip()
-        
-    except RateLimitError:
+    if isinstance(exc, (RateLimitError, LocalRateLimitError)):
         logger.error("Rate limit exceeded")
-        raise HTTPException(
+        record_error("rate_limited" if isinstance(exc, RateLimitError) else "local_rate_limited")
+        retry_after = exc.retry_after if isinstance(exc, LocalRateLimitError) else parse_retry_after(exc)
+        return HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Rate limit exceeded. Please try again later."
+            detail="Rate limit exceeded. Please try again later.",
+            headers={"Retry-After": str(int(retry_after + 0.999))} if retry_after else None
         )
-    except APIConnectionError:
+    if isinstance(exc, APIConnectionError):
         logger.error("Connection error to Gemini API")
-        raise HTTPException(
+        record_error("upstream_connection")
+        return HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Service temporarily unavailable. Please try again later."
         )
-    except APIError as e:
-        logger.error(f"API error: {str(e)}")
-        if "API key" in str(e) or "authentication" in str(e).lower():
-            raise HTTPException(
+    if isinstance(exc, APIError):
+        logger.error("API error: %s", exc)
+        if custom_key and ("API key" in str(exc) or "authentication" in str(exc).lower()):
+            record_error("invalid_api_key")
+            return HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid API key provided"
             )
-        raise HTTPException(
+        record_error("upstream_api")
+        return HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error while processing your request"
         )
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+    logger.error("Unexpected error: %s", exc)
+    record_error("unexpected")
+    return HTTPException(
+        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        detail="An unexpected error occurred"
+    )
+
+def extract_answer(response) -> str:
+    """Pull the answer text out of a chat completion and record its token usage"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        record_usage(usage.prompt_tokens, usage.completion_tokens)
+    if not response.choices or not response.choices[0].message.content:
+        record_error("empty_response")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred"
+            detail="No response from AI model"
         )
+    return response.choices[0].message.content.strip()
+
+async def call_gemini_messages(messages: list, api_key: Optional[str] = None) -> str:
+    """Run a chat completion with the shared client or the caller's API key"""
+    try:
+        async with AsyncExitStack() as stack:
+            if api_key is None:
+                api_client = get_client()
+                key_id = "shared"
+            else:
+                # Reuse the pooled client for this API key
+                api_client = await stack.enter_async_context(client_pool.acquire(api_key))
+                key_id = hash_api_key(api_key)
+            
+            async def call_model(model: str) -> str:
+                response = await resilience.call(
+                    key_id,
+                    lambda: hedger.run(
+                        lambda: api_client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            max_tokens=MAX_TOKENS,
+                            temperature=TEMPERATURE
+                        )
+                    )
+                )
+                return extract_answer(response)
+            
+            with Timer(upstream_seconds, current_endpoint.get()):
+                return await cascade.run(call_model)
+    except Exception as e:
+        raise upstream_error(e, custom_key=api_key is not None)
+
+async def call_gemini_api_with_key(image_uri: str, api_key: str) -> str:
+    """Make API call to Gemini with custom API key"""
+    return await call_gemini_messages(build_messages(image_uri), api_key)
 
 async def call_gemini_api(image_uri: str) -> str:
     """Make API call to Gemini using environment API key"""
+    return await call_gemini_messages(build_messages(image_uri))
+
+def image_cache_key(image_bytes: bytes) -> str:
+    """Derive the answer cache key for decoded image bytes"""
+    return make_cache_key(image_bytes, settings.model_cascade, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE)
+
+def text_cache_key(text: str) -> str:
+    """Derive the answer cache key for a typed problem"""
+    # Prefixed so text can never collide with image bytes
+    content = b"text\x00" + " ".join(text.split()).encode("utf-8")
+    return make_cache_key(content, settings.model_cascade, SYSTEM_PROMPT, MAX_TOKENS, TEMPERATURE)
+
+def build_data_uri(data: bytes, mime_type: str) -> str:
+    """Build the base64 data URI for an image in a single pass"""
+    return f"data:{mime_type};base64," + binascii.b2a_base64(data, newline=False).decode("ascii")
+
+def reuse_image_data(image_data: str, image_bytes: bytes, mime_type: str) -> Optional[str]:
+    """Return a data URI built from the client's own base64 text, or None if it can't be reused
+    
+    The client's data URI is returned as is when its prefix matches, and bare
+    base64 only needs the prefix added, so the image is never encoded again.
+    a2b_base64 skips stray characters, so only text of exactly the canonical
+    length is trusted.
+    """
+    prefix = f"data:{mime_type};base64,"
+    body_length = len(image_data)
+    if image_data.startswith(prefix):
+        body_length -= len(prefix)
+    elif image_data.startswith("data:"):
+        return None
+    if body_length != (len(image_bytes) + 2) // 3 * 4:
+        return None
+    return image_data if body_length < len(image_data) else prefix + image_data
+
+async def prepare_image(image_bytes: bytes, image_data: Optional[str] = None) -> str:
+    """Normalize image bytes and build the data URI sent to Gemini
+    
+    `image_data` is the client's base64 text the bytes were decoded from, if
+    any; it is reused when normalization leaves the bytes unchanged.
+    """
     try:
-        response = await client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": [
-                    {"type": "image_url", "image_url": {"url": image_uri}},
-                    {"type": "text", "text": "Solve this."}
-                ]}
-            ],
-            max_tokens=MAX_TOKENS,
-            temperature=TEMPERATURE
-        )
-        
-        if not response.choices or not response.choices[0].message.content:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="No response from AI model"
-            )
-            
-        return response.choices[0].message.content.strip()
-        
-    except RateLimitError:
-        logger.error("Rate limit exceeded")
+        with Timer(normalize_seconds, current_endpoint.get()):
+            normalized = await image_normalizer.normalize(image_bytes)
+    except ValueError as e:
+        logger.error("Image normalization failed: %s", e)
+        record_error("invalid_image")
         raise HTTPException(
-            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Rate limit exceeded. Please try again later."
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid image data provided"
         )
-    except APIConnectionError:
-        logger.error("Connection error to Gemini API")
+    if image_data is not None and normalized.data is image_bytes:
+        image_uri = reuse_image_data(image_data, image_bytes, normalized.mime_type)
+        if image_uri is not None:
+            return image_uri
+    return build_data_uri(normalized.data, normalized.mime_type)
+
+def admission_for(api_key: Optional[str]) -> AdmissionController:
+    """Pick the admission budget for a request"""
+    return shared_admission if api_key is None else byo_admission
+
+async def acquire_upstream_slot(controller: AdmissionController) -> None:
+    """Wait for an upstream slot, shedding load with a 503 when overloaded"""
+    try:
+        await controller.acquire()
+    except AdmissionRejected:
+        record_error("overloaded")
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Service temporarily unavailable. Please try again later."
+            detail="Server is busy. Please try again shortly.",
+            headers={"Retry-After": str(settings.admission_retry_after)}
         )
-    except APIError as e:
-        logger.error(f"API error: {str(e)}")
+
+async def store_answer(cache_key: str, fingerprint: Optional[int], answer: str) -> None:
+    """Remember an answer for exact and near-duplicate repeats"""
+    # Don't pin refusals; a retry may get a usable answer
+    if answer.startswith("Cannot solve"):
+        return
+    await answer_cache.set(cache_key, answer)
+    near_duplicates.add(fingerprint, answer)
+
+async def _solve_uncached(
+    image_bytes: bytes,
+    cache_key: str,
+    fingerprint: Optional[int],
+    api_key: Optional[str],
+    image_data: Optional[str] = None
+) -> str:
+    """Call Gemini and store the answer in the caches"""
+    controller = admission_for(api_key)
+    # Admit before normalizing so shed requests never decode the image
+    await acquire_upstream_slot(controller)
+    try:
+        image_uri = await prepare_image(image_bytes, image_data)
+        if api_key is None:
+            answer = await call_gemini_api(image_uri)
+        else:
+            answer = await call_gemini_api_with_key(image_uri, api_key)
+    finally:
+        controller.release()
+    
+    await store_answer(cache_key, fingerprint, answer)
+    return answer
+
+def validate_image_format(image_bytes: bytes) -> None:
+    """Reject payloads that are not a recognised image format"""
+    if sniff_image_format(image_bytes) is None:
+        record_error("unsupported_image")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Internal server error while processing your request"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported image format"
+        )
+
+async def solve_image(
+    image_bytes: bytes, api_key: Optional[str] = None, image_data: Optional[str] = None
+) -> Solution:
+    """Solve an image, serving repeated and re-photographed images from the caches"""
+    validate_image_format(image_bytes)
+    cache_key = image_cache_key(image_bytes)
+    answer = await answer_cache.get(cache_key)
+    if answer is not None:
+        logger.info("Answer served from cache")
+        return Solution(answer)
+    
+    fingerprint = await near_duplicates.fingerprint(image_bytes)
+    answer = near_duplicates.lookup(fingerprint)
+    if answer is not None:
+        return Solution(answer, near_duplicate=True)
+    
+    # Identical concurrent requests share one upstream call. BYO-key flights
+    # are scoped to the key so one caller's quota or auth error never leaks
+    # into another caller's request.
+    flight_key = cache_key if api_key is None else f"{cache_key}:{hash_api_key(api_key)}"
+    answer = await inflight.do(
+        flight_key, lambda: _solve_uncached(image_bytes, cache_key, fingerprint, api_key, image_data)
+    )
+    return Solution(answer)
+
+async def solve_text_locally(text: str) -> Optional[Solution]:
+    """Try the local symbolic solver, returning None when Gemini is needed"""
+    endpoint = current_endpoint.get()
+    with Timer(local_solve_seconds, endpoint):
+        answer = await symbolic_solver.solve(text)
+    local_solves_total.inc(endpoint, "solved" if answer is not None else "fallback")
+    if answer is None:
+        return None
+    logger.info("Typed problem solved locally")
+    return Solution(answer, solved_locally=True)
+
+async def _solve_text_uncached(text: str, cache_key: str, api_key: Optional[str]) -> str:
+    """Ask Gemini to solve a typed problem and cache the answer"""
+    controller = admission_for(api_key)
+    await acquire_upstream_slot(controller)
+    try:
+        answer = await call_gemini_messages(build_text_messages(text), api_key)
+    finally:
+        controller.release()
+    
+    await store_answer(cache_key, None, answer)
+    return answer
+
+async def solve_text(text: str, api_key: Optional[str] = None) -> Solution:
+    """Solve a typed problem locally when possible, otherwise with Gemini"""
+    solution = await solve_text_locally(text)
+    if solution is not None:
+        return solution
+    
+    cache_key = text_cache_key(text)
+    answer = await answer_cache.get(cache_key)
+    if answer is not None:
+        logger.info("Answer served from cache")
+        return Solution(answer)
+    
+    flight_key = cache_key if api_key is None else f"{cache_key}:{hash_api_key(api_key)}"
+    answer = await inflight.do(
+        flight_key, lambda: _solve_text_uncached(text, cache_key, api_key)
+    )
+    return Solution(answer)
+
+async def solve_payload(payload: ImagePayload, api_key: Optional[str] = None) -> Solution:
+    """Solve a JSON payload: typed text locally first, then the image or text with Gemini"""
+    if payload.image is None:
+        return await solve_text(payload.text, api_key=api_key)
+    if payload.text is not None:
+        solution = await solve_text_locally(payload.text)
+        if solution is not None:
+            return solution
+    image_bytes = await process_image(payload.image)
+    return await solve_image(image_bytes, api_key=api_key, image_data=payload.image)
+
+async def solve_worksheet_problem(
+    tile: Tile, api_key: Optional[str], semaphore: asyncio.Semaphore
+) -> Solution:
+    """Solve one worksheet tile through the regular cached image path"""
+    async with semaphore:
+        return await solve_image(tile.data, api_key=api_key)
+
+async def solve_worksheet(image_bytes: bytes, api_key: Optional[str] = None) -> dict:
+    """Split a worksheet page into problems and solve them concurrently
+    
+    Problems are returned in reading order. A problem that fails gets an
+    error entry instead of failing the page, unless every problem failed.
+    """
+    validate_image_format(image_bytes)
+    with Timer(segment_seconds, current_endpoint.get()):
+        tiles = await worksheet_segmenter.segment(image_bytes)
+    if not tiles:
+        # A single problem, or a layout that could not be split
+        tiles = [Tile(image_bytes, (0.0, 0.0, 1.0, 1.0))]
+    
+    semaphore = asyncio.Semaphore(settings.worksheet_concurrency)
+    tasks = [
+        asyncio.ensure_future(solve_worksheet_problem(tile, api_key, semaphore))
+        for tile in tiles
+    ]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    if all(isinstance(result, Exception) for result in results):
+        raise results[0]
+    
+    problems = []
+    for index, (tile, result) in enumerate(zip(tiles, results)):
+        entry = {"index": index, "box": list(tile.box)}
+        if isinstance(result, HTTPException):
+            entry.update(error=result.detail, status_code=result.status_code)
+        elif isinstance(result, Exception):
+            logger.error("Error solving worksheet problem %s: %s", index, result)
+            entry.update(
+                error="Error processing request",
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        else:
+            entry.update(result.to_dict())
+        problems.append(entry)
+    
+    failed = sum(1 for problem in problems if "error" in problem)
+    logger.info("Solved worksheet with %s problems (%s failed)", len(problems), failed)
+    # Numbered summary for clients that only show the answer text
+    summary = "\n\n".join(
+        f"{problem['index'] + 1}. " + (
+            problem["answer"] if "error" not in problem else f"Error: {problem['error']}"
         )
+        for problem in problems
+    )
+    return {"answer": summary, "problems": problems}
+
+async def solve_payload_worksheet(payload: ImagePayload, api_key: Optional[str] = None) -> dict:
+    """Solve a JSON payload, as a worksheet page when it asks for worksheet mode"""
+    if payload.worksheet:
+        return await solve_worksheet(await process_image(payload.image), api_key=api_key)
+    solution = await solve_payload(payload, api_key=api_key)
+    return solution.to_dict()
+
+async def run_solve_job(
+    image_bytes: Optional[bytes],
+    text: Optional[str],
+    api_key: Optional[str],
+    rid: Optional[str],
+    worksheet: bool = False
+) -> dict:
+    """Solve a queued job, recording client-facing errors on the job"""
+    # Job workers run outside the request; keep the submitting request's labels
+    current_endpoint.set("/jobs")
+    request_id.set(rid)
+    try:
+        if worksheet:
+            return await solve_worksheet(image_bytes, api_key=api_key)
+        if image_bytes is None:
+            solution = await solve_text(text, api_key=api_key)
+        else:
+            solution = None
+            if text is not None:
+                solution = await solve_text_locally(text)
+            if solution is None:
+                solution = await solve_image(image_bytes, api_key=api_key)
+    except HTTPException as e:
+        raise JobFailed(e.detail, e.status_code)
+    return solution.to_dict()
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def stream_gemini_answer(
+    messages: Union[list, Callable[[], Awaitable[list]]],
+    cache_key: str,
+    fingerprint: Optional[int] = None,
+    api_key: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Stream answer tokens from Gemini as server-sent events
+    
+    Emits `token` events as text arrives, then a terminal `done` event with
+    the full answer and token usage, or a terminal `error` event carrying the
+    same status code the non-streaming endpoints would return.
+    
+    The first step only takes an admission slot, builds the messages when given
+    a coroutine function for them, and yields an SSE comment, so callers can
+    prime the generator to surface a 503 or 400 before the response starts.
+    """
+    controller = admission_for(api_key)
+    await acquire_upstream_slot(controller)
+    try:
+        if callable(messages):
+            messages = await messages()
+        yield ": admitted\n\n"
+        async for event in _stream_completion(messages, cache_key, fingerprint, api_key):
+            yield event
+    finally:
+        controller.release()
+
+async def _stream_completion(
+    messages: list, cache_key: str, fingerprint: Optional[int], api_key: Optional[str]
+) -> AsyncIterator[str]:
+    """Run the streaming chat completion and format its events"""
+    chunks = []
+    usage = None
+    try:
+        async with AsyncExitStack() as stack:
+            stack.enter_context(Timer(upstream_seconds, current_endpoint.get()))
+            if api_key is None:
+                api_client = get_client()
+                key_id = "shared"
+            else:
+                api_client = await stack.enter_async_context(client_pool.acquire(api_key))
+                key_id = hash_api_key(api_key)
+            # Only opening the stream is retried; nothing has been sent to the client yet
+            stream = await resilience.call(
+                key_id,
+                lambda: api_client.chat.completions.create(
+                    # No escalation once tokens are sent, so streams use the strongest model
+                    model=cascade.final_model,
+                    messages=messages,
+                    max_tokens=MAX_TOKENS,
+                    temperature=TEMPERATURE,
+                    stream=True,
+                    stream_options={"include_usage": True}
+                )
+            )
+            stack.push_async_callback(stream.close)
+            
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage.model_dump()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    text = chunk.choices[0].delta.content
+                    chunks.append(text)
+                    yield sse_event("token", {"text": text})
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
+        error = upstream_error(e, custom_key=api_key is not None)
+        yield sse_event("error", {"detail": error.detail, "status_code": error.status_code})
+        return
+    
+    if usage is not None:
+        record_usage(usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    answer = "".join(chunks).strip()
+    if not answer:
+        record_error("empty_response")
+        yield sse_event("error", {
+            "detail": "No response from AI model",
+            "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR
+        })
+        return
+    
+    await store_answer(cache_key, fingerprint, answer)
+    logger.info("Successfully streamed answer")
+    yield sse_event("done", {
+        "answer": answer, "usage": usage, "cached": False,
+        "near_duplicate": False, "solved_locally": False,
+        "parsed": parse_answer(answer)._asdict()
+    })
+
+def sse_response(events) -> StreamingResponse:
+    """Wrap SSE events in an unbuffered streaming response"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def replay_solution(solution: Solution, cached: bool) -> StreamingResponse:
+    """Send an already known answer as a single done event"""
+    return sse_response(iter([sse_event("done", {
+        "answer": solution.answer, "usage": None, "cached": cached,
+        "near_duplicate": solution.near_duplicate, "solved_locally": solution.solved_locally,
+        "parsed": parse_answer(solution.answer)._asdict()
+    })]))
+
+async def open_stream(
+    messages: Union[list, Callable[[], Awaitable[list]]],
+    cache_key: str,
+    fingerprint: Optional[int],
+    api_key: Optional[str]
+) -> StreamingResponse:
+    """Start streaming a Gemini answer once an upstream slot is held"""
+    events = stream_gemini_answer(messages, cache_key, fingerprint, api_key)
+    # Run up to admission so an overloaded server still answers with a plain 503
+    await events.__anext__()
+    return sse_response(events)
+
+async def solve_text_stream(text: str, api_key: Optional[str] = None) -> StreamingResponse:
+    """Open an SSE response for a typed problem"""
+    solution = await solve_text_locally(text)
+    if solution is not None:
+        return replay_solution(solution, cached=False)
+    cache_key = text_cache_key(text)
+    answer = await answer_cache.get(cache_key)
+    if answer is not None:
+        logger.info("Answer served from cache")
+        return replay_solution(Solution(answer), cached=True)
+    return await open_stream(build_text_messages(text), cache_key, None, api_key)
+
+async def solve_payload_stream(payload: ImagePayload, api_key: Optional[str] = None) -> StreamingResponse:
+    """Open an SSE response for a JSON payload, trying typed text locally first"""
+    if payload.worksheet:
+        record_error("worksheet_stream")
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="An unexpected error occurred"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Worksheet mode is not available for streaming"
         )
+    if payload.image is None:
+        return await solve_text_stream(payload.text, api_key=api_key)
+    if payload.text is not None:
+        solution = await solve_text_locally(payload.text)
+        if solution is not None:
+            return replay_solution(solution, cached=False)
+    image_bytes = await process_image(payload.image)
+    return await solve_image_stream(image_bytes, api_key=api_key, image_data=payload.image)
+
+async def solve_image_stream(
+    image_bytes: bytes, api_key: Optional[str] = None, image_data: Optional[str] = None
+) -> StreamingResponse:
+    """Open an SSE response for an image, replaying cached answers immediately"""
+    validate_image_format(image_bytes)
+    cache_key = image_cache_key(image_bytes)
+    answer = await answer_cache.get(cache_key)
+    near_duplicate = False
+    fingerprint = None
+    if answer is None:
+        fingerprint = await near_duplicates.fingerprint(image_bytes)
+        answer = near_duplicates.lookup(fingerprint)
+        near_duplicate = answer is not None
+    else:
+        logger.info("Answer served from cache")
+    
+    if answer is not None:
+        return replay_solution(Solution(answer, near_duplicate=near_duplicate), cached=True)
+    
+    async def image_messages() -> list:
+        return build_messages(await prepare_image(image_bytes, image_data))
+    
+    # Normalized once admitted but before the response starts, so shed
+    # requests skip the work and bad images still get a 400
+    return await open_stream(image_messages, cache_key, fingerprint, api_key)
+
+async def solve_batch_item(
+    index: int, image_data: str, api_key: Optional[str], semaphore: asyncio.Semaphore
+) -> dict:
+    """Solve one batch image, returning its answer or error instead of raising"""
+    async with semaphore:
+        try:
+            image_bytes = await process_image(image_data)
+            solution = await solve_image(image_bytes, api_key=api_key, image_data=image_data)
+            return {"index": index, **solution.to_dict()}
+        except HTTPException as e:
+            return {"index": index, "error": e.detail, "status_code": e.status_code}
+        except Exception as e:
+            logger.error("Error processing batch item %s: %s", index, e)
+            return {
+                "index": index,
+                "error": "Error processing request",
+                "status_code": status.HTTP_500_INTERNAL_SERVER_ERROR
+            }
+
+def start_batch(payload: BatchPayload) -> List["asyncio.Task"]:
+    """Schedule every image in a batch under a shared concurrency limit"""
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    return [
+        asyncio.ensure_future(solve_batch_item(i, image, payload.api_key, semaphore))
+        for i, image in enumerate(payload.images)
+    ]
+
+async def stream_batch_results(payload: BatchPayload) -> AsyncIterator[str]:
+    """Solve a batch, yielding NDJSON lines as items complete
+    
+    Tasks are started inside the generator so that a client who disconnects
+    before the first line never leaves solves running without a consumer.
+    """
+    tasks = start_batch(payload)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            yield json.dumps(result) + "\n"
+    finally:
+        # Client went away; don't keep spending quota on its batch
+        for task in tasks:
+            task.cancel()
 
 # Routes
-@app.get("/", tags=["Health"])
+router = APIRouter()
+
+@router.get("/", tags=["Health"])
 async def root():
     """Root endpoint with API information"""
     logger.info("Root endpoint accessed - API is running")
     return {
         "message": "Vibe Math API is running",
         "version": "1.0.0",
-        "endpoints": ["/solve", "/solve-json", "/api/solve-with-key", "/health"]
+        "endpoints": [
+            "/solve", "/solve-json", "/solve-json/stream", "/solve-text",
+            "/api/solve-with-key", "/api/solve-with-key/stream",
+            "/solve-batch", "/solve-batch/stream", "/jobs", "/health", "/metrics"
+        ]
     }
 
-@app.get("/health", tags=["Health"])
+@router.get("/health", tags=["Health"])
 async def health():
     """Health check endpoint"""
     logger.info("Health check endpoint accessed")
@@ -269,7 +1114,7 @@ async def health():
                 elif hasattr(handler, 'stream') and hasattr(handler.stream, 'name'):
                     log_file_info = handler.stream.name
             except Exception as e:
-                logger.warning(f"Could not get log file info: {str(e)}")
+                logger.warning("Could not get log file info: %s", e)
                 log_file_info = "unknown"
         
         logger.info("Health check completed successfully")
@@ -277,10 +1122,26 @@ async def health():
             "status": "healthy",
             "timestamp": log_file_info,
             "client_initialized": client is not None,
-            "api_key_set": GEMINI_API_KEY is not None
+            "api_key_set": GEMINI_API_KEY is not None,
+            "cache": answer_cache.stats(),
+            "near_duplicates": near_duplicates.stats(),
+            "symbolic": symbolic_solver.stats(),
+            "worksheet": worksheet_segmenter.stats(),
+            "jobs": jobs.stats(),
+            "client_pool": client_pool.stats(),
+            "upstream_pool": upstream_transport.stats(),
+            "inflight": inflight.stats(),
+            "images": image_normalizer.stats(),
+            "admission": {
+                "shared_key": shared_admission.stats(),
+                "byo_key": byo_admission.stats()
+            },
+            "upstream": resilience.stats(),
+            "hedging": hedger.stats(),
+            "cascade": cascade.stats()
         }
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.error("Health check failed: %s", e)
         return {
             "status": "degraded",
             "error": str(e),
@@ -288,12 +1149,20 @@ async def health():
             "api_key_set": GEMINI_API_KEY is not None
         }
 
-@app.post("/solve", tags=["Solve"])
-async def solve(file: UploadFile = File(...)):
+@router.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus metrics in the text exposition format"""
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+@router.post("/solve", tags=["Solve"])
+async def solve(file: UploadFile = File(...), worksheet: bool = False):
     """
     Solve math problem from uploaded image
     
     - **file**: Image file (PNG, JPG, JPEG supported)
+    - **worksheet**: split a page of several problems and solve each one separately
     """
     try:
         # Validate file type
@@ -303,33 +1172,31 @@ async def solve(file: UploadFile = File(...)):
                 detail="File must be an image"
             )
         
-        # Read and process image
-        img_bytes = await file.read()
-        if len(img_bytes) > 5 * 1024 * 1024:  # 5MB limit
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail="Image file too large (max 5MB)"
-            )
+        # Read image in chunks, stopping as soon as it exceeds the limit
+        with Timer(decode_seconds, "/solve"):
+            img_bytes = await read_upload(file)
         
-        b64 = base64.b64encode(img_bytes).decode()
-        data_uri = f"data:image/png;base64,{b64}"
+        if worksheet:
+            result = await solve_worksheet(img_bytes)
+            logger.info("Successfully solved worksheet from uploaded image")
+            return result
         
-        # Call Gemini API
-        answer = await call_gemini_api(data_uri)
+        # Call Gemini API (or serve from cache)
+        solution = await solve_image(img_bytes)
         
-        logger.info(f"Successfully solved problem from uploaded image")
-        return {"answer": answer}
+        logger.info("Successfully solved problem from uploaded image")
+        return solution.to_dict()
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing uploaded image: {str(e)}")
+        logger.error("Error processing uploaded image: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error processing image"
         )
 
-@app.post("/solve-json", tags=["Solve"])
+@router.post("/solve-json", tags=["Solve"])
 async def solve_json(payload: ImagePayload):
     """
     Solve math problem from base64 image string
@@ -337,25 +1204,22 @@ async def solve_json(payload: ImagePayload):
     - **payload**: JSON payload with base64 image string
     """
     try:
-        # Process image
-        data_uri = await process_image(payload.image)
-        
-        # Call Gemini API
-        answer = await call_gemini_api(data_uri)
+        # Typed text goes to the local solver first; otherwise call Gemini (or serve from cache)
+        result = await solve_payload_worksheet(payload)
         
-        logger.info(f"Successfully solved problem from JSON payload")
-        return {"answer": answer}
+        logger.info("Successfully solved problem from JSON payload")
+        return result
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing JSON payload: {str(e)}")
+        logger.error("Error processing JSON payload: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error processing request"
         )
 
-@app.post("/api/solve-with-key", tags=["iOS Shortcuts"])
+@router.post("/api/solve-with-key", tags=["iOS Shortcuts"])
 async def solve_with_key(payload: ImagePayloadWithKey):
     """
     Solve math problem from base64 image string with API key authentication
@@ -367,34 +1231,251 @@ async def solve_with_key(payload: ImagePayloadWithKey):
     - **payload**: JSON payload with base64 image string and API key
     """
     try:
-        # Process image
-        data_uri = await process_image(payload.image)
+        # Typed text goes to the local solver first; otherwise call Gemini
+        # with the provided API key (or serve from cache)
+        result = await solve_payload_worksheet(payload, api_key=payload.api_key)
         
-        # Call Gemini API with provided API key
-        answer = await call_gemini_api_with_key(data_uri, payload.api_key)
+        logger.info("Successfully solved problem using custom API key")
+        return result
         
-        logger.info(f"Successfully solved problem using custom API key")
-        return {"answer": answer}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error processing request with key: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing request"
+        )
+
+@router.post("/solve-text", tags=["Solve"])
+async def solve_text_endpoint(payload: TextPayload):
+    """
+    Solve a typed math problem
+    
+    Arithmetic, equations, derivatives and integrals are solved locally with
+    SymPy; anything else is sent to Gemini as text.
+    
+    - **payload**: JSON payload with the problem text and an optional API key
+    """
+    try:
+        solution = await solve_text(payload.text, api_key=payload.api_key)
+        
+        logger.info("Successfully solved typed problem")
+        return solution.to_dict()
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing request with key: {str(e)}")
+        logger.error("Error processing typed problem: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error processing request"
         )
 
+@router.post("/jobs", tags=["Jobs"], status_code=status.HTTP_202_ACCEPTED)
+async def submit_job(payload: JobPayload):
+    """
+    Submit a solve job and return its id immediately
+    
+    The image is checked before the job is queued, so malformed input is
+    rejected here rather than on the status endpoint. Poll
+    `GET /jobs/{id}` for the result.
+    
+    - **payload**: JSON payload with a base64 image and/or problem text and an optional API key
+    """
+    try:
+        image_bytes = None
+        if payload.image is not None:
+            image_bytes = await process_image(payload.image)
+            validate_image_format(image_bytes)
+        
+        text, api_key, rid, worksheet = payload.text, payload.api_key, request_id.get(), payload.worksheet
+        job_id = await jobs.submit(lambda: run_solve_job(image_bytes, text, api_key, rid, worksheet))
+        
+        logger.info("Queued job %s", job_id)
+        return JSONResponse(
+            status_code=status.HTTP_202_ACCEPTED,
+            content={"id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"},
+            headers={"Location": f"/jobs/{job_id}"}
+        )
+        
+    except JobQueueFull:
+        logger.warning("Job queue is full, rejecting job")
+        record_error("jobs_full")
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Job queue is full, please retry shortly",
+            headers={"Retry-After": str(settings.jobs_retry_after)}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error submitting job: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing request"
+        )
+
+@router.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(job_id: str, wait: float = 0):
+    """
+    Get the status and result of a solve job
+    
+    - **job_id**: id returned by `POST /jobs`
+    - **wait**: seconds to hold the request open until the job finishes (long-poll)
+    """
+    try:
+        job = await jobs.get(job_id, wait=min(max(wait, 0.0), settings.jobs_max_wait))
+    except Exception as e:
+        logger.error("Error reading job %s: %s", job_id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing request"
+        )
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or expired"
+        )
+    return job
+
+@router.post("/solve-json/stream", tags=["Solve"])
+async def solve_json_stream(payload: ImagePayload):
+    """
+    Stream the solution for a base64 image string as server-sent events
+    
+    - **payload**: JSON payload with base64 image string
+    """
+    try:
+        return await solve_payload_stream(payload)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error opening stream for JSON payload: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing request"
+        )
+
+@router.post("/api/solve-with-key/stream", tags=["iOS Shortcuts"])
+async def solve_with_key_stream(payload: ImagePayloadWithKey):
+    """
+    Stream the solution for a base64 image string using the caller's API key
+    
+    - **payload**: JSON payload with base64 image string and API key
+    """
+    try:
+        return await solve_payload_stream(payload, api_key=payload.api_key)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Error opening stream with key: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Error processing request"
+        )
+
+@router.post("/solve-batch", tags=["Solve"])
+async def solve_batch(payload: BatchPayload):
+    """
+    Solve several base64 images concurrently
+    
+    Results are returned in input order; a failed image gets an error entry
+    instead of failing the whole batch.
+    
+    - **payload**: JSON payload with a list of base64 images and an optional API key
+    """
+    tasks = start_batch(payload)
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    failed = sum(1 for r in results if "error" in r)
+    logger.info("Solved batch of %s images (%s failed)", len(results), failed)
+    return {"results": results}
+
+@router.post("/solve-batch/stream", tags=["Solve"])
+async def solve_batch_stream(payload: BatchPayload):
+    """
+    Solve several base64 images concurrently, streaming NDJSON results as they complete
+    
+    Each line carries the `index` of the image it belongs to.
+    
+    - **payload**: JSON payload with a list of base64 images and an optional API key
+    """
+    return StreamingResponse(stream_batch_results(payload), media_type="application/x-ndjson")
+
 # Global exception handler
-@app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Handle any unhandled exceptions"""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": "An unexpected error occurred"}
     )
 
+def create_app() -> FastAPI:
+    """
+    Build the FastAPI application
+    
+    Logging is configured here rather than on import. The services behind
+    the routes (caches, client pools, job queue, admission controllers and
+    metrics) are module-level and shared by every app built in the process;
+    they open their SQLite files, worker processes and upstream connections
+    on startup or first use. Run with `uvicorn --factory app.main:create_app`,
+    or `uvicorn app.main:app`, which builds the app on first access.
+    """
+    configure_logging(settings.log_level.upper(), json_format=settings.log_format.lower() == "json")
+    
+    app = FastAPI(
+        title="Vibe Math API",
+        description="AI-powered math problem solver using Gemini",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    
+    # Request ids, log sampling and the access log (inside MetricsMiddleware)
+    app.add_middleware(
+        RequestLogMiddleware,
+        sample_rate=settings.log_sample_rate,
+        health_sample_rate=settings.log_health_sample_rate
+    )
+    
+    # Record per-endpoint latency and in-flight requests
+    app.add_middleware(
+        MetricsMiddleware,
+        request_seconds=request_seconds,
+        in_flight=requests_in_flight
+    )
+    
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    app.include_router(router)
+    app.add_exception_handler(Exception, global_exception_handler)
+    return app
+
+_app: Optional[FastAPI] = None
+
+def __getattr__(name: str):
+    """Build the module-level `app` on first access, so importing stays side-effect free"""
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
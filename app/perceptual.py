@@ -0,0 +1,183 @@
+"""Near-duplicate answer index for Vibe Math API
+
+Re-photographing a problem never reproduces the same bytes, so the exact
+answer cache misses it. Each image gets a difference hash (dHash) computed
+from a tiny grayscale thumbnail, and solved images are kept in a BK-tree
+over Hamming distance so a new photo can be matched against every stored
+one in well under a millisecond.
+
+A perceptual hash cannot tell "3x + 5 = 20" from "3x + 5 = 26" on an
+otherwise identical page, so matches should be treated as a hint; the
+index is disabled unless configured.
+"""
+
+import io
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+def dhash(data: bytes, hash_size: int = 16) -> Optional[int]:
+    """Difference hash of an image as a hash_size**2 bit integer (blocking)
+
+    Returns None if Pillow cannot decode the image.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # JPEG DCT scaling makes the decode itself cheap
+            img.draft("L", (hash_size * 8, hash_size * 8))
+            img = ImageOps.exif_transpose(img)
+            thumb = img.convert("L").resize((hash_size + 1, hash_size), Image.BOX)
+    except (OSError, Image.DecompressionBombError) as e:
+        logger.warning("Could not fingerprint image: %s", e)
+        return None
+
+    pixels = thumb.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """Burkhard-Keller tree over Hamming distance
+
+    Nodes are [hash, {distance: child}] lists. Removal is not supported;
+    callers filter stale hashes and rebuild the tree instead.
+    """
+
+    def __init__(self):
+        self._root: Optional[list] = None
+        self.size = 0
+
+    def add(self, value: int) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [value, {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                self.size -= 1
+                return
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, int]]:
+        """Return (distance, hash) pairs within max_distance, nearest first"""
+        if self._root is None:
+            return []
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                found.append((distance, node[0]))
+            # Triangle inequality: only children in this band can be close enough
+            for edge, child in node[1].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        found.sort()
+        return found
+
+
+class NearDuplicateIndex:
+    """Bounded LRU/TTL map of image fingerprints to answers with BK-tree lookup"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        max_entries: int = 4096,
+        ttl_seconds: float = 86400.0,
+        max_distance: int = 6,
+        hash_size: int = 16,
+    ):
+        self.enabled = enabled and max_entries > 0
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max_distance
+        self.hash_size = hash_size
+
+        self._entries: "OrderedDict[int, Tuple[float, str]]" = OrderedDict()
+        self._tree = BKTree()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def fingerprint(self, data: bytes) -> Optional[int]:
+        """Hash image bytes in the threadpool, or None when disabled"""
+        if not self.enabled:
+            return None
+        return await run_in_threadpool(dhash, data, self.hash_size)
+
+    def lookup(self, fingerprint: Optional[int]) -> Optional[str]:
+        """Return the answer stored for the nearest live fingerprint, if any"""
+        if fingerprint is None:
+            return None
+        now = time.time()
+        for distance, candidate in self._tree.search(fingerprint, self.max_distance):
+            entry = self._entries.get(candidate)
+            if entry is None:
+                continue
+            expires_at, answer = entry
+            if expires_at <= now:
+                del self._entries[candidate]
+                continue
+            self._entries.move_to_end(candidate)
+            self.hits += 1
+            logger.info("Near-duplicate match at Hamming distance %s", distance)
+            return answer
+        self.misses += 1
+        return None
+
+    def add(self, fingerprint: Optional[int], answer: str) -> None:
+        """Store an answer under a fingerprint, evicting the least recently used"""
+        if fingerprint is None:
+            return
+        self._entries[fingerprint] = (time.time() + self.ttl_seconds, answer)
+        self._entries.move_to_end(fingerprint)
+        self._tree.add(fingerprint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        # Evicted hashes linger in the tree; rebuild once they are the majority
+        if self._tree.size > 2 * len(self._entries):
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        tree = BKTree()
+        for fingerprint in self._entries:
+            tree.add(fingerprint)
+        self._tree = tree
+
+    def stats(self) -> dict:
+        """Return match counters for the health endpoint"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "max_distance": self.max_distance,
+        }
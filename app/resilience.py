@@ -0,0 +1,279 @@
+"""Resilience layer for upstream Gemini calls
+
+Wraps each upstream call with:
+
+- a per-key token bucket that paces outgoing calls
+- bounded exponential backoff with full jitter for transient errors,
+  honouring the upstream Retry-After header when present
+- a circuit breaker that fails fast for a cooldown window after
+  consecutive transient failures
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """
+    Classify an upstream error as "rate_limit", "unhealthy" or None
+
+    Rate limits and unhealthy-upstream errors (connection errors, 5xx) are
+    worth retrying; everything else (auth, bad request) fails immediately.
+    Only unhealthy errors count against the shared breaker: a 429 is a
+    quota problem for one key. openai is imported here rather than at module
+    load, since it is slow to import and only needed once a call has failed.
+    """
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    if isinstance(exc, RateLimitError):
+        return "rate_limit"
+    if isinstance(exc, (APIConnectionError, InternalServerError)):
+        return "unhealthy"
+    return None
+
+
+def is_client_error(exc: BaseException) -> bool:
+    """Return whether upstream rejected the request itself (bad key, no access, bad request)
+
+    Such errors would recur on every model, so the cascade does not escalate them.
+    """
+    from openai import AuthenticationError, BadRequestError, PermissionDeniedError
+
+    return isinstance(exc, (AuthenticationError, BadRequestError, PermissionDeniedError))
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is rejecting calls"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Upstream circuit breaker is open")
+        self.retry_after = retry_after
+
+
+class LocalRateLimitError(Exception):
+    """Raised when a key's token bucket has no capacity within the wait limit"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Local rate limit exceeded")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(exc: Exception) -> Optional[float]:
+    """Extract a Retry-After delay in seconds from an upstream error"""
+    response = getattr(exc, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token, returning how long the caller must wait before using it"""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+        return max(wait, self.paused_until - now)
+
+    def refund(self) -> None:
+        """Give back a reserved token that will not be used"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def pause(self, seconds: float) -> None:
+        """Hold all calls for this key, e.g. after an upstream Retry-After"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open after cooldown"""
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+        self.rejected = 0
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed"""
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self.trial_in_flight:
+            # Let exactly one trial call probe the upstream
+            self.trial_in_flight = True
+            return
+        self.rejected += 1
+        remaining = self.cooldown - (time.monotonic() - self.opened_at)
+        raise CircuitOpenError(retry_after=max(remaining, 1.0))
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        tripped = self.opened_at is None and self.failures >= self.failure_threshold
+        if tripped or self.trial_in_flight:
+            self.trips += 1
+            self.opened_at = time.monotonic()
+            logger.warning("Circuit breaker opened after %d consecutive failures", self.failures)
+        self.trial_in_flight = False
+
+    def release_trial(self) -> None:
+        """Free the half-open trial slot when the trial ended without a verdict"""
+        self.trial_in_flight = False
+
+
+class ResilientCaller:
+    """Retries, paces and circuit-breaks upstream calls"""
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_retry_after: float = 10.0,
+        rate_per_second: float = 10.0,
+        burst: float = 20.0,
+        max_rate_wait: float = 2.0,
+        max_buckets: int = 1024,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_rate_wait = max_rate_wait
+        self.max_buckets = max_buckets
+        self.breaker = breaker or CircuitBreaker()
+
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _bucket(self, key_id: str) -> TokenBucket:
+        bucket = self._buckets.get(key_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate_per_second, self.burst)
+            self._buckets[key_id] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        self._buckets.move_to_end(key_id)
+        return bucket
+
+    async def _throttle(self, key_id: str) -> None:
+        bucket = self._bucket(key_id)
+        wait = bucket.reserve()
+        if wait > self.max_rate_wait:
+            bucket.refund()
+            self.rate_limited += 1
+            raise LocalRateLimitError(retry_after=wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given (1-based) attempt"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    async def call(self, key_id: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run fn with pacing, retries and circuit breaking for key_id"""
+        self.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.before_call()
+            try:
+                await self._throttle(key_id)
+                result = await fn()
+            except Exception as e:
+                kind = classify_error(e)
+                if kind is None:
+                    self.breaker.release_trial()
+                    raise
+                if kind == "unhealthy":
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_trial()
+
+                retry_after = parse_retry_after(e)
+                if retry_after is not None and kind == "rate_limit":
+                    self._bucket(key_id).pause(retry_after)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                if attempt == self.max_attempts or delay > self.max_retry_after:
+                    raise
+                self.retries += 1
+                logger.warning(
+                    "Upstream %s on attempt %d, retrying in %.2fs", type(e).__name__, attempt, delay
+                )
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self.breaker.release_trial()
+                raise
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        """Return resilience counters for the health endpoint"""
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "breaker_state": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "breaker_rejected": self.breaker.rejected,
+        }
@@ -0,0 +1,357 @@
+"""Local symbolic solver for typed math problems
+
+Arithmetic, single-variable equations, derivatives and integrals typed as
+text are parsed and solved with SymPy instead of a Gemini round trip.
+Solving runs in a process pool under a per-task CPU time limit, so a
+pathological expression can neither block the event loop nor pin a core.
+Anything the solver does not recognise, or fails to finish in time, falls
+back to Gemini.
+
+Input is restricted to a small character set and a whitelist of function
+names before it reaches SymPy's parser.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import signal
+from concurrent.futures.process import BrokenProcessPool
+from typing import NamedTuple, Optional, Tuple
+
+from app.workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+_FUNCTIONS = {
+    "sqrt", "sin", "cos", "tan", "cot", "sec", "csc", "asin", "acos", "atan",
+    "sinh", "cosh", "tanh", "exp", "log", "ln", "abs", "pi",
+}
+_VERBS = ("simplify", "expand", "factor", "evaluate", "calculate", "compute", "what is")
+
+_REPLACEMENTS = (
+    ("−", "-"), ("–", "-"), ("×", "*"), ("·", "*"), ("÷", "/"),
+    ("²", "^2"), ("³", "^3"), ("√", "sqrt"), ("π", "pi"), ("∫", "integrate "),
+    ("**", "^"),
+)
+_ALLOWED = re.compile(r"^[0-9a-z+\-*/^().,:=\s]*$")
+_WORDS = re.compile(r"[a-z]+")
+
+_DERIVATIVE = re.compile(
+    r"^(?:d/d([a-z])|(?:find the )?derivative of|differentiate)\s*(.+?)"
+    r"(?:\s+with respect to ([a-z]))?$"
+)
+_INTEGRAL = re.compile(r"^(?:integrate|(?:find the )?integral of)\s*(.+)$")
+_BOUNDS = re.compile(r"^(.+?)\s+from\s+(\S+)\s+to\s+(\S+)$")
+_DIFFERENTIAL = re.compile(r"^(.+?)\s*\)?\s*d([a-z])$")
+_SOLVE = re.compile(r"^(?:solve(?:\s+for\s+([a-z]))?\s*:?\s*)?(.+?)(?:,?\s+for\s+([a-z]))?$")
+
+
+class LocalResult(NamedTuple):
+    """Outcome of one local solve attempt"""
+
+    answer: Optional[str]
+    outcome: str  # solved | unsupported | timeout | error
+
+
+class _CPUTimeExceeded(Exception):
+    pass
+
+
+def _raise_cpu_exceeded(signum, frame):
+    raise _CPUTimeExceeded()
+
+
+def normalize_text(text: str) -> str:
+    text = text.strip().lower()
+    for old, new in _REPLACEMENTS:
+        text = text.replace(old, new)
+    return text.rstrip("?.! ")
+
+
+def looks_supported(text: str) -> bool:
+    """Cheap check, run on the event loop, that the text is worth sending to a worker"""
+    if not text or not _ALLOWED.match(text):
+        return False
+    for word in _WORDS.findall(text):
+        if len(word) > 1 and word not in _FUNCTIONS and not _is_keyword(word):
+            return False
+    return True
+
+
+def _is_keyword(word: str) -> bool:
+    keywords = {
+        "solve", "for", "derivative", "of", "differentiate", "with", "respect", "to",
+        "integrate", "integral", "from", "find", "the", "what", "is",
+        "simplify", "expand", "factor", "evaluate", "calculate", "compute",
+    }
+    # Trailing differentials such as "dx" in "integrate x^2 dx"
+    return word in keywords or (len(word) == 2 and word[0] == "d")
+
+
+def _parse(expression: str):
+    from sympy import E, Abs, log
+    from sympy.parsing.sympy_parser import (
+        convert_xor, implicit_multiplication_application, parse_expr, standard_transformations,
+    )
+
+    local_dict = {"e": E, "ln": log, "abs": Abs}
+    transformations = standard_transformations + (implicit_multiplication_application, convert_xor)
+    return parse_expr(expression, local_dict=local_dict, transformations=transformations)
+
+
+def _format(value) -> str:
+    from sympy import sstr
+
+    return re.sub(r"\bI\b", "i", sstr(value).replace("**", "^"))
+
+
+def _pick_variable(expr, requested: Optional[str]):
+    from sympy import Symbol
+
+    if requested:
+        return Symbol(requested)
+    symbols = sorted(expr.free_symbols, key=str)
+    if len(symbols) == 1:
+        return symbols[0]
+    for name in ("x", "t", "y"):
+        if Symbol(name) in expr.free_symbols:
+            return Symbol(name)
+    return None
+
+
+def _solve_derivative(match) -> Optional[Tuple[str, str]]:
+    from sympy import diff
+
+    expr = _parse(match.group(2))
+    var = _pick_variable(expr, match.group(1) or match.group(3))
+    if var is None:
+        return None
+    result = diff(expr, var)
+    return _format(result), f"Differentiating {_format(expr)} with respect to {var} gives {_format(result)}."
+
+
+def _solve_integral(body: str) -> Optional[Tuple[str, str]]:
+    from sympy import Integral, integrate, nsimplify
+
+    bounds = None
+    bounds_match = _BOUNDS.match(body)
+    if bounds_match:
+        body, lower, upper = bounds_match.groups()
+        bounds = (_parse(lower), _parse(upper))
+    requested = None
+    differential = _DIFFERENTIAL.match(body)
+    if differential:
+        body, requested = differential.groups()
+        body = body.lstrip("(")
+
+    expr = _parse(body)
+    var = _pick_variable(expr, requested)
+    if var is None:
+        return None
+    if bounds is None:
+        result = integrate(expr, var)
+        if result.has(Integral):
+            return None
+        answer = f"{_format(result)} + C"
+        return answer, f"The antiderivative of {_format(expr)} with respect to {var} is {answer}."
+
+    result = integrate(expr, (var, *bounds))
+    if result.has(Integral):
+        return None
+    result = nsimplify(result) if result.is_Float else result
+    return _format(result), (
+        f"Integrating {_format(expr)} from {_format(bounds[0])} to {_format(bounds[1])} "
+        f"gives {_format(result)}."
+    )
+
+
+def _solve_equation(equation: str, requested: Optional[str]) -> Optional[Tuple[str, str]]:
+    from sympy import S, expand, solveset
+
+    left, right = equation.split("=")
+    difference = expand(_parse(left) - _parse(right))
+    shown = f"{left.strip()} = {right.strip()}"
+    if difference.is_number:
+        # The variable cancelled out, e.g. 2x = 2x or x = x + 1
+        if difference == 0:
+            return "All values", f"Both sides of {shown} are identical, so every value is a solution."
+        return "No solution", f"The variable cancels from {shown}, leaving a contradiction."
+    var = _pick_variable(difference, requested)
+    if var is None:
+        return None
+    solutions = solveset(difference, var, domain=S.Complexes)
+    if solutions is S.EmptySet:
+        return "No solution", f"The equation {shown} has no solution for {var}."
+    if not solutions.is_FiniteSet:
+        return None
+    values = sorted(solutions, key=lambda v: (not v.is_real, str(v)))
+    answer = " or ".join(f"{var} = {_format(v)}" for v in values)
+    return answer, f"Solving {shown} for {var} gives {answer}."
+
+
+def _solve_expression(body: str, verb: Optional[str]) -> Optional[Tuple[str, str]]:
+    from sympy import expand, factor, nan, simplify
+
+    body = body.strip()
+    expr = _parse(body)
+    if expr.free_symbols:
+        operations = {"simplify": simplify, "expand": expand, "factor": factor}
+        if verb not in operations:
+            # A bare symbolic expression has no single obvious question
+            return None
+        result = operations[verb](expr)
+        return _format(result), f"{verb.capitalize()}ing {body} gives {_format(result)}."
+
+    result = simplify(expr)
+    if not result.is_number or result.is_finite is False or result is nan:
+        # Division by zero and friends; let Gemini explain
+        return None
+    if result.is_Rational or not result.is_real:
+        answer = _format(result)
+    elif not math.isfinite(float(result)):
+        # Too large for a float; the exact form is the only meaningful answer
+        answer = _format(result)
+    elif result.is_Float:
+        answer = f"{float(result):.12g}"
+    else:
+        answer = f"{_format(result)} ≈ {float(result):.8g}"
+    return answer, f"Evaluating {body} gives {answer}."
+
+
+def _solve(text: str) -> Optional[Tuple[str, str]]:
+    match = _DERIVATIVE.match(text)
+    if match:
+        return _solve_derivative(match)
+    match = _INTEGRAL.match(text)
+    if match:
+        return _solve_integral(match.group(1))
+    if "=" in text or text.startswith("solve"):
+        match = _SOLVE.match(text)
+        requested = match.group(1) or match.group(3)
+        equation = match.group(2)
+        if "=" not in equation:
+            equation += " = 0"
+        if equation.count("=") != 1:
+            return None
+        left, right = equation.split("=")
+        if not right.strip():
+            # "2 + 2 =" asks for a value, not an equation
+            return _solve_expression(left, None)
+        return _solve_equation(equation, requested)
+
+    verb = next((v for v in _VERBS if text.startswith(v)), None)
+    body = text[len(verb):].lstrip(" :") if verb else text
+    return _solve_expression(body, verb)
+
+
+def solve_text(text: str, cpu_limit: float = 1.0) -> LocalResult:
+    """Solve a typed problem with SymPy under a CPU time limit (blocking)
+
+    Meant to run in a worker process: the limit is enforced with a
+    profiling interval timer, which only works on the main thread.
+    """
+    text = normalize_text(text)
+    if not looks_supported(text):
+        return LocalResult(None, "unsupported")
+
+    use_timer = hasattr(signal, "setitimer")
+    if use_timer:
+        previous = signal.signal(signal.SIGPROF, _raise_cpu_exceeded)
+        signal.setitimer(signal.ITIMER_PROF, cpu_limit)
+    try:
+        solved = _solve(text)
+    except _CPUTimeExceeded:
+        return LocalResult(None, "timeout")
+    except Exception as e:
+        # Parse errors, unsupported constructs and SymPy internals alike
+        logger.debug("Local solve failed for %r: %s", text, e)
+        return LocalResult(None, "unsupported")
+    finally:
+        if use_timer:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+    if solved is None:
+        return LocalResult(None, "unsupported")
+    answer, explanation = solved
+    return LocalResult(f"Answer: {answer}\nExplanation: {explanation}", "solved")
+
+
+def _warm_up() -> None:
+    """Import the SymPy modules each problem type needs (worker initializer)"""
+    for text in ("1/2 + sqrt(2)", "x^2 - 1 = 0", "d/dx sin(x)", "integrate x e^x dx"):
+        solve_text(text, cpu_limit=30.0)
+
+
+class SymbolicSolver:
+    """Runs solve_text in a process pool and tracks outcomes"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        workers: int = 2,
+        cpu_limit: float = 1.0,
+        max_length: int = 200,
+    ):
+        self.enabled = enabled and workers > 0
+        self.workers = workers
+        self.cpu_limit = cpu_limit
+        self.max_length = max_length
+
+        self._pool = WorkerPool("Symbolic solver", workers, initializer=_warm_up)
+        self.solved = 0
+        self.unsupported = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        """Spawn every worker now so they warm up before the first request"""
+        if self.enabled:
+            self._pool.start()
+
+    async def solve(self, text: str) -> Optional[str]:
+        """Return a formatted answer, or None if Gemini should handle the text"""
+        if not self.enabled or len(text) > self.max_length:
+            return None
+        if not looks_supported(normalize_text(text)):
+            self.unsupported += 1
+            return None
+
+        try:
+            # The worker enforces the CPU limit; the wall-clock bound covers a
+            # cold pool and a queue of other requests ahead of this one
+            result = await asyncio.wait_for(
+                self._pool.run(solve_text, text, self.cpu_limit),
+                timeout=self.cpu_limit * 4 + 10,
+            )
+        except asyncio.TimeoutError:
+            result = LocalResult(None, "timeout")
+        except BrokenProcessPool:
+            result = LocalResult(None, "error")
+
+        if result.outcome == "solved":
+            self.solved += 1
+        elif result.outcome == "timeout":
+            self.timeouts += 1
+            logger.warning("Local solve hit the %ss CPU limit", self.cpu_limit)
+        elif result.outcome == "error":
+            self.errors += 1
+        else:
+            self.unsupported += 1
+        return result.answer
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        self._pool.close()
+
+    def stats(self) -> dict:
+        """Return outcome counters for the health endpoint"""
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "solved": self.solved,
+            "unsupported": self.unsupported,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
@@ -0,0 +1,154 @@
+"""Tuned HTTP transport for upstream calls in Vibe Math API
+
+The shared upstream client sends every request through one httpx.AsyncClient
+built here rather than the SDK's default: HTTP/2 when the `h2` package is
+installed (so concurrent calls multiplex over a few connections), explicit
+pool and keep-alive limits sized for the admission budget, and separate
+connect and read timeouts so a dead host fails fast while a slow model still
+gets time to answer.
+
+Warming up opens connections before the app reports healthy, so the first
+requests after a deploy or scale-out do not pay for DNS and TLS setup.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import time
+from typing import TYPE_CHECKING, Optional
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def http2_available() -> bool:
+    """Return whether httpx can negotiate HTTP/2 (needs the optional h2 package)"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class UpstreamTransport:
+    """Owns the pooled httpx client shared by upstream API clients"""
+
+    def __init__(
+        self,
+        http2: bool = True,
+        max_connections: int = 64,
+        max_keepalive: int = 32,
+        keepalive_expiry: float = 60.0,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 10.0,
+    ):
+        self.http2 = http2
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.pool_timeout = pool_timeout
+
+        self._client: Optional["httpx.AsyncClient"] = None
+        self.http2_enabled = False
+        self.warmed = 0
+        self.warm_up_failed = 0
+        self.warm_up_seconds: Optional[float] = None
+
+    def client(self) -> "httpx.AsyncClient":
+        """Return the shared httpx client, creating it on first use"""
+        if self._client is None or self._client.is_closed:
+            import httpx
+
+            self.http2_enabled = self.http2 and http2_available()
+            if self.http2 and not self.http2_enabled:
+                logger.warning("h2 is not installed, upstream calls will use HTTP/1.1")
+            self._client = httpx.AsyncClient(
+                http2=self.http2_enabled,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(
+                    connect=self.connect_timeout,
+                    read=self.read_timeout,
+                    write=self.write_timeout,
+                    pool=self.pool_timeout,
+                ),
+            )
+        return self._client
+
+    async def warm_up(self, url: str, connections: int = 1, timeout: float = 5.0) -> int:
+        """Open up to `connections` pooled connections to url, returning how many succeeded
+
+        Any HTTP response counts: only the connection matters. Failures are
+        logged and never raised, so an unreachable upstream cannot block
+        startup for longer than `timeout`.
+        """
+        client = self.client()
+        # Over HTTP/2 concurrent requests share one connection
+        count = 1 if self.http2_enabled else max(1, min(connections, self.max_keepalive))
+        started = time.monotonic()
+
+        async def probe() -> bool:
+            try:
+                await client.head(url)
+                return True
+            except Exception as e:
+                logger.warning("Upstream warm-up request failed: %s", e)
+                return False
+
+        tasks = [asyncio.ensure_future(probe()) for _ in range(count)]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        opened = sum(1 for task in done if task.result())
+
+        self.warmed += opened
+        self.warm_up_failed += count - opened
+        self.warm_up_seconds = round(time.monotonic() - started, 3)
+        logger.info(
+            "Warmed %d/%d upstream connection(s) in %.3fs", opened, count, self.warm_up_seconds
+        )
+        return opened
+
+    async def close(self) -> None:
+        """Close the httpx client and its pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _pool(self):
+        # httpx does not expose pool state publicly; read httpcore's pool if present
+        transport = getattr(self._client, "_transport", None)
+        return getattr(transport, "_pool", None)
+
+    def stats(self) -> dict:
+        """Return pool limits and connection counts for the health endpoint"""
+        stats = {
+            "http2": self.http2_enabled,
+            "max_connections": self.max_connections,
+            "max_keepalive": self.max_keepalive,
+            "connections": 0,
+            "idle": 0,
+            "http2_connections": 0,
+            "waiting": 0,
+            "warmed": self.warmed,
+            "warm_up_failed": self.warm_up_failed,
+            "warm_up_seconds": self.warm_up_seconds,
+        }
+        pool = self._pool()
+        if pool is not None:
+            connections = list(getattr(pool, "connections", ()))
+            stats["connections"] = len(connections)
+            stats["idle"] = sum(1 for conn in connections if conn.is_idle())
+            stats["http2_connections"] = sum(
+                1 for conn in connections if conn.info().startswith("HTTP/2")
+            )
+            stats["waiting"] = sum(
+                1 for request in getattr(pool, "_requests", ()) if request.is_queued()
+            )
+        return stats
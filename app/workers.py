@@ -0,0 +1,68 @@
+"""Worker process pools for Vibe Math API
+
+CPU-bound helpers (the symbolic solver, worksheet segmentation) run in their
+own process pools so they never block the event loop or the server's
+threads. WorkerPool owns such a pool: it spawns the workers lazily or up
+front, restarts the pool if a worker dies, and cancels queued work on close.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Any, Callable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """A spawn-context process pool that restarts itself when broken"""
+
+    def __init__(self, name: str, workers: int = 1, initializer: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.workers = workers
+        self.initializer = initializer
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: "Set[Future]" = set()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers never inherit the server's threads or sockets
+            self._pool = ProcessPoolExecutor(
+                self.workers, mp_context=get_context("spawn"), initializer=self.initializer
+            )
+        return self._pool
+
+    def start(self) -> None:
+        """Spawn every worker now so the first task does not wait for them"""
+        pool = self._get_pool()
+        # Workers are spawned on demand; one no-op per worker spawns them all
+        for _ in range(self.workers):
+            pool.submit(int)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) in a worker process
+
+        Raises BrokenProcessPool if a worker died, after discarding the pool
+        so the next call starts a fresh one.
+        """
+        try:
+            future = self._get_pool().submit(fn, *args)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            logger.error("%s pool broke, restarting it", self.name)
+            self._pool = None
+            raise
+
+    def close(self) -> None:
+        """Cancel queued tasks and stop the worker processes"""
+        # Equivalent to shutdown(cancel_futures=True), which needs Python 3.9
+        for future in list(self._pending):
+            future.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
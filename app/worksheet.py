@@ -0,0 +1,250 @@
+"""Worksheet segmentation for Vibe Math API
+
+A photographed worksheet page holds many problems. Sent as one image, a
+single Gemini call has to answer all of them within MAX_TOKENS, so answers
+come back truncated after a long generation. Worksheet mode instead cuts the
+page into problem regions that are solved independently and concurrently.
+
+Regions are found with a recursive XY-cut over ink projection profiles: the
+page is split at blank vertical gutters into columns, each column at blank
+horizontal gaps into problems, and each of those again until no gap is wide
+enough. Regions therefore come back in reading order: columns left to right,
+top to bottom within a column.
+
+Decoding a full-resolution photo and cutting it up is CPU-bound, so it runs
+in a process pool rather than on the event loop or in the server's threads.
+"""
+
+import asyncio
+import io
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, NamedTuple, Tuple
+
+from app.workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# Longest edge of the downscaled copy used to find regions
+ANALYSIS_EDGE = 800
+# A pixel is ink when it is this much darker than its surroundings (0-255)
+INK_CONTRAST = 40
+# Radius of the blur that estimates the paper brightness around each pixel
+BACKGROUND_RADIUS = 12
+# Blank gutter, as a fraction of the page width, that separates columns
+COLUMN_GAP = 0.05
+# Regions with fewer ink pixels than this on the analysis copy are specks, not
+# problems; even "1) 7" has several times as many
+MIN_REGION_INK = 24
+# Longest side, in analysis pixels, of a speck; a low-ink region larger than
+# this may be faint writing, so the page is solved whole rather than lose it
+SPECK_SIZE = 12
+# Margin kept around each region, as a fraction of the page's longer edge
+PADDING = 0.01
+MAX_DEPTH = 6
+
+
+class Tile(NamedTuple):
+    """One problem region cut from a worksheet page"""
+
+    data: bytes
+    # left, top, right, bottom as fractions of the page size
+    box: Tuple[float, float, float, float]
+
+
+def _ink_runs(profile: bytes, min_gap: int) -> List[Tuple[int, int]]:
+    """Return [start, end) spans of ink, joining spans split by fewer than min_gap blank lines"""
+    runs = []
+    start = last = None
+    for i, value in enumerate(profile):
+        if not value:
+            continue
+        if start is None:
+            start = i
+        elif i - last - 1 >= min_gap:
+            runs.append((start, last + 1))
+            start = i
+        last = i
+    if start is not None:
+        runs.append((start, last + 1))
+    return runs
+
+
+def _profile(mask, box: Tuple[int, int, int, int], axis: int) -> bytes:
+    """Mean ink per column (axis 0) or row (axis 1) of a region
+
+    Averaging also drops lines with only a stray pixel or two of ink, so
+    scanner noise does not bridge gaps.
+    """
+    from PIL import Image
+
+    region = mask.crop(box)
+    size = (region.width, 1) if axis == 0 else (1, region.height)
+    return region.resize(size, Image.BOX).tobytes()
+
+
+def _xy_cut(mask, box, gaps: Tuple[int, int], depth: int = 0) -> List[Tuple[int, int, int, int]]:
+    """Recursively split a region at blank gutters, returning leaf boxes in reading order"""
+    for axis in (0, 1):
+        runs = _ink_runs(_profile(mask, box, axis), gaps[axis])
+        if not runs:
+            return []
+        if len(runs) > 1 and depth < MAX_DEPTH:
+            boxes = []
+            for start, end in runs:
+                sub = list(box)
+                sub[axis], sub[axis + 2] = box[axis] + start, box[axis] + end
+                boxes.extend(_xy_cut(mask, tuple(sub), gaps, depth + 1))
+            return boxes
+        # A single span: trim the blank margins on this axis and try the other
+        start, end = runs[0]
+        box = list(box)
+        box[axis], box[axis + 2] = box[axis] + start, box[axis] + end
+        box = tuple(box)
+    return [box]
+
+
+def _ink_mask(gray):
+    """Binary mask of pixels clearly darker than the paper around them"""
+    from PIL import ImageChops, ImageFilter
+
+    # Comparing with a local background copes with shadows and uneven lighting
+    background = gray.filter(ImageFilter.BoxBlur(BACKGROUND_RADIUS))
+    darkness = ImageChops.subtract(background, gray)
+    return darkness.point(lambda value: 255 if value >= INK_CONTRAST else 0)
+
+
+def segment_page(
+    data: bytes, max_problems: int = 20, min_gap: float = 0.02, quality: int = 90
+) -> List[Tile]:
+    """Cut a worksheet page into problem tiles in reading order (blocking)
+
+    Returns an empty list when the page holds a single problem or cannot be
+    split sensibly (no ink, more than max_problems regions, or a faint region
+    that cannot safely be dropped), in which case the page should be solved
+    as a whole. Raises ValueError if the bytes cannot be decoded.
+    """
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            page = ImageOps.exif_transpose(img)
+            page = page.convert("L" if page.mode in ("L", "1", "I;16") else "RGB")
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Could not decode worksheet page: {e}")
+
+    gray = page.convert("L")
+    gray.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.BOX)
+    mask = _ink_mask(gray)
+
+    gaps = (max(1, round(COLUMN_GAP * mask.width)), max(1, round(min_gap * mask.height)))
+    boxes = []
+    for box in _xy_cut(mask, (0, 0, mask.width, mask.height), gaps):
+        if mask.crop(box).histogram()[255] >= MIN_REGION_INK:
+            boxes.append(box)
+        elif max(box[2] - box[0], box[3] - box[1]) > SPECK_SIZE:
+            # Dropping it could silently lose a problem
+            return []
+    if not 2 <= len(boxes) <= max_problems:
+        return []
+
+    scale_x, scale_y = page.width / mask.width, page.height / mask.height
+    pad = round(PADDING * max(page.size))
+    tiles = []
+    for left, top, right, bottom in boxes:
+        crop_box = (
+            max(0, int(left * scale_x) - pad),
+            max(0, int(top * scale_y) - pad),
+            min(page.width, int(right * scale_x + 0.999) + pad),
+            min(page.height, int(bottom * scale_y + 0.999) + pad),
+        )
+        buffer = io.BytesIO()
+        page.crop(crop_box).save(buffer, format="JPEG", quality=quality)
+        tiles.append(Tile(
+            buffer.getvalue(),
+            (
+                round(crop_box[0] / page.width, 4),
+                round(crop_box[1] / page.height, 4),
+                round(crop_box[2] / page.width, 4),
+                round(crop_box[3] / page.height, 4),
+            ),
+        ))
+    return tiles
+
+
+def _warm_up() -> None:
+    """Import the Pillow modules segmentation needs (worker initializer)"""
+    from PIL import Image, ImageChops, ImageFilter, ImageOps  # noqa: F401
+
+
+class WorksheetSegmenter:
+    """Runs segment_page in a process pool and tracks outcomes"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        workers: int = 1,
+        max_problems: int = 20,
+        min_gap: float = 0.02,
+        timeout: float = 15.0,
+    ):
+        self.enabled = enabled and workers > 0
+        self.workers = workers
+        self.max_problems = max_problems
+        self.min_gap = min_gap
+        self.timeout = timeout
+
+        self._pool = WorkerPool("Worksheet segmentation", workers, initializer=_warm_up)
+        self.pages = 0
+        self.split = 0
+        self.problems = 0
+        self.errors = 0
+
+    def start(self) -> None:
+        """Spawn every worker now so the first worksheet does not wait for them"""
+        if self.enabled:
+            self._pool.start()
+
+    async def segment(self, data: bytes) -> List[Tile]:
+        """Return the page's problem tiles, or an empty list to solve it as a whole"""
+        if not self.enabled:
+            return []
+        self.pages += 1
+
+        try:
+            tiles = await asyncio.wait_for(
+                self._pool.run(segment_page, data, self.max_problems, self.min_gap),
+                timeout=self.timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Worksheet segmentation took longer than %ss", self.timeout)
+            self.errors += 1
+            return []
+        except BrokenProcessPool:
+            self.errors += 1
+            return []
+        except ValueError as e:
+            logger.warning("Worksheet segmentation failed: %s", e)
+            self.errors += 1
+            return []
+
+        if tiles:
+            self.split += 1
+            self.problems += len(tiles)
+        logger.info("Worksheet page split into %d problem(s)", len(tiles) or 1)
+        return tiles
+
+    def close(self) -> None:
+        """Stop the worker processes"""
+        self._pool.close()
+
+    def stats(self) -> dict:
+        """Return segmentation counters for the health endpoint"""
+        return {
+            "enabled": self.enabled,
+            "workers": self.workers,
+            "pages": self.pages,
+            "split": self.split,
+            "problems": self.problems,
+            "errors": self.errors,
+        }
@@ -0,0 +1,129 @@
+"""Memory-per-request benchmark for the image ingest path
+
+Measures peak transient Python allocation (via tracemalloc) while turning an
+incoming image into the data URI sent upstream, for the current ingest code
+and for the pre-chunking implementation kept here as a reference. The
+"normalized" scenarios run the full path including image normalization;
+Pillow's decode buffers live outside the Python allocator, so only the
+Python-level copies are counted there.
+
+Usage:
+    python -m benchmarks.ingest_memory [--noise 11]
+"""
+
+import argparse
+import asyncio
+import base64
+import tempfile
+import io
+import tracemalloc
+
+from fastapi import UploadFile
+from PIL import Image
+
+from app.main import build_data_uri, image_normalizer, prepare_image, process_image, read_upload
+
+
+# Reference implementation of the original ingest path
+async def legacy_upload(file: UploadFile) -> str:
+    img_bytes = await file.read()
+    if len(img_bytes) > 5 * 1024 * 1024:
+        raise ValueError("too large")
+    b64 = base64.b64encode(img_bytes).decode()
+    return f"data:image/png;base64,{b64}"
+
+
+async def legacy_json(image_data: str) -> str:
+    if image_data.startswith('data:image'):
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+    base64.b64decode(image_data)
+    return f"data:image/png;base64,{image_data}"
+
+
+# Current ingest path (normalization disabled so only ingest is measured)
+async def current_upload(file: UploadFile) -> str:
+    img_bytes = await read_upload(file)
+    return build_data_uri(img_bytes, "image/jpeg")
+
+
+async def current_json(image_data: str) -> str:
+    img_bytes = await process_image(image_data)
+    enabled, image_normalizer.enabled = image_normalizer.enabled, False
+    try:
+        # Unchanged bytes: the client's data URI is reused as is
+        return await prepare_image(img_bytes, image_data)
+    finally:
+        image_normalizer.enabled = enabled
+
+
+async def normalized_upload(file: UploadFile) -> str:
+    img_bytes = await read_upload(file)
+    return await prepare_image(img_bytes)
+
+
+async def normalized_json(image_data: str) -> str:
+    img_bytes = await process_image(image_data)
+    return await prepare_image(img_bytes, image_data)
+
+
+def make_photo(noise: float) -> bytes:
+    """Encode a 12 MP phone-sized JPEG; more sensor noise means a bigger file"""
+    channel = Image.effect_noise((4032, 3024), noise)
+    img = Image.merge("RGB", (
+        channel, channel.rotate(180), channel.transpose(Image.FLIP_LEFT_RIGHT)
+    ))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_upload(payload: bytes) -> UploadFile:
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(payload)
+    spooled.seek(0)
+    return UploadFile(file=spooled, size=len(payload), headers=None)
+
+
+def measure(coro_factory) -> int:
+    """Return peak bytes allocated while running one request"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    baseline, _ = tracemalloc.get_traced_memory()
+    result = asyncio.run(coro_factory())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak - baseline
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--noise", type=float, default=11.0,
+        help="sensor noise sigma; the default gives a ~4 MB photo"
+    )
+    args = parser.parse_args()
+
+    payload = make_photo(args.noise)
+    b64_payload = "data:image/jpeg;base64," + base64.b64encode(payload).decode()
+
+    scenarios = [
+        ("/solve legacy", lambda: legacy_upload(make_upload(payload))),
+        ("/solve current", lambda: current_upload(make_upload(payload))),
+        ("/solve-json legacy", lambda: legacy_json(b64_payload)),
+        ("/solve-json current", lambda: current_json(b64_payload)),
+        ("/solve normalized", lambda: normalized_upload(make_upload(payload))),
+        ("/solve-json normalized", lambda: normalized_json(b64_payload)),
+    ]
+
+    mb = 1024 * 1024
+    print(f"Image size: {len(payload) / mb:.2f} MB")
+    print(f"{'scenario':<26}{'peak MB':>10}{'x image':>10}")
+    for name, factory in scenarios:
+        peak = measure(factory)
+        print(f"{name:<26}{peak / mb:>10.2f}{peak / len(payload):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
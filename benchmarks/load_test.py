@@ -0,0 +1,232 @@
+"""Offline load test for the solve endpoints
+
+Starts the stub upstream (benchmarks.stub_gemini) and the app under uvicorn,
+points the app at the stub through GEMINI_BASE_URL, then drives /solve,
+/solve-json and /api/solve-with-key with phone-sized photos. Every request
+carries a unique image so the answer cache and request coalescing do not
+hide the upstream path. Reports throughput, p50/p95/p99 latency, status
+codes and app RSS per scenario.
+
+Usage:
+    python -m benchmarks.load_test --requests 200 --concurrency 20 --latency 0.5
+    python -m benchmarks.load_test --rate-limit-rate 0.1 --app-env RETRY_MAX_ATTEMPTS=1
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.ingest_memory import make_photo
+from benchmarks.stub_gemini import add_stub_arguments
+
+SCENARIOS = ("/solve", "/solve-json", "/api/solve-with-key")
+
+# Limits that would otherwise cap throughput well below what we want to measure
+DEFAULT_APP_ENV = {
+    "GEMINI_API_KEY": "stub-key",
+    "KEY_RATE_LIMIT_PER_SECOND": "100000",
+    "KEY_RATE_LIMIT_BURST": "100000",
+    "ADMISSION_MAX_IN_FLIGHT": "1000",
+    "ADMISSION_BYO_MAX_IN_FLIGHT": "1000",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """Resident set size of a process in MB (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as http:
+        while time.monotonic() < deadline:
+            try:
+                if (await http.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready")
+
+
+class ImageFactory:
+    """Produces unique photos cheaply by appending a trailer after the JPEG end marker"""
+
+    def __init__(self, noise: float):
+        photo = make_photo(noise)
+        # Pad to a multiple of 3 so base64(photo + trailer) == base64(photo) + base64(trailer)
+        self.photo = photo + b"\x00" * (-len(photo) % 3)
+        self.photo_b64 = base64.b64encode(self.photo).decode()
+
+    def unique(self):
+        trailer = uuid.uuid4().bytes[:12]
+        return self.photo + trailer, self.photo_b64 + base64.b64encode(trailer).decode()
+
+
+async def run_scenario(
+    base_url: str, endpoint: str, images: ImageFactory, requests: int, concurrency: int, app_pid: int
+) -> Dict:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    peak_rss = [rss_mb(app_pid) or 0.0]
+    queue: "asyncio.Queue[int]" = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as http:
+
+        async def worker():
+            while True:
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                raw, b64 = images.unique()
+                start = time.perf_counter()
+                try:
+                    if endpoint == "/solve":
+                        response = await http.post(endpoint, files={"file": ("photo.jpg", raw, "image/jpeg")})
+                    elif endpoint == "/solve-json":
+                        response = await http.post(endpoint, json={"image": b64})
+                    else:
+                        response = await http.post(endpoint, json={"image": b64, "api_key": "stub-user-key"})
+                    statuses[str(response.status_code)] += 1
+                except httpx.TransportError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - start)
+
+        async def sample_rss():
+            while True:
+                await asyncio.sleep(0.05)
+                peak_rss[0] = max(peak_rss[0], rss_mb(app_pid) or 0.0)
+
+        sampler = asyncio.ensure_future(sample_rss())
+        started = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+
+    latencies.sort()
+    return {
+        "endpoint": endpoint,
+        "requests": requests,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "statuses": dict(statuses),
+        "peak_rss_mb": peak_rss[0],
+    }
+
+
+def print_report(results: List[Dict], image_size: int) -> None:
+    print(f"\nImage size: {image_size / 1024 / 1024:.2f} MB")
+    header = f"{'scenario':<22}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'RSS MB':>9}  statuses"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        statuses = " ".join(f"{code}:{count}" for code, count in sorted(r["statuses"].items()))
+        print(
+            f"{r['endpoint']:<22}{r['throughput_rps']:>8.1f}{r['p50_ms']:>9.0f}"
+            f"{r['p95_ms']:>9.0f}{r['p99_ms']:>9.0f}{r['peak_rss_mb']:>9.1f}  {statuses}"
+        )
+
+
+async def run(args: argparse.Namespace) -> List[Dict]:
+    stub_port, app_port = free_port(), free_port()
+    stub_cmd = [
+        sys.executable, "-m", "benchmarks.stub_gemini", "--port", str(stub_port),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--rate-limit-rate", str(args.rate_limit_rate),
+        "--retry-after", str(args.retry_after),
+    ]
+    app_env = dict(os.environ, **DEFAULT_APP_ENV)
+    app_env["GEMINI_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        app_env[key] = value
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+
+    images = ImageFactory(args.noise)
+    stub = subprocess.Popen(stub_cmd)
+    app = subprocess.Popen(app_cmd, env=app_env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        await wait_ready(f"http://127.0.0.1:{stub_port}/stats")
+        await wait_ready(f"http://127.0.0.1:{app_port}/health")
+        results = []
+        for endpoint in args.scenarios:
+            results.append(await run_scenario(
+                f"http://127.0.0.1:{app_port}", endpoint, images,
+                args.requests, args.concurrency, app.pid,
+            ))
+        print_report(results, len(images.photo))
+        return results
+    finally:
+        for process in (app, stub):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--noise", type=float, default=11.0, help="photo noise; 11 gives ~4 MB")
+    parser.add_argument(
+        "--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS,
+        help="endpoints to drive",
+    )
+    parser.add_argument(
+        "--app-env", action="append", default=[], metavar="KEY=VALUE",
+        help="extra environment for the app process (repeatable)",
+    )
+    parser.add_argument("--json", dest="json_path", help="also write results to this file")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    # Importing the app configures INFO logging; keep per-request client logs quiet
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results = asyncio.run(run(args))
+    if args.json_path:
+        with open(args.json_path, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
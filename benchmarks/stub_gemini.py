@@ -0,0 +1,158 @@
+"""Local stub of the Gemini OpenAI-compatible chat completions API
+
+Serves POST /chat/completions (blocking and streaming) with configurable
+latency, error rate and 429 injection so the request path can be load
+tested offline. Point the app at it with GEMINI_BASE_URL.
+
+Usage:
+    python -m benchmarks.stub_gemini --port 9100 --latency 0.5 --rate-limit-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER = "Answer: 42\nExplanation: Six times seven is forty-two."
+
+
+@dataclass
+class StubConfig:
+    """Behaviour of the stub upstream"""
+
+    latency: float = 0.5
+    jitter: float = 0.1
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    prompt_tokens: int = 258
+    answer: str = ANSWER
+
+
+def create_stub_app(config: StubConfig) -> FastAPI:
+    """Build the stub upstream app"""
+    app = FastAPI(title="Stub Gemini")
+    app.state.requests = 0
+
+    def error_response(status_code: int, message: str, headers=None) -> JSONResponse:
+        return JSONResponse(
+            status_code=status_code,
+            content={"error": {"message": message, "code": status_code}},
+            headers=headers,
+        )
+
+    @app.post("/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            return error_response(
+                429, "Resource has been exhausted",
+                headers={"Retry-After": str(config.retry_after)},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            return error_response(500, "Internal error")
+
+        delay = max(0.0, random.gauss(config.latency, config.jitter))
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        words = config.answer.split(" ")
+        usage = {
+            "prompt_tokens": config.prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": config.prompt_tokens + len(words),
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.answer},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }
+
+        async def events():
+            # Spread the latency over the tokens like a real generation
+            per_token = delay / max(len(words), 1)
+            for i, word in enumerate(words):
+                await asyncio.sleep(per_token)
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": word if i == 0 else " " + word},
+                        "finish_reason": None,
+                    }],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser) -> None:
+    """Register the stub behaviour flags on a parser"""
+    parser.add_argument("--latency", type=float, default=0.5, help="mean upstream latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="latency standard deviation (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of 429 responses")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After sent with 429s (s)")
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_stub_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
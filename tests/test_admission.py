@@ -0,0 +1,66 @@
+"""Tests for upstream admission control"""
+
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController, AdmissionRejected
+
+
+class TestAdmissionController:
+    """Test in-flight limits, queueing and rejection"""
+    
+    async def test_admits_up_to_limit(self):
+        """Test calls under the limit are admitted immediately"""
+        controller = AdmissionController("test", max_in_flight=2, max_queue=0)
+        await controller.acquire()
+        await controller.acquire()
+        assert controller.stats()["in_flight"] == 2
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire()
+        assert controller.stats()["rejected_queue_full"] == 1
+    
+    async def test_queued_call_gets_released_slot(self):
+        """Test a queued call is admitted when a slot frees up"""
+        controller = AdmissionController("test", max_in_flight=1, max_queue=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 1
+        
+        controller.release()
+        await waiter
+        assert controller.stats()["in_flight"] == 1
+        assert controller.queue_depth == 0
+    
+    async def test_queue_timeout(self):
+        """Test queued calls are rejected after the deadline"""
+        controller = AdmissionController("test", max_in_flight=1, max_queue=1, queue_timeout=0.01)
+        await controller.acquire()
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire()
+        assert controller.stats()["rejected_timeout"] == 1
+        assert controller.queue_depth == 0
+        
+        controller.release()
+        assert controller.stats()["in_flight"] == 0
+    
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Test a cancelled waiter does not leak a slot"""
+        controller = AdmissionController("test", max_in_flight=1, max_queue=1)
+        await controller.acquire()
+        waiter = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        
+        controller.release()
+        assert controller.stats()["in_flight"] == 0
+    
+    async def test_slot_context_manager(self):
+        """Test the slot is released when the block exits"""
+        controller = AdmissionController("test", max_in_flight=1)
+        async with controller.slot():
+            assert controller.in_flight == 1
+        assert controller.in_flight == 0
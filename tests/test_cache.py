@@ -0,0 +1,80 @@
+"""Tests for the answer cache"""
+
+import time
+
+from app.cache import AnswerCache, make_cache_key
+
+
+class TestCacheKey:
+    """Test cache key derivation"""
+    
+    def test_same_inputs_same_key(self):
+        """Test identical image and settings produce the same key"""
+        a = make_cache_key(b"img", "model", "prompt", 500, 0.2)
+        b = make_cache_key(b"img", "model", "prompt", 500, 0.2)
+        assert a == b
+    
+    def test_settings_change_key(self):
+        """Test any model setting changes the key"""
+        base = make_cache_key(b"img", "model", "prompt", 500, 0.2)
+        assert make_cache_key(b"img2", "model", "prompt", 500, 0.2) != base
+        assert make_cache_key(b"img", "other", "prompt", 500, 0.2) != base
+        assert make_cache_key(b"img", "model", "other", 500, 0.2) != base
+        assert make_cache_key(b"img", "model", "prompt", 400, 0.2) != base
+        assert make_cache_key(b"img", "model", "prompt", 500, 0.3) != base
+
+
+class TestAnswerCache:
+    """Test memory and disk cache tiers"""
+    
+    async def test_hit_and_miss_counters(self):
+        """Test hits and misses are counted"""
+        cache = AnswerCache(max_entries=4)
+        assert await cache.get("k") is None
+        await cache.set("k", "Answer: 1")
+        assert await cache.get("k") == "Answer: 1"
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+    
+    async def test_lru_eviction(self):
+        """Test least recently used entry is evicted at capacity"""
+        cache = AnswerCache(max_entries=2)
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")
+        await cache.set("c", "3")
+        assert await cache.get("b") is None
+        assert await cache.get("a") == "1"
+        assert cache.stats()["evictions"] == 1
+    
+    async def test_ttl_expiry(self):
+        """Test expired entries are not returned"""
+        cache = AnswerCache(max_entries=2, ttl_seconds=0.01)
+        await cache.set("a", "1")
+        time.sleep(0.02)
+        assert await cache.get("a") is None
+    
+    async def test_disk_tier_survives_restart(self, tmp_path):
+        """Test answers persist in SQLite across cache instances"""
+        db_path = str(tmp_path / "cache.db")
+        cache = AnswerCache(max_entries=2, db_path=db_path)
+        await cache.set("a", "1")
+        cache.close()
+        
+        restarted = AnswerCache(max_entries=2, db_path=db_path)
+        assert await restarted.get("a") == "1"
+        assert restarted.stats()["disk_hits"] == 1
+        restarted.close()
+    
+    async def test_disk_tier_size_cap(self, tmp_path):
+        """Test disk tier keeps only the newest entries"""
+        cache = AnswerCache(max_entries=0, db_path=str(tmp_path / "cache.db"), db_max_entries=2)
+        await cache.set("a", "1")
+        time.sleep(0.01)
+        await cache.set("b", "2")
+        time.sleep(0.01)
+        await cache.set("c", "3")
+        assert await cache.get("a") is None
+        assert await cache.get("c") == "3"
+        cache.close()
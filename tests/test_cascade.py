@@ -0,0 +1,104 @@
+"""Tests for the model cascade and answer parsing"""
+
+import pytest
+
+from app.cascade import ModelCascade, ParsedAnswer, parse_answer
+
+
+class FatalError(Exception):
+    """Stands in for an open circuit breaker"""
+
+
+def make_call(replies):
+    """Build a call returning (or raising) the reply configured for each model"""
+    calls = []
+    
+    async def call(model):
+        calls.append(model)
+        reply = replies[model]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+    
+    return call, calls
+
+
+class TestParseAnswer:
+    """Test splitting replies into structured fields"""
+    
+    @pytest.mark.parametrize("text, parsed", [
+        ("Answer: 42\nExplanation: Six times seven.", ParsedAnswer("42", "Six times seven.")),
+        ("**Answer:** x = 2\n**Explanation:** Divide by 3.", ParsedAnswer("x = 2", "Divide by 3.")),
+        ("Answer: 4. Explanation: Two plus two.", ParsedAnswer("4", "Two plus two.")),
+        ("Answer: 4.5 Explanation: Nine halves.", ParsedAnswer("4.5", "Nine halves.")),
+        ("answer: 7", ParsedAnswer()),
+        ("Answer: 7\nExplanation:", ParsedAnswer()),
+        ("Cannot solve: the image is blurry", ParsedAnswer(cannot_solve="the image is blurry")),
+        ("The answer is probably 42.", ParsedAnswer()),
+        ("Answer:", ParsedAnswer()),
+    ])
+    def test_parse(self, text, parsed):
+        """Test well-formed, decorated, refused and malformed replies"""
+        assert parse_answer(text) == parsed
+
+
+class TestModelCascade:
+    """Test escalation between model tiers"""
+    
+    async def test_first_tier_answers(self):
+        """Test a good cheap reply is returned without calling the next tier"""
+        call, calls = make_call({"lite": "Answer: 4\nExplanation: Done.", "pro": "Answer: 4\nExplanation: Done."})
+        cascade = ModelCascade(["lite", "pro"])
+        assert await cascade.run(call) == "Answer: 4\nExplanation: Done."
+        assert calls == ["lite"]
+        assert cascade.stats()["tiers"][0]["hit_rate"] == 1.0
+    
+    @pytest.mark.parametrize("reply", [
+        "Cannot solve: too hard",
+        "I think it is 4",
+        "Answer: 4",
+        RuntimeError("upstream failed"),
+    ])
+    async def test_escalates(self, reply):
+        """Test refusals, malformed replies and errors go to the next tier"""
+        call, calls = make_call({"lite": reply, "pro": "Answer: 5\nExplanation: Done."})
+        results = []
+        cascade = ModelCascade(["lite", "pro"], on_result=lambda *args: results.append(args[:2]))
+        
+        assert await cascade.run(call) == "Answer: 5\nExplanation: Done."
+        assert calls == ["lite", "pro"]
+        assert results[1] == ("pro", "answered")
+        assert cascade.stats()["escalations"] == 1
+    
+    async def test_last_tier_reply_is_final(self):
+        """Test the strongest model's reply is returned even when it cannot solve"""
+        call, _ = make_call({"lite": "Cannot solve: no", "pro": "Cannot solve: still no"})
+        cascade = ModelCascade(["lite", "pro"])
+        assert await cascade.run(call) == "Cannot solve: still no"
+        
+        tiers = cascade.stats()["tiers"]
+        assert tiers[1]["cannot_solve"] == 1
+        assert tiers[1]["hit_rate"] == 0.0
+    
+    async def test_fatal_errors_do_not_escalate(self):
+        """Test errors that would recur on every tier are raised immediately"""
+        call, calls = make_call({"lite": FatalError(), "pro": "Answer: 1\nExplanation: Done."})
+        cascade = ModelCascade(["lite", "pro"], fatal_errors=(FatalError,))
+        with pytest.raises(FatalError):
+            await cascade.run(call)
+        assert calls == ["lite"]
+    
+    async def test_is_fatal_predicate_stops_escalation(self):
+        """Test errors matched by the is_fatal predicate are raised immediately"""
+        call, calls = make_call({"lite": ValueError("bad key"), "pro": "Answer: 1\nExplanation: Done."})
+        cascade = ModelCascade(["lite", "pro"], is_fatal=lambda e: isinstance(e, ValueError))
+        with pytest.raises(ValueError):
+            await cascade.run(call)
+        assert calls == ["lite"]
+        assert cascade.stats()["escalations"] == 0
+    
+    async def test_last_tier_error_is_raised(self):
+        """Test an error from the final tier reaches the caller"""
+        call, _ = make_call({"only": RuntimeError("down")})
+        with pytest.raises(RuntimeError):
+            await ModelCascade(["only"]).run(call)
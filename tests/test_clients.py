@@ -0,0 +1,70 @@
+"""Tests for the bring-your-own-key client pool"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+from app.clients import ClientPool, hash_api_key
+
+
+def make_pool(**kwargs):
+    """Build a pool whose factory returns mock clients"""
+    factory = MagicMock(side_effect=lambda key: MagicMock(close=AsyncMock(), key=key))
+    return ClientPool(factory=factory, **kwargs), factory
+
+
+class TestClientPool:
+    """Test client reuse, eviction and shutdown"""
+    
+    async def test_reuses_client_per_key(self):
+        """Test the same key gets the same client"""
+        pool, factory = make_pool()
+        async with pool.acquire("key-a") as first:
+            pass
+        async with pool.acquire("key-a") as second:
+            pass
+        assert first is second
+        assert factory.call_count == 1
+        assert pool.stats()["reused"] == 1
+    
+    async def test_raw_key_not_stored(self):
+        """Test pool entries are keyed by hash, never by raw key"""
+        pool, _ = make_pool()
+        async with pool.acquire("secret-key"):
+            pass
+        assert "secret-key" not in pool._clients
+        assert hash_api_key("secret-key") in pool._clients
+    
+    async def test_lru_eviction_closes_client(self):
+        """Test the least recently used client is evicted and closed"""
+        pool, _ = make_pool(max_clients=1)
+        async with pool.acquire("key-a") as first:
+            pass
+        async with pool.acquire("key-b"):
+            pass
+        first.close.assert_awaited_once()
+        assert pool.stats()["evicted"] == 1
+    
+    async def test_evicted_client_closed_after_lease(self):
+        """Test a client in use is only closed when released"""
+        pool, _ = make_pool(max_clients=1)
+        async with pool.acquire("key-a") as first:
+            async with pool.acquire("key-b"):
+                first.close.assert_not_awaited()
+        first.close.assert_awaited_once()
+    
+    async def test_idle_timeout(self):
+        """Test idle clients are dropped on the next acquire"""
+        pool, _ = make_pool(idle_timeout=0)
+        async with pool.acquire("key-a") as first:
+            pass
+        async with pool.acquire("key-b"):
+            pass
+        first.close.assert_awaited_once()
+    
+    async def test_close_drains_pool(self):
+        """Test shutdown closes every pooled client"""
+        pool, _ = make_pool()
+        async with pool.acquire("key-a") as first:
+            pass
+        await pool.close()
+        first.close.assert_awaited_once()
+        assert pool.stats()["size"] == 0
@@ -0,0 +1,38 @@
+"""Tests for the settings loader"""
+
+import os
+import tempfile
+
+from app.config import Settings
+
+
+class TestSettings:
+    """Test parsing settings from the environment"""
+    
+    def test_defaults(self):
+        """Test an empty environment gives the documented defaults"""
+        settings = Settings.from_env({})
+        assert settings.gemini_api_key is None
+        assert settings.cache_max_entries == 1024
+        assert settings.symbolic_enabled is True
+        assert settings.near_dup_ttl_seconds is None
+        assert os.path.dirname(settings.jobs_db_path) == tempfile.gettempdir()
+    
+    def test_parses_by_annotation(self):
+        """Test values are converted to each field's type"""
+        settings = Settings.from_env({
+            "GEMINI_API_KEY": "key",
+            "NEAR_DUP_ENABLED": "Yes",
+            "SYMBOLIC_ENABLED": "0",
+            "IMAGE_MAX_EDGE": "1024",
+            "BREAKER_COOLDOWN": "2.5",
+            "NEAR_DUP_TTL_SECONDS": "60",
+            "CACHE_DB_PATH": "/tmp/cache.db",
+        })
+        assert settings.gemini_api_key == "key"
+        assert settings.near_dup_enabled is True
+        assert settings.symbolic_enabled is False
+        assert settings.image_max_edge == 1024
+        assert settings.breaker_cooldown == 2.5
+        assert settings.near_dup_ttl_seconds == 60.0
+        assert settings.cache_db_path == "/tmp/cache.db"
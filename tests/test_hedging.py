@@ -0,0 +1,99 @@
+"""Tests for hedged upstream requests"""
+
+import asyncio
+
+import pytest
+
+from app.hedging import MIN_SAMPLES, Hedger
+
+
+def make_call(latencies, results=None):
+    """Build a call whose nth invocation sleeps latencies[n] and returns n (or raises results[n])"""
+    state = {"calls": 0, "cancelled": 0}
+    
+    async def call():
+        n = state["calls"]
+        state["calls"] += 1
+        try:
+            await asyncio.sleep(latencies[n])
+        except asyncio.CancelledError:
+            state["cancelled"] += 1
+            raise
+        if results and isinstance(results[n], Exception):
+            raise results[n]
+        return n
+    
+    return call, state
+
+
+class TestHedger:
+    """Test when backup calls are fired and which result wins"""
+    
+    async def test_disabled_passes_through(self):
+        """Test a disabled hedger never sends a second call"""
+        call, state = make_call([0.05])
+        hedger = Hedger(enabled=False, delay=0.01, max_ratio=1)
+        assert await hedger.run(call) == 0
+        assert state["calls"] == 1
+    
+    async def test_fast_call_is_not_hedged(self):
+        """Test calls that finish within the delay are left alone"""
+        call, state = make_call([0])
+        hedger = Hedger(enabled=True, delay=0.5, max_ratio=1)
+        assert await hedger.run(call) == 0
+        assert state["calls"] == 1
+        assert hedger.stats()["fired"] == 0
+    
+    async def test_hedge_wins_and_primary_is_cancelled(self):
+        """Test a slow call is raced by a backup and the loser is cancelled"""
+        call, state = make_call([5, 0])
+        events = []
+        hedger = Hedger(enabled=True, delay=0.01, max_ratio=1, on_hedge=events.append)
+        
+        assert await hedger.run(call) == 1
+        await asyncio.sleep(0)
+        assert state["cancelled"] == 1
+        assert events == ["fired", "won"]
+        assert hedger.stats()["won"] == 1
+    
+    async def test_primary_can_still_win(self):
+        """Test the original call wins when it finishes before the backup"""
+        call, state = make_call([0.05, 5])
+        hedger = Hedger(enabled=True, delay=0.01, max_ratio=1)
+        
+        assert await hedger.run(call) == 0
+        assert hedger.stats()["fired"] == 1
+        assert hedger.stats()["won"] == 0
+    
+    async def test_failed_call_falls_back_to_other(self):
+        """Test an error from one call does not fail the hedged request"""
+        call, _ = make_call([0.05, 0.1], [RuntimeError("boom"), None])
+        hedger = Hedger(enabled=True, delay=0.01, max_ratio=1)
+        assert await hedger.run(call) == 1
+    
+    async def test_both_failing_raises_primary_error(self):
+        """Test the original error is raised when every call fails"""
+        call, _ = make_call([0.05, 0], [ValueError("first"), RuntimeError("second")])
+        hedger = Hedger(enabled=True, delay=0.01, max_ratio=1)
+        with pytest.raises(ValueError):
+            await hedger.run(call)
+    
+    async def test_budget_caps_hedged_fraction(self):
+        """Test at most max_ratio of calls (plus the burst) are hedged"""
+        hedger = Hedger(enabled=True, delay=0, max_ratio=0.25, burst=1)
+        for _ in range(20):
+            call, _ = make_call([0.01, 0.01])
+            await hedger.run(call)
+        
+        stats = hedger.stats()
+        assert stats["fired"] == 5
+        assert stats["skipped_budget"] == 15
+    
+    async def test_percentile_delay(self):
+        """Test the delay tracks observed latencies once enough are recorded"""
+        hedger = Hedger(enabled=True, delay=9, percentile=50)
+        assert hedger.current_delay() == 9
+        for _ in range(MIN_SAMPLES):
+            call, _ = make_call([0])
+            await hedger.run(call)
+        assert hedger.current_delay() < 0.1
@@ -0,0 +1,129 @@
+"""Tests for image normalization"""
+
+import io
+
+import pytest
+from PIL import Image
+
+from app.imaging import ImageNormalizer, normalize_image, sniff_image_format
+
+
+def make_image(fmt="JPEG", size=(3000, 2000), mode="RGB", **save_kwargs):
+    """Encode a synthetic image in the given format"""
+    img = Image.new(mode, size)
+    # Add detail so the encoder cannot collapse the image to nothing
+    for x in range(0, size[0], 50):
+        for y in range(size[1]):
+            img.putpixel((x, y), (255, 255, 255) if mode == "RGB" else (255, 255, 255, 255))
+    buffer = io.BytesIO()
+    img.save(buffer, format=fmt, **save_kwargs)
+    return buffer.getvalue()
+
+
+def make_compact_jpeg(**save_kwargs):
+    """Encode a noisy low-quality JPEG that re-encoding cannot shrink"""
+    img = Image.effect_noise((800, 600), 60).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=40, **save_kwargs)
+    return buffer.getvalue()
+
+
+class TestSniffImageFormat:
+    """Test magic-byte format detection"""
+    
+    def test_common_formats(self):
+        """Test PNG, JPEG and WebP are recognised"""
+        assert sniff_image_format(make_image("PNG", (4, 4))) == "image/png"
+        assert sniff_image_format(make_image("JPEG", (4, 4))) == "image/jpeg"
+        assert sniff_image_format(make_image("WEBP", (4, 4))) == "image/webp"
+    
+    def test_heic(self):
+        """Test HEIC container brands are recognised"""
+        assert sniff_image_format(b"\x00\x00\x00\x18ftypheic\x00\x00\x00\x00") == "image/heic"
+    
+    def test_unknown(self):
+        """Test non-image bytes are rejected"""
+        assert sniff_image_format(b"not an image") is None
+
+
+class TestNormalizeImage:
+    """Test downscaling, metadata stripping and re-encoding"""
+    
+    def test_downscales_to_max_edge(self):
+        """Test large photos are shrunk to the configured edge"""
+        result = normalize_image(make_image(quality=95), max_edge=800)
+        assert result.mime_type == "image/jpeg"
+        assert result.bytes_saved > 0
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert max(img.size) == 800
+    
+    def test_strips_exif(self):
+        """Test EXIF metadata is removed"""
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        result = normalize_image(make_image(exif=exif.tobytes()), max_edge=800)
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert not img.getexif()
+    
+    def test_strips_exif_from_compact_jpeg(self):
+        """Test a small JPEG is re-encoded rather than passed through with its metadata"""
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        exif[0x0110] = "PhoneModel"
+        exif.get_ifd(0x8825)[2] = (51.0, 30.0, 0.0)
+        original = make_compact_jpeg(exif=exif.tobytes())
+        result = normalize_image(original, max_edge=1600)
+        assert result.data is not original
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert not img.getexif()
+    
+    def test_grayscale_compact_image(self):
+        """Test grayscale is applied even when re-encoding does not shrink the image"""
+        result = normalize_image(make_compact_jpeg(), max_edge=1600, grayscale=True)
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert img.mode == "L"
+    
+    def test_compact_clean_image_passed_through(self):
+        """Test a small image without metadata keeps its original bytes"""
+        original = make_compact_jpeg()
+        assert normalize_image(original, max_edge=1600).data is original
+    
+    def test_grayscale(self):
+        """Test optional grayscale conversion"""
+        result = normalize_image(make_image("PNG"), max_edge=800, grayscale=True)
+        with Image.open(io.BytesIO(result.data)) as img:
+            assert img.mode == "L"
+    
+    def test_webp_output(self):
+        """Test WebP re-encoding"""
+        result = normalize_image(make_image("PNG"), max_edge=800, output_format="WEBP")
+        assert result.mime_type == "image/webp"
+    
+    def test_transparent_png_flattened(self):
+        """Test transparent screenshots are flattened for JPEG output"""
+        result = normalize_image(make_image("PNG", mode="RGBA"), max_edge=800)
+        assert result.mime_type == "image/jpeg"
+    
+    def test_rejects_unknown_format(self):
+        """Test non-image payloads raise ValueError"""
+        with pytest.raises(ValueError):
+            normalize_image(b"not an image")
+    
+    def test_undecodable_passthrough(self):
+        """Test recognised but undecodable formats are uploaded as-is"""
+        heic = b"\x00\x00\x00\x18ftypheic" + b"\x00" * 64
+        result = normalize_image(heic)
+        assert result.data == heic
+        assert result.mime_type == "image/heic"
+
+
+class TestImageNormalizer:
+    """Test the async wrapper and its counters"""
+    
+    async def test_reports_bytes_saved(self):
+        """Test bytes saved are accumulated"""
+        normalizer = ImageNormalizer(max_edge=800)
+        await normalizer.normalize(make_image(quality=95))
+        stats = normalizer.stats()
+        assert stats["images"] == 1
+        assert stats["bytes_saved"] > 0
@@ -0,0 +1,161 @@
+"""Tests for the asynchronous job queue and store"""
+
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from app.jobs import JobFailed, JobManager, JobQueueFull, JobStore
+
+
+@pytest.fixture
+async def manager(tmp_path):
+    """Job manager with two workers backed by a temporary database"""
+    manager = JobManager(JobStore(str(tmp_path / "jobs.db")), workers=2, max_queue=4)
+    manager.start()
+    yield manager
+    await manager.close()
+
+
+class TestJobManager:
+    """Test queueing, running and polling jobs"""
+    
+    async def test_long_poll_returns_result(self, manager):
+        """Test a waiting poll returns as soon as the job is done"""
+        async def job():
+            await asyncio.sleep(0.05)
+            return {"answer": "Answer: 4"}
+        
+        job_id = await manager.submit(job)
+        assert (await manager.get(job_id))["status"] in ("queued", "running")
+        
+        record = await manager.get(job_id, wait=5)
+        assert record["status"] == "done"
+        assert record["result"] == {"answer": "Answer: 4"}
+        assert record["error"] is None
+        assert manager.stats()["succeeded"] == 1
+    
+    async def test_failures_are_recorded(self, manager):
+        """Test JobFailed keeps its status and other errors become a generic 500"""
+        async def rejected():
+            raise JobFailed("Invalid image data provided", 400)
+        
+        async def broken():
+            raise RuntimeError("boom")
+        
+        first = await manager.submit(rejected)
+        second = await manager.submit(broken)
+        
+        assert (await manager.get(first, wait=5))["error"] == {
+            "detail": "Invalid image data provided", "status_code": 400
+        }
+        assert (await manager.get(second, wait=5))["error"] == {
+            "detail": "Error processing request", "status_code": 500
+        }
+        assert manager.stats()["failed"] == 2
+    
+    async def test_full_queue_rejects(self, tmp_path):
+        """Test submits beyond the queue bound raise JobQueueFull"""
+        release = asyncio.Event()
+        
+        async def blocked():
+            await release.wait()
+            return {}
+        
+        manager = JobManager(JobStore(str(tmp_path / "jobs.db")), workers=1, max_queue=1)
+        manager.start()
+        try:
+            await manager.submit(blocked)
+            await asyncio.sleep(0)
+            await manager.submit(blocked)
+            with pytest.raises(JobQueueFull):
+                await manager.submit(blocked)
+            assert manager.stats()["rejected"] == 1
+        finally:
+            release.set()
+            await manager.close()
+    
+    async def test_queued_jobs_are_not_stale(self, tmp_path):
+        """Test a job waiting behind a slow one is never reported as interrupted"""
+        path = str(tmp_path / "jobs.db")
+        manager = JobManager(JobStore(path, stale_seconds=0.2), workers=1, max_queue=4)
+        manager.start()
+        release = asyncio.Event()
+        
+        async def slow():
+            await release.wait()
+            return {"answer": "Answer: 1"}
+        
+        try:
+            await manager.submit(slow)
+            waiting = await manager.submit(slow)
+            await asyncio.sleep(0.5)
+            
+            assert (await manager.get(waiting))["status"] == "queued"
+            # Other processes sharing the file see the heartbeat
+            assert JobStore(path, stale_seconds=0.2).get(waiting)["status"] == "queued"
+            
+            release.set()
+            assert (await manager.get(waiting, wait=5))["status"] == "done"
+        finally:
+            await manager.close()
+    
+    async def test_unknown_job(self, manager):
+        """Test an unknown id returns None without waiting"""
+        assert await manager.get("missing", wait=5) is None
+
+
+class TestJobStore:
+    """Test persistence, expiry and interrupted jobs"""
+    
+    def test_results_survive_reopen(self, tmp_path):
+        """Test another store on the same file sees the result"""
+        path = str(tmp_path / "jobs.db")
+        store = JobStore(path)
+        store.create("abc")
+        store.update("abc", "done", {"answer": "Answer: 1"})
+        store.close()
+        
+        record = JobStore(path).get("abc")
+        assert record["status"] == "done"
+        assert record["result"] == {"answer": "Answer: 1"}
+    
+    def test_unusable_path_fails_on_open(self, tmp_path):
+        """Test a database that cannot be created is reported by open()"""
+        store = JobStore(str(tmp_path / "missing" / "jobs.db"))
+        with pytest.raises(sqlite3.OperationalError):
+            store.open()
+    
+    def test_expired_jobs_are_gone(self, tmp_path):
+        """Test records past their TTL are not returned"""
+        store = JobStore(str(tmp_path / "jobs.db"), ttl_seconds=-1)
+        store.create("abc")
+        assert store.get("abc") is None
+    
+    def test_stale_jobs_are_interrupted(self, tmp_path):
+        """Test a job left running by a dead process is reported as failed"""
+        store = JobStore(str(tmp_path / "jobs.db"), stale_seconds=60)
+        store.create("abc")
+        store.update("abc", "running")
+        store._connect().execute("UPDATE jobs SET updated_at = ?", (time.time() - 120,))
+        
+        record = store.get("abc")
+        assert record["status"] == "failed"
+        assert record["error"] == {"detail": "Job was interrupted", "status_code": 500}
+    
+    async def test_polls_jobs_owned_elsewhere(self, tmp_path):
+        """Test a long-poll on another process's job watches the database"""
+        path = str(tmp_path / "jobs.db")
+        owner = JobStore(path)
+        owner.create("abc")
+        manager = JobManager(JobStore(path), poll_interval=0.01)
+        
+        async def finish():
+            await asyncio.sleep(0.05)
+            owner.update("abc", "done", {"answer": "Answer: 2"})
+        
+        task = asyncio.ensure_future(finish())
+        record = await manager.get("abc", wait=5)
+        await task
+        assert record["status"] == "done"
@@ -0,0 +1,84 @@
+"""Tests for request ids, log sampling and the access log"""
+
+import logging
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.logs import RequestContextFilter, RequestLogMiddleware, _QueueHandler, request_id
+from app.metrics import Histogram, Timer
+
+decode_seconds = Histogram("vibe_math_image_decode_duration_seconds", "Decode time")
+
+
+def make_app(**options):
+    """Tiny app behind the logging middleware that records what its handler saw"""
+    seen = {}
+    app = FastAPI()
+    app.add_middleware(RequestLogMiddleware, **options)
+    
+    @app.get("/work")
+    async def work():
+        with Timer(decode_seconds):
+            pass
+        seen["request_id"] = request_id.get()
+        seen["info_kept"] = RequestContextFilter().filter(
+            logging.LogRecord("app", logging.INFO, __file__, 1, "done", None, None)
+        )
+        seen["error_kept"] = RequestContextFilter().filter(
+            logging.LogRecord("app", logging.ERROR, __file__, 1, "failed", None, None)
+        )
+        return {}
+    
+    return TestClient(app), seen
+
+
+class TestRequestLogMiddleware:
+    """Test per-request context and the structured access log"""
+    
+    def test_generates_and_returns_request_id(self):
+        """Test each request gets an id visible to helpers and in the response"""
+        client, seen = make_app()
+        response = client.get("/work")
+        assert response.headers["x-request-id"] == seen["request_id"]
+        assert len(seen["request_id"]) == 32
+    
+    def test_propagates_incoming_request_id(self):
+        """Test a valid X-Request-ID from the caller is reused, an unsafe one replaced"""
+        client, seen = make_app()
+        assert client.get("/work", headers={"X-Request-ID": "trace-42"}).headers["x-request-id"] == "trace-42"
+        client.get("/work", headers={"X-Request-ID": "bad id\n"})
+        assert seen["request_id"] != "bad id\n"
+    
+    def test_access_log_has_stage_timings(self, caplog):
+        """Test one access log per request carries status, duration and stages"""
+        client, _ = make_app()
+        with caplog.at_level(logging.INFO, logger="app.logs"):
+            client.get("/work")
+        
+        record = next(r for r in caplog.records if r.name == "app.logs")
+        assert record.http["status"] == 200
+        assert record.http["path"] == "/work"
+        assert "image_decode" in record.http["stages_ms"]
+    
+    def test_sampling_drops_info_but_keeps_errors(self):
+        """Test unsampled requests lose INFO records but never errors"""
+        client, seen = make_app(sample_rate=0.0)
+        client.get("/work")
+        assert seen["info_kept"] is False
+        assert seen["error_kept"] is True
+        
+        client, seen = make_app(sample_rate=1.0)
+        client.get("/work")
+        assert seen["info_kept"] is True
+
+
+class TestQueueHandler:
+    """Test the queue handler defers formatting"""
+    
+    def test_prepare_keeps_arguments(self):
+        """Test records are queued unformatted, leaving the work to the listener"""
+        record = logging.LogRecord("app", logging.INFO, __file__, 1, "solved %s", ("x",), None)
+        prepared = _QueueHandler(None).prepare(record)
+        assert prepared.msg == "solved %s"
+        assert prepared.args == ("x",)
@@ -1,13 +1,61 @@
 """Tests for Vibe Math API"""
 
+import base64
+import io
+import json
+
+import httpx
 import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from unittest.mock import patch, AsyncMock
+from openai import RateLimitError
+from PIL import Image
+from unittest.mock import patch, AsyncMock, MagicMock
 
-from app.main import app
+from app.admission import AdmissionController
+from app.clients import ClientPool
+from app.jobs import JobManager, JobQueueFull, JobStore
+from app.perceptual import NearDuplicateIndex
+from app.transport import UpstreamTransport
+from app.worksheet import Tile
+from app import main
+from app.main import app, symbolic_solver, worksheet_segmenter
 
 client = TestClient(app)
 
+def make_png_b64(color=(0, 0, 0)):
+    """Build a small base64 PNG; distinct colors give distinct cache keys"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), color).save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+def parse_sse(body):
+    """Split an SSE body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def make_chunk(text=None, usage=None):
+    """Build a fake streaming chunk"""
+    choices = [MagicMock(delta=MagicMock(content=text))] if text is not None else []
+    return MagicMock(choices=choices, usage=usage)
+
+class FakeStream:
+    """Async iterator standing in for an openai AsyncStream"""
+    
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.close = AsyncMock()
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
 class TestHealthEndpoints:
     """Test health check endpoints"""
     
@@ -26,6 +74,48 @@ class TestHealthEndpoints:
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "healthy"
+        assert "hits" in data["cache"]
+        assert "connections" in data["upstream_pool"]
+
+class TestMetricsEndpoint:
+    """Test the Prometheus metrics endpoint"""
+    
+    def test_metrics_exposes_request_latency(self):
+        """Test request latency histograms are recorded per endpoint"""
+        client.get("/health")
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'vibe_math_request_duration_seconds_count{endpoint="/health",status="200"}' in response.text
+    
+    def test_metrics_records_usage_and_upstream_latency(self):
+        """Test token usage and upstream latency from a solve"""
+        completion = MagicMock()
+        completion.choices = [MagicMock(message=MagicMock(content="Answer: 9"))]
+        completion.usage = MagicMock(prompt_tokens=258, completion_tokens=12)
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(return_value=completion)
+        
+        with patch("app.main.client", fake_client):
+            client.post("/solve-json", json={"image": make_png_b64((90, 0, 0))})
+        text = client.get("/metrics").text
+        
+        assert 'vibe_math_upstream_tokens_total{endpoint="/solve-json",type="prompt"}' in text
+        assert 'vibe_math_upstream_duration_seconds_count{endpoint="/solve-json"}' in text
+        assert 'vibe_math_image_decode_duration_seconds_count{endpoint="/solve-json"}' in text
+    
+    def test_metrics_counts_errors(self):
+        """Test mapped errors are counted by class"""
+        client.post("/solve-json", json={"image": "bm90IGFuIGltYWdl"})
+        text = client.get("/metrics").text
+        assert 'vibe_math_errors_total{endpoint="/solve-json",error="unsupported_image"}' in text
+    
+    def test_unknown_paths_share_one_label(self):
+        """Test arbitrary URLs do not create new label values"""
+        client.get("/no-such-path-12345")
+        text = client.get("/metrics").text
+        assert "no-such-path-12345" not in text
+        assert 'endpoint="other"' in text
 
 class TestSolveEndpoints:
     """Test solve endpoints"""
@@ -56,6 +146,473 @@ class TestSolveEndpoints:
         )
         
         assert response.status_code == 422
+    
+    def test_solve_json_served_from_cache(self):
+        """Test repeated images are answered from the cache"""
+        image = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+        with patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 42\nExplanation: Done.")) as mock_call:
+            first = client.post("/solve-json", json={"image": image})
+            second = client.post("/solve-json", json={"image": image})
+        
+        assert first.status_code == 200
+        assert second.json() == {
+            "answer": "Answer: 42\nExplanation: Done.", "near_duplicate": False, "solved_locally": False,
+            "parsed": {"answer": "42", "explanation": "Done.", "cannot_solve": None}
+        }
+        assert mock_call.await_count == 1
+    
+    def test_solve_json_matches_near_duplicate(self):
+        """Test a re-encoded copy of a solved image is answered without Gemini"""
+        img = Image.new("RGB", (400, 300), (235, 235, 230))
+        img.paste((20, 20, 20), (50, 50, 250, 90))
+        img.paste((20, 20, 20), (50, 150, 350, 190))
+        original, recaptured = io.BytesIO(), io.BytesIO()
+        img.save(original, format="PNG")
+        img.resize((800, 600)).save(recaptured, format="JPEG", quality=70)
+        
+        with patch("app.main.near_duplicates", NearDuplicateIndex(enabled=True)), \
+                patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 8\nExplanation: Done.")) as mock_call:
+            first = client.post("/solve-json", json={"image": base64.b64encode(original.getvalue()).decode()})
+            second = client.post("/solve-json", json={"image": base64.b64encode(recaptured.getvalue()).decode()})
+        
+        assert first.json() == {
+            "answer": "Answer: 8\nExplanation: Done.", "near_duplicate": False, "solved_locally": False,
+            "parsed": {"answer": "8", "explanation": "Done.", "cannot_solve": None}
+        }
+        assert second.json() == {
+            "answer": "Answer: 8\nExplanation: Done.", "near_duplicate": True, "solved_locally": False,
+            "parsed": {"answer": "8", "explanation": "Done.", "cannot_solve": None}
+        }
+        assert mock_call.await_count == 1
+    
+    def test_solve_rejects_oversized_upload(self):
+        """Test uploads over the size limit are rejected"""
+        response = client.post(
+            "/solve",
+            files={"file": ("big.jpg", b"\xff\xd8\xff" + b"\x00" * (5 * 1024 * 1024), "image/jpeg")}
+        )
+        
+        assert response.status_code == 413
+    
+    def test_solve_json_rejects_oversized_payload(self):
+        """Test base64 payloads over the size limit are rejected before decoding"""
+        response = client.post(
+            "/solve-json",
+            json={"image": "A" * (7 * 1024 * 1024)}
+        )
+        
+        assert response.status_code == 413
+    
+    def test_solve_json_escalates_through_cascade(self):
+        """Test a refusal from the cheap model is retried on the next tier"""
+        def reply(text):
+            return MagicMock(choices=[MagicMock(message=MagicMock(content=text))], usage=None)
+        
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(side_effect=[
+            reply("Cannot solve: too blurry"), reply("Answer: 12\nExplanation: Three fours.")
+        ])
+        cascade = main.ModelCascade(["models/lite", "models/pro"])
+        
+        with patch("app.main.client", fake_client), patch("app.main.cascade", cascade):
+            response = client.post("/solve-json", json={"image": make_png_b64((0, 0, 140))})
+        
+        assert response.json()["parsed"] == {
+            "answer": "12", "explanation": "Three fours.", "cannot_solve": None
+        }
+        models = [call.kwargs["model"] for call in fake_client.chat.completions.create.await_args_list]
+        assert models == ["models/lite", "models/pro"]
+        assert cascade.stats()["escalations"] == 1
+    
+    def test_solve_json_accepts_data_uri(self):
+        """Test data URI prefixes are stripped before decoding"""
+        image = "data:image/png;base64," + make_png_b64((60, 0, 0))
+        with patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 6\nExplanation: Done.")) as mock_call:
+            response = client.post("/solve-json", json={"image": image})
+        
+        assert response.json() == {
+            "answer": "Answer: 6\nExplanation: Done.", "near_duplicate": False, "solved_locally": False,
+            "parsed": {"answer": "6", "explanation": "Done.", "cannot_solve": None}
+        }
+        assert mock_call.await_args.args[0].startswith("data:image/")
+    
+    def test_solve_with_key_uses_pooled_client(self):
+        """Test BYO-key solves go through the per-key client pool"""
+        completion = MagicMock()
+        completion.choices = [MagicMock(message=MagicMock(content="Answer: 11"))]
+        completion.usage = None
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(return_value=completion)
+        fake_client.close = AsyncMock()
+        
+        with patch("app.main.client_pool", ClientPool(factory=lambda api_key: fake_client)):
+            response = client.post(
+                "/api/solve-with-key",
+                json={"image": make_png_b64((110, 0, 0)), "api_key": "user-key"}
+            )
+        
+        assert response.status_code == 200
+        assert response.json()["answer"] == "Answer: 11"
+    
+    def test_shared_client_uses_upstream_transport(self, monkeypatch):
+        """Test the shared-key client sends requests through the tuned transport"""
+        transport = UpstreamTransport()
+        monkeypatch.setattr("app.main.upstream_transport", transport)
+        monkeypatch.setattr("app.main.client", None)
+        monkeypatch.setattr("app.main.GEMINI_API_KEY", "test-key")
+        
+        assert main.get_client()._client is transport.client()
+    
+    def test_solve_json_rejects_non_image(self):
+        """Test base64 payloads that are not images are rejected"""
+        response = client.post(
+            "/solve-json",
+            json={"image": "bm90IGFuIGltYWdl"}
+        )
+        
+        assert response.status_code == 400
+    
+    async def test_unchanged_image_reuses_client_data_uri(self):
+        """Test the client's data URI is sent as is when normalization keeps the bytes"""
+        image_b64 = make_png_b64((0, 0, 120))
+        image_data = "data:image/png;base64," + image_b64
+        with patch.object(main.image_normalizer, "enabled", False), \
+                patch("app.main.build_data_uri") as build_data_uri:
+            image_uri = await main.prepare_image(base64.b64decode(image_b64), image_data)
+        
+        assert image_uri is image_data
+        build_data_uri.assert_not_called()
+    
+    @pytest.mark.parametrize("wrap, reused", [
+        (lambda b64: b64, True),
+        (lambda b64: "data:image/jpeg;base64," + b64, False),
+        (lambda b64: b64[:8] + "\n" + b64[8:], False),
+    ])
+    def test_reuse_image_data(self, wrap, reused):
+        """Test bare base64 is reused, and mislabelled or non-canonical text is not"""
+        image_b64 = make_png_b64((0, 0, 130))
+        image_uri = main.reuse_image_data(wrap(image_b64), base64.b64decode(image_b64), "image/png")
+        
+        assert image_uri == ("data:image/png;base64," + image_b64 if reused else None)
+
+class TestTextEndpoints:
+    """Test typed problems and the local symbolic fast path"""
+    
+    def test_solve_text_answers_locally(self):
+        """Test locally solvable text never reaches Gemini"""
+        local = AsyncMock(return_value="Answer: x = 4\nExplanation: Solving 2x+3 = 11 for x gives x = 4.")
+        with patch.object(symbolic_solver, "solve", new=local), \
+                patch("app.main.call_gemini_messages", new=AsyncMock()) as mock_call:
+            response = client.post("/solve-text", json={"text": "2x+3=11"})
+        
+        assert response.status_code == 200
+        assert response.json()["answer"].startswith("Answer: x = 4")
+        assert response.json()["solved_locally"] is True
+        mock_call.assert_not_awaited()
+    
+    def test_solve_text_falls_back_to_gemini(self):
+        """Test text the local solver cannot handle is sent to Gemini as text"""
+        with patch.object(symbolic_solver, "solve", new=AsyncMock(return_value=None)), \
+                patch("app.main.call_gemini_messages", new=AsyncMock(return_value="Answer: 9\nExplanation: Done.")) as mock_call:
+            response = client.post("/solve-text", json={"text": "a train leaves at 3pm, when does it arrive"})
+        
+        assert response.json() == {
+            "answer": "Answer: 9\nExplanation: Done.", "near_duplicate": False, "solved_locally": False,
+            "parsed": {"answer": "9", "explanation": "Done.", "cannot_solve": None}
+        }
+        messages = mock_call.await_args.args[0]
+        assert messages[-1]["content"].endswith("a train leaves at 3pm, when does it arrive")
+    
+    def test_solve_json_text_skips_image(self):
+        """Test a solvable text field answers without decoding or sending the image"""
+        local = AsyncMock(return_value="Answer: 4\nExplanation: Evaluating 2 + 2 gives 4.")
+        with patch.object(symbolic_solver, "solve", new=local), \
+                patch("app.main.call_gemini_api", new=AsyncMock()) as mock_call:
+            response = client.post("/solve-json", json={"image": "not base64 at all", "text": "2 + 2"})
+        
+        assert response.json()["solved_locally"] is True
+        mock_call.assert_not_awaited()
+    
+    def test_solve_json_text_falls_back_to_image(self):
+        """Test the image is solved with Gemini when the text is not locally solvable"""
+        with patch.object(symbolic_solver, "solve", new=AsyncMock(return_value=None)), \
+                patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 3")) as mock_call:
+            response = client.post(
+                "/solve-json", json={"image": make_png_b64((120, 0, 0)), "text": "see picture"}
+            )
+        
+        assert response.json()["answer"] == "Answer: 3"
+        mock_call.assert_awaited_once()
+    
+    def test_stream_replays_local_answer(self):
+        """Test a locally solved stream is a single done event"""
+        local = AsyncMock(return_value="Answer: 4\nExplanation: Evaluating 2 + 2 gives 4.")
+        with patch.object(symbolic_solver, "solve", new=local):
+            response = client.post("/solve-json/stream", json={"text": "2 + 2"})
+        
+        events = parse_sse(response.text)
+        assert [event for event, _ in events] == ["done"]
+        assert events[0][1]["solved_locally"] is True
+    
+    def test_solve_json_requires_image_or_text(self):
+        """Test a payload with neither field is a validation error"""
+        response = client.post("/solve-json", json={})
+        assert response.status_code == 422
+
+class TestAdmissionControl:
+    """Test load shedding on the upstream call path"""
+    
+    def test_overloaded_returns_503_with_retry_after(self):
+        """Test a full queue sheds load with a fast 503"""
+        full = AdmissionController("test", max_in_flight=0, max_queue=0)
+        with patch("app.main.shared_admission", full), \
+                patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 1")) as mock_call:
+            response = client.post("/solve-json", json={"image": make_png_b64((70, 0, 0))})
+        
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        mock_call.assert_not_awaited()
+    
+    @pytest.mark.parametrize("path", ["/solve-json", "/solve-json/stream"])
+    def test_overloaded_request_skips_normalization(self, path):
+        """Test shed requests are rejected before the image is normalized"""
+        full = AdmissionController("test", max_in_flight=0, max_queue=0)
+        with patch("app.main.shared_admission", full), \
+                patch("app.main.prepare_image", new=AsyncMock()) as mock_prepare:
+            response = client.post(path, json={"image": make_png_b64((75, 0, 0))})
+        
+        assert response.status_code == 503
+        mock_prepare.assert_not_awaited()
+    
+    def test_byo_key_uses_separate_budget(self):
+        """Test BYO-key requests are not limited by the shared-key budget"""
+        full = AdmissionController("test", max_in_flight=0, max_queue=0)
+        with patch("app.main.shared_admission", full), \
+                patch("app.main.call_gemini_api_with_key", new=AsyncMock(return_value="Answer: 2")):
+            response = client.post(
+                "/api/solve-with-key",
+                json={"image": make_png_b64((80, 0, 0)), "api_key": "user-key"}
+            )
+        
+        assert response.status_code == 200
+    
+    def test_health_reports_admission(self):
+        """Test queue depth and rejections are visible on /health"""
+        data = client.get("/health").json()
+        assert "queue_depth" in data["admission"]["shared_key"]
+        assert "rejected_queue_full" in data["admission"]["byo_key"]
+
+class TestStreamingEndpoints:
+    """Test server-sent event streaming endpoints"""
+    
+    def test_stream_emits_tokens_then_done(self):
+        """Test tokens are forwarded and the final event carries answer and usage"""
+        usage = MagicMock(model_dump=MagicMock(return_value={"total_tokens": 7}))
+        stream = FakeStream([make_chunk("Answer: "), make_chunk("42"), make_chunk(usage=usage)])
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(return_value=stream)
+        
+        with patch("app.main.client", fake_client):
+            response = client.post("/solve-json/stream", json={"image": make_png_b64((1, 2, 3))})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.text)
+        assert [e for e, _ in events] == ["token", "token", "done"]
+        assert events[-1][1]["answer"] == "Answer: 42"
+        assert events[-1][1]["usage"] == {"total_tokens": 7}
+        stream.close.assert_awaited_once()
+    
+    def test_stream_maps_rate_limit_to_error_event(self):
+        """Test upstream 429s become a terminal error event"""
+        rate_limited = RateLimitError(
+            "rate limited",
+            response=httpx.Response(429, request=httpx.Request("POST", "http://upstream")),
+            body=None
+        )
+        fake_client = MagicMock()
+        fake_client.chat.completions.create = AsyncMock(side_effect=rate_limited)
+        
+        with patch("app.main.client", fake_client):
+            response = client.post("/solve-json/stream", json={"image": make_png_b64((4, 5, 6))})
+        
+        events = parse_sse(response.text)
+        assert events == [("error", {
+            "detail": "Rate limit exceeded. Please try again later.",
+            "status_code": 429
+        })]
+    
+    def test_stream_rejects_invalid_image(self):
+        """Test invalid images fail before the stream starts"""
+        response = client.post("/solve-json/stream", json={"image": "bm90IGFuIGltYWdl"})
+        assert response.status_code == 400
+
+class TestBatchEndpoints:
+    """Test batch solve endpoints"""
+    
+    def test_batch_results_in_input_order(self):
+        """Test answers and per-item errors come back in input order"""
+        images = [make_png_b64((10, 0, 0)), "bm90IGFuIGltYWdl", make_png_b64((20, 0, 0))]
+        with patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 1")):
+            response = client.post("/solve-batch", json={"images": images})
+        
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["index"] for r in results] == [0, 1, 2]
+        assert results[0]["answer"] == "Answer: 1"
+        assert results[1]["status_code"] == 400
+        assert results[2]["answer"] == "Answer: 1"
+    
+    def test_batch_uses_api_key(self):
+        """Test a per-batch API key routes through the BYO-key helper"""
+        with patch("app.main.call_gemini_api_with_key", new=AsyncMock(return_value="Answer: 2")) as mock_call:
+            response = client.post(
+                "/solve-batch",
+                json={"images": [make_png_b64((30, 0, 0))], "api_key": "user-key"}
+            )
+        
+        assert response.json()["results"][0]["answer"] == "Answer: 2"
+        assert mock_call.await_args.args[1] == "user-key"
+    
+    def test_batch_stream_ndjson(self):
+        """Test the streaming form emits one NDJSON line per image"""
+        images = [make_png_b64((40, 0, 0)), make_png_b64((50, 0, 0))]
+        with patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 5")):
+            response = client.post("/solve-batch/stream", json={"images": images})
+        
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(r["index"] for r in lines) == [0, 1]
+        assert all(r["answer"] == "Answer: 5" for r in lines)
+    
+    async def test_batch_stream_starts_no_work_before_consumed(self):
+        """Test a stream dropped before its first line never starts any solves"""
+        payload = main.BatchPayload(images=[make_png_b64((45, 0, 0))])
+        with patch("app.main.start_batch") as start_batch:
+            response = await main.solve_batch_stream(payload)
+            await response.body_iterator.aclose()
+        
+        start_batch.assert_not_called()
+    
+    def test_batch_rejects_empty_list(self):
+        """Test an empty batch is a validation error"""
+        response = client.post("/solve-batch", json={"images": []})
+        assert response.status_code == 422
+
+def make_tile(color, box):
+    """Build a worksheet tile from a small PNG"""
+    return Tile(base64.b64decode(make_png_b64(color)), box)
+
+class TestWorksheetEndpoints:
+    """Test worksheet mode"""
+    
+    def test_problems_solved_in_reading_order(self):
+        """Test each tile is solved separately and returned in segmenter order"""
+        tiles = [make_tile((0, 60, 0), (0.0, 0.0, 0.5, 0.3)), make_tile((0, 70, 0), (0.0, 0.3, 0.5, 0.6))]
+        with patch.object(worksheet_segmenter, "segment", new=AsyncMock(return_value=tiles)), \
+                patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 3\nExplanation: Done.")) as mock_call:
+            response = client.post("/solve-json", json={"image": make_png_b64((0, 50, 0)), "worksheet": True})
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert mock_call.await_count == 2
+        assert [p["index"] for p in data["problems"]] == [0, 1]
+        assert data["problems"][1]["box"] == [0.0, 0.3, 0.5, 0.6]
+        assert data["problems"][0]["parsed"]["answer"] == "3"
+        assert data["answer"] == "1. Answer: 3\nExplanation: Done.\n\n2. Answer: 3\nExplanation: Done."
+    
+    def test_failed_problem_does_not_fail_page(self):
+        """Test a tile that fails gets an error entry alongside the others"""
+        tiles = [make_tile((0, 80, 0), (0.0, 0.0, 1.0, 0.5)), Tile(b"not an image", (0.0, 0.5, 1.0, 1.0))]
+        with patch.object(worksheet_segmenter, "segment", new=AsyncMock(return_value=tiles)), \
+                patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 4")):
+            response = client.post("/solve-json", json={"image": make_png_b64((0, 90, 0)), "worksheet": True})
+        
+        problems = response.json()["problems"]
+        assert response.status_code == 200
+        assert problems[0]["answer"] == "Answer: 4"
+        assert problems[1]["status_code"] == 400
+    
+    def test_whole_page_when_not_split(self):
+        """Test an unsplit page is solved as one problem and errors keep their status"""
+        with patch.object(worksheet_segmenter, "segment", new=AsyncMock(return_value=[])), \
+                patch("app.main.call_gemini_api", new=AsyncMock(side_effect=HTTPException(status_code=429, detail="Rate limit exceeded"))):
+            response = client.post(
+                "/solve",
+                params={"worksheet": "true"},
+                files={"file": ("page.png", base64.b64decode(make_png_b64((0, 100, 0))), "image/png")}
+            )
+        
+        assert response.status_code == 429
+    
+    def test_worksheet_requires_image(self):
+        """Test worksheet mode is rejected for typed problems"""
+        response = client.post("/solve-json", json={"text": "2x + 3 = 11", "worksheet": True})
+        assert response.status_code == 422
+    
+    def test_worksheet_not_streamed(self):
+        """Test the streaming endpoints reject worksheet mode"""
+        response = client.post("/solve-json/stream", json={"image": make_png_b64((0, 110, 0)), "worksheet": True})
+        assert response.status_code == 400
+
+@pytest.fixture
+def jobs_client(tmp_path, monkeypatch):
+    """Client with the lifespan running so job workers stay alive between requests"""
+    monkeypatch.setattr("app.main.settings", main.settings._replace(gemini_api_key="test-key", upstream_warmup=False))
+    # Restored afterwards, since the lifespan replaces it
+    monkeypatch.setattr("app.main.GEMINI_API_KEY", None)
+    manager = JobManager(JobStore(str(tmp_path / "jobs.db")), workers=1, max_queue=1)
+    with patch("app.main.jobs", manager), \
+            patch.object(symbolic_solver, "start"), patch.object(symbolic_solver, "close"), \
+            patch.object(worksheet_segmenter, "start"), patch.object(worksheet_segmenter, "close"):
+        with TestClient(app) as jobs_client:
+            yield jobs_client
+
+class TestJobEndpoints:
+    """Test the asynchronous job API"""
+    
+    def test_job_round_trip(self, jobs_client):
+        """Test a submitted job is accepted and its result can be long-polled"""
+        with patch("app.main.call_gemini_api", new=AsyncMock(return_value="Answer: 6\nExplanation: Done.")):
+            response = jobs_client.post("/jobs", json={"image": make_png_b64((0, 120, 0))})
+            assert response.status_code == 202
+            job_id = response.json()["id"]
+            assert response.headers["location"] == f"/jobs/{job_id}"
+            
+            job = jobs_client.get(f"/jobs/{job_id}", params={"wait": 5}).json()
+        
+        assert job["status"] == "done"
+        assert job["result"] == {
+            "answer": "Answer: 6\nExplanation: Done.", "near_duplicate": False, "solved_locally": False,
+            "parsed": {"answer": "6", "explanation": "Done.", "cannot_solve": None}
+        }
+    
+    def test_job_records_upstream_error(self, jobs_client):
+        """Test an upstream failure is stored on the job with its status code"""
+        with patch("app.main.call_gemini_messages", new=AsyncMock(
+            side_effect=HTTPException(status_code=502, detail="Error communicating with AI service")
+        )), patch.object(symbolic_solver, "solve", new=AsyncMock(return_value=None)):
+            job_id = jobs_client.post("/jobs", json={"text": "why is the sky blue"}).json()["id"]
+            job = jobs_client.get(f"/jobs/{job_id}", params={"wait": 5}).json()
+        
+        assert job["status"] == "failed"
+        assert job["error"] == {"detail": "Error communicating with AI service", "status_code": 502}
+    
+    def test_invalid_image_rejected_on_submit(self, jobs_client):
+        """Test malformed images fail fast instead of producing a failed job"""
+        response = jobs_client.post("/jobs", json={"image": "bm90IGFuIGltYWdl"})
+        assert response.status_code == 400
+    
+    def test_full_queue_returns_503(self, jobs_client):
+        """Test submits beyond the queue bound are shed with Retry-After"""
+        with patch("app.main.jobs.submit", new=AsyncMock(side_effect=JobQueueFull())):
+            response = jobs_client.post("/jobs", json={"text": "2 + 2"})
+        
+        assert response.status_code == 503
+        assert "retry-after" in response.headers
+    
+    def test_unknown_job_404(self, jobs_client):
+        """Test unknown or expired ids are not found"""
+        assert jobs_client.get("/jobs/missing").status_code == 404
 
 class TestErrorHandling:
     """Test error handling"""
@@ -0,0 +1,52 @@
+"""Tests for the Prometheus metrics registry"""
+
+from app.metrics import MetricsRegistry
+
+
+class TestMetricsRegistry:
+    """Test metric updates and text exposition"""
+    
+    def test_counter_render(self):
+        """Test counters render with labels"""
+        registry = MetricsRegistry()
+        errors = registry.counter("errors_total", "Errors", ("endpoint", "error"))
+        errors.inc("/solve", "rate_limited")
+        errors.inc("/solve", "rate_limited")
+        
+        text = registry.render()
+        assert "# TYPE errors_total counter" in text
+        assert 'errors_total{endpoint="/solve",error="rate_limited"} 2' in text
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Test histogram buckets, sum and count"""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", ("endpoint",), buckets=(0.1, 1.0))
+        latency.observe("/solve", value=0.05)
+        latency.observe("/solve", value=0.5)
+        latency.observe("/solve", value=5)
+        
+        text = registry.render()
+        assert 'latency_seconds_bucket{endpoint="/solve",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{endpoint="/solve",le="1"} 2' in text
+        assert 'latency_seconds_bucket{endpoint="/solve",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{endpoint="/solve"} 3' in text
+        assert 'latency_seconds_sum{endpoint="/solve"} 5.55' in text
+    
+    def test_boundary_value_in_bucket(self):
+        """Test values equal to a bound land in that bucket (le semantics)"""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Latency", buckets=(1.0,))
+        latency.observe(value=1.0)
+        assert 'latency_seconds_bucket{le="1"} 1' in registry.render()
+    
+    def test_callback_gauge(self):
+        """Test gauges can be read at scrape time"""
+        registry = MetricsRegistry()
+        registry.gauge("queue_depth", "Queue depth", ("budget",), callback=lambda: {("shared",): 3})
+        assert 'queue_depth{budget="shared"} 3' in registry.render()
+    
+    def test_label_escaping(self):
+        """Test label values are escaped"""
+        registry = MetricsRegistry()
+        registry.counter("c_total", "C", ("v",)).inc('a"b\\c')
+        assert 'c_total{v="a\\"b\\\\c"} 1' in registry.render()
@@ -0,0 +1,96 @@
+"""Tests for the near-duplicate answer index"""
+
+import io
+import random
+
+from PIL import Image, ImageDraw
+
+from app.perceptual import BKTree, NearDuplicateIndex, dhash, hamming
+
+
+def make_page(shapes, size=(800, 600), quality=90):
+    """Render dark blocks on a light page as a JPEG"""
+    img = Image.new("RGB", size, (235, 235, 230))
+    draw = ImageDraw.Draw(img)
+    sx, sy = size[0] / 800, size[1] / 600
+    for x0, y0, x1, y1 in shapes:
+        draw.rectangle((x0 * sx, y0 * sy, x1 * sx, y1 * sy), fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+PAGE = [(100, 100, 300, 160), (350, 100, 700, 160), (100, 300, 500, 360)]
+OTHER_PAGE = [(400, 50, 750, 250), (50, 400, 350, 550)]
+
+
+class TestDHash:
+    """Test the perceptual hash"""
+    
+    def test_recapture_is_close(self):
+        """Test the same page at another size and quality hashes nearby"""
+        a = dhash(make_page(PAGE))
+        b = dhash(make_page(PAGE, size=(1600, 1200), quality=60))
+        assert hamming(a, b) <= 6
+    
+    def test_different_page_is_far(self):
+        """Test an unrelated layout hashes far away"""
+        assert hamming(dhash(make_page(PAGE)), dhash(make_page(OTHER_PAGE))) > 20
+    
+    def test_undecodable_returns_none(self):
+        """Test bytes Pillow cannot open yield no fingerprint"""
+        assert dhash(b"\x89PNG\r\n\x1a\ngarbage") is None
+
+
+class TestBKTree:
+    """Test radius search over Hamming distance"""
+    
+    def test_search_matches_brute_force(self):
+        """Test every hash within the radius is found, nearest first"""
+        rng = random.Random(7)
+        values = [rng.getrandbits(32) for _ in range(300)]
+        tree = BKTree()
+        for value in values:
+            tree.add(value)
+        
+        query = values[0] ^ 0b1011
+        expected = sorted((hamming(query, v), v) for v in set(values) if hamming(query, v) <= 8)
+        assert tree.search(query, 8) == expected
+        assert tree.search(query, 8)[0] == (3, values[0])
+
+
+class TestNearDuplicateIndex:
+    """Test the bounded fingerprint index"""
+    
+    async def test_disabled_skips_hashing(self):
+        """Test a disabled index never fingerprints or matches"""
+        index = NearDuplicateIndex(enabled=False)
+        assert await index.fingerprint(make_page(PAGE)) is None
+        assert index.lookup(None) is None
+    
+    async def test_near_match_returns_answer(self):
+        """Test a re-photographed page is matched to the stored answer"""
+        index = NearDuplicateIndex(enabled=True, max_distance=6)
+        index.add(await index.fingerprint(make_page(PAGE)), "Answer: 7")
+        
+        recaptured = await index.fingerprint(make_page(PAGE, size=(1600, 1200), quality=60))
+        assert index.lookup(recaptured) == "Answer: 7"
+        assert index.lookup(await index.fingerprint(make_page(OTHER_PAGE))) is None
+        assert index.stats()["hits"] == 1
+    
+    def test_lru_eviction_bounds_tree(self):
+        """Test evicted fingerprints stop matching and the tree is rebuilt"""
+        index = NearDuplicateIndex(enabled=True, max_entries=2, max_distance=0)
+        for value in (1, 2, 4, 8, 16):
+            index.add(value, f"Answer: {value}")
+        
+        assert index.lookup(1) is None
+        assert index.lookup(16) == "Answer: 16"
+        assert index.stats()["evictions"] == 3
+        assert index._tree.size <= 4
+    
+    def test_expired_entries_do_not_match(self):
+        """Test entries past their TTL are dropped on lookup"""
+        index = NearDuplicateIndex(enabled=True, ttl_seconds=-1, max_distance=0)
+        index.add(5, "Answer: 5")
+        assert index.lookup(5) is None
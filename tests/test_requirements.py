@@ -0,0 +1,25 @@
+"""Tests that requirements.txt, which the Docker image installs, matches pyproject.toml"""
+
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def read_requirements():
+    """Return the pinned requirements, ignoring comments and blank lines"""
+    lines = (ROOT / "requirements.txt").read_text().splitlines()
+    return {line.strip() for line in lines if line.strip() and not line.startswith("#")}
+
+
+class TestRequirements:
+    """Test the two dependency lists stay in sync"""
+    
+    def test_runtime_dependencies_are_pinned(self):
+        """Test every pyproject dependency, extras included, is in requirements.txt"""
+        tomllib = pytest.importorskip("tomllib")
+        with open(ROOT / "pyproject.toml", "rb") as f:
+            dependencies = tomllib.load(f)["project"]["dependencies"]
+        
+        assert set(dependencies) - read_requirements() == set()
@@ -0,0 +1,183 @@
+"""Tests for upstream retries, pacing and circuit breaking"""
+
+import httpx
+import pytest
+from openai import APIConnectionError, AuthenticationError, BadRequestError, RateLimitError
+
+from app.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LocalRateLimitError,
+    ResilientCaller,
+    TokenBucket,
+    is_client_error,
+    parse_retry_after,
+)
+
+REQUEST = httpx.Request("POST", "http://upstream")
+
+
+def rate_limit_error(headers=None):
+    """Build an upstream 429 error"""
+    response = httpx.Response(429, headers=headers or {}, request=REQUEST)
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def connection_error():
+    """Build an upstream connection error"""
+    return APIConnectionError(request=REQUEST)
+
+
+def make_caller(**kwargs):
+    """Build a caller with no real sleeping between retries"""
+    kwargs.setdefault("base_delay", 0)
+    return ResilientCaller(**kwargs)
+
+
+def failing_then(result, failures):
+    """Return an async callable that raises the given errors, then succeeds"""
+    errors = list(failures)
+    calls = []
+    
+    async def fn():
+        calls.append(1)
+        if errors:
+            raise errors.pop(0)
+        return result
+    
+    fn.calls = calls
+    return fn
+
+
+class TestIsClientError:
+    """Test which upstream errors no other model could succeed on"""
+    
+    @pytest.mark.parametrize("status_code, error_type", [
+        (400, BadRequestError),
+        (401, AuthenticationError),
+    ])
+    def test_rejected_requests(self, status_code, error_type):
+        """Test bad keys and bad requests are client errors"""
+        response = httpx.Response(status_code, request=REQUEST)
+        assert is_client_error(error_type("rejected", response=response, body=None))
+    
+    def test_transient_errors(self):
+        """Test rate limits and connection errors are not"""
+        assert not is_client_error(rate_limit_error())
+        assert not is_client_error(connection_error())
+
+
+class TestParseRetryAfter:
+    """Test Retry-After header parsing"""
+    
+    def test_seconds(self):
+        """Test delta-seconds values"""
+        assert parse_retry_after(rate_limit_error({"retry-after": "3"})) == 3.0
+    
+    def test_milliseconds(self):
+        """Test the retry-after-ms variant"""
+        assert parse_retry_after(rate_limit_error({"retry-after-ms": "250"})) == 0.25
+    
+    def test_missing(self):
+        """Test errors without the header"""
+        assert parse_retry_after(rate_limit_error()) is None
+
+
+class TestResilientCaller:
+    """Test retry behaviour"""
+    
+    async def test_retries_transient_errors(self):
+        """Test transient errors are retried until success"""
+        caller = make_caller(max_attempts=3)
+        fn = failing_then("ok", [connection_error(), rate_limit_error()])
+        assert await caller.call("k", fn) == "ok"
+        assert len(fn.calls) == 3
+        assert caller.stats()["retries"] == 2
+    
+    async def test_gives_up_after_max_attempts(self):
+        """Test the last error is raised once attempts run out"""
+        caller = make_caller(max_attempts=2)
+        fn = failing_then("ok", [connection_error(), connection_error()])
+        with pytest.raises(APIConnectionError):
+            await caller.call("k", fn)
+        assert len(fn.calls) == 2
+    
+    async def test_does_not_retry_auth_errors(self):
+        """Test non-transient errors fail immediately"""
+        caller = make_caller(max_attempts=3)
+        response = httpx.Response(401, request=REQUEST)
+        fn = failing_then("ok", [AuthenticationError("bad key", response=response, body=None)])
+        with pytest.raises(AuthenticationError):
+            await caller.call("k", fn)
+        assert len(fn.calls) == 1
+    
+    async def test_long_retry_after_not_waited(self):
+        """Test a Retry-After beyond the cap fails fast instead of sleeping"""
+        caller = make_caller(max_attempts=3, max_retry_after=1)
+        fn = failing_then("ok", [rate_limit_error({"retry-after": "60"})])
+        with pytest.raises(RateLimitError):
+            await caller.call("k", fn)
+        assert len(fn.calls) == 1
+    
+    async def test_token_bucket_limits_per_key(self):
+        """Test a key over its budget is rejected without calling upstream"""
+        caller = make_caller(rate_per_second=0.01, burst=1, max_rate_wait=0)
+        fn = failing_then("ok", [])
+        await caller.call("a", fn)
+        with pytest.raises(LocalRateLimitError):
+            await caller.call("a", fn)
+        # Other keys have their own bucket
+        await caller.call("b", fn)
+        assert len(fn.calls) == 2
+
+
+class TestTokenBucket:
+    """Test token bucket arithmetic"""
+    
+    def test_burst_then_wait(self):
+        """Test the bucket allows a burst and then asks callers to wait"""
+        bucket = TokenBucket(rate=1, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() > 0.9
+    
+    def test_pause(self):
+        """Test pausing holds calls even with tokens available"""
+        bucket = TokenBucket(rate=1, capacity=2)
+        bucket.pause(5)
+        assert bucket.reserve() > 4
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions"""
+    
+    async def test_opens_after_consecutive_failures(self):
+        """Test the breaker fails fast once the threshold is reached"""
+        caller = make_caller(max_attempts=1, breaker=CircuitBreaker(failure_threshold=2, cooldown=60))
+        for _ in range(2):
+            with pytest.raises(APIConnectionError):
+                await caller.call("k", failing_then("ok", [connection_error()]))
+        
+        fn = failing_then("ok", [])
+        with pytest.raises(CircuitOpenError):
+            await caller.call("k", fn)
+        assert fn.calls == []
+        assert caller.stats()["breaker_state"] == "open"
+    
+    async def test_rate_limits_do_not_trip_breaker(self):
+        """Test per-key 429s leave the shared breaker closed"""
+        caller = make_caller(max_attempts=1, breaker=CircuitBreaker(failure_threshold=1))
+        with pytest.raises(RateLimitError):
+            await caller.call("k", failing_then("ok", [rate_limit_error()]))
+        assert caller.stats()["breaker_state"] == "closed"
+    
+    async def test_half_open_trial_closes_breaker(self):
+        """Test a successful trial call after the cooldown closes the breaker"""
+        breaker = CircuitBreaker(failure_threshold=1, cooldown=0)
+        caller = make_caller(max_attempts=1, breaker=breaker)
+        with pytest.raises(APIConnectionError):
+            await caller.call("k", failing_then("ok", [connection_error()]))
+        assert breaker.state == "half_open"
+        
+        assert await caller.call("k", failing_then("ok", [])) == "ok"
+        assert breaker.state == "closed"
@@ -0,0 +1,68 @@
+"""Tests for single-flight request coalescing"""
+
+import asyncio
+
+import pytest
+
+from app.singleflight import SingleFlight
+
+
+class TestSingleFlight:
+    """Test coalescing, error fan-out and cancellation"""
+    
+    async def test_concurrent_calls_share_one_upstream(self):
+        """Test concurrent callers with the same key trigger one call"""
+        flight = SingleFlight()
+        calls = 0
+        
+        async def upstream():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "Answer: 42"
+        
+        results = await asyncio.gather(*[flight.do("k", upstream) for _ in range(5)])
+        assert results == ["Answer: 42"] * 5
+        assert calls == 1
+        assert flight.stats()["coalesced"] == 4
+        assert flight.stats()["in_flight"] == 0
+    
+    async def test_errors_reach_every_waiter(self):
+        """Test an upstream error is raised to all waiters"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+        
+        results = await asyncio.gather(
+            flight.do("k", upstream), flight.do("k", upstream), return_exceptions=True
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+    
+    async def test_waiter_cancellation_does_not_cancel_call(self):
+        """Test one waiter disconnecting leaves the call running for others"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            await asyncio.sleep(0.05)
+            return "Answer: 42"
+        
+        first = asyncio.ensure_future(flight.do("k", upstream))
+        second = asyncio.ensure_future(flight.do("k", upstream))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        
+        assert await second == "Answer: 42"
+        with pytest.raises(asyncio.CancelledError):
+            await first
+    
+    async def test_distinct_keys_not_coalesced(self):
+        """Test different keys run independently"""
+        flight = SingleFlight()
+        
+        async def upstream():
+            return "x"
+        
+        await asyncio.gather(flight.do("a", upstream), flight.do("b", upstream))
+        assert flight.stats()["leaders"] == 2
@@ -0,0 +1,92 @@
+"""Cold-start budget tests for importing and starting the app"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+# Budgets for a cold process; generous enough for a loaded CI runner, tight
+# enough to catch an eager import of openai, SymPy or Pillow
+IMPORT_BUDGET_SECONDS = 1.5
+STARTUP_BUDGET_SECONDS = 5.0
+
+# Heavy modules that must only be imported on first use
+LAZY_MODULES = ("openai", "sympy", "PIL")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestColdStart:
+    """Test import time and startup-to-first-response against fixed budgets"""
+    
+    def test_import_time_budget(self):
+        """Test `python -X importtime` stays in budget and defers heavy modules"""
+        script = (
+            "import json, sys, app.main; "
+            f"print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        
+        # Lines look like "import time: self [us] | cumulative | package"
+        cumulative_us = next(
+            int(line.split("|")[1])
+            for line in result.stderr.splitlines()
+            if line.split("|")[-1].strip() == "app.main"
+        )
+        assert cumulative_us / 1e6 < IMPORT_BUDGET_SECONDS
+        assert json.loads(result.stdout) == []
+    
+    def test_import_has_no_side_effects(self):
+        """Test importing configures no logging until the app is built"""
+        script = (
+            "import threading, app.logs, app.main; "
+            "print(app.logs._listener is None, threading.active_count()); "
+            "app.main.app; print(app.logs._listener is not None, app.main.app is app.main.app)"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        
+        assert result.stdout.split() == ["True", "1", "True", "True"]
+    
+    def test_startup_to_first_response(self, tmp_path):
+        """Test a fresh server answers /health within budget"""
+        port = free_port()
+        # Warm-up time depends on the network, not on the app
+        env = dict(
+            os.environ, GEMINI_API_KEY="test-key", JOBS_DB_PATH=str(tmp_path / "jobs.db"),
+            UPSTREAM_WARMUP="false"
+        )
+        started = time.monotonic()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            elapsed = None
+            while time.monotonic() - started < STARTUP_BUDGET_SECONDS * 2:
+                try:
+                    response = httpx.get(f"http://127.0.0.1:{port}/health", timeout=1)
+                except httpx.TransportError:
+                    time.sleep(0.02)
+                    continue
+                if response.status_code == 200:
+                    elapsed = time.monotonic() - started
+                    break
+            assert elapsed is not None and elapsed < STARTUP_BUDGET_SECONDS
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
@@ -0,0 +1,55 @@
+"""Tests for the stub Gemini server used by the load test"""
+
+import httpx
+import pytest
+from openai import AsyncOpenAI, RateLimitError
+
+from benchmarks.stub_gemini import StubConfig, create_stub_app
+
+
+def make_client(config):
+    """Build an SDK client that talks to the stub in-process"""
+    http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=create_stub_app(config)))
+    return AsyncOpenAI(
+        base_url="http://stub", api_key="test", max_retries=0, http_client=http_client
+    )
+
+
+class TestStubGemini:
+    """Test the stub speaks the chat completions API the app relies on"""
+    
+    async def test_completion_with_usage(self):
+        """Test a blocking completion parses with the real SDK"""
+        client = make_client(StubConfig(latency=0, jitter=0, prompt_tokens=100))
+        response = await client.chat.completions.create(
+            model="stub", messages=[{"role": "user", "content": "hi"}]
+        )
+        
+        assert response.choices[0].message.content.startswith("Answer:")
+        assert response.usage.prompt_tokens == 100
+    
+    async def test_streaming_completion(self):
+        """Test streamed deltas reassemble into the answer and end with usage"""
+        config = StubConfig(latency=0, jitter=0)
+        client = make_client(config)
+        stream = await client.chat.completions.create(
+            model="stub", messages=[], stream=True, stream_options={"include_usage": True}
+        )
+        
+        text, usage = "", None
+        async for chunk in stream:
+            if chunk.choices:
+                text += chunk.choices[0].delta.content or ""
+            if chunk.usage:
+                usage = chunk.usage
+        
+        assert text == config.answer
+        assert usage.completion_tokens > 0
+    
+    async def test_injects_rate_limits_with_retry_after(self):
+        """Test 429s carry a Retry-After header"""
+        client = make_client(StubConfig(rate_limit_rate=1.0, retry_after=3))
+        with pytest.raises(RateLimitError) as exc_info:
+            await client.chat.completions.create(model="stub", messages=[])
+        
+        assert exc_info.value.response.headers["retry-after"] == "3"
@@ -0,0 +1,78 @@
+"""Tests for the local symbolic solver"""
+
+import pytest
+
+from app.symbolic import SymbolicSolver, looks_supported, normalize_text, solve_text
+
+
+class TestSolveText:
+    """Test parsing and solving typed problems"""
+    
+    @pytest.mark.parametrize("text, answer", [
+        ("2x+3=11", "x = 4"),
+        ("x^2 - 5x + 6 = 0", "x = 2 or x = 3"),
+        ("solve for y: 3y - 7 = 2", "y = 3"),
+        ("12*(3+4)-5", "79"),
+        ("what is 3/4 + 1/6?", "11/12"),
+        ("2 + 2 =", "4"),
+        ("d/dx x^2 sin(x)", "x^2*cos(x) + 2*x*sin(x)"),
+        ("integrate x^2 dx", "x^3/3 + C"),
+        ("integral of x^2 from 0 to 1", "1/3"),
+        ("factor x^2+5x+6", "(x + 2)*(x + 3)"),
+        ("x = x + 1", "No solution"),
+        ("exp(1000000)", "exp(1000000)"),
+    ])
+    def test_solves_in_answer_format(self, text, answer):
+        """Test supported problems come back in the Answer/Explanation format"""
+        result = solve_text(text)
+        assert result.outcome == "solved"
+        first_line, second_line = result.answer.split("\n")
+        assert first_line == f"Answer: {answer}"
+        assert second_line.startswith("Explanation: ")
+    
+    @pytest.mark.parametrize("text", [
+        "find the area of a circle with radius 3",
+        "x^2 + 2x",
+        "1/0",
+        "__import__('os').system('true')",
+        "exec(1)",
+    ])
+    def test_unsupported_falls_back(self, text):
+        """Test prose, ambiguous expressions and unsafe input are left to Gemini"""
+        result = solve_text(text)
+        assert result.answer is None
+        assert result.outcome == "unsupported"
+    
+    def test_cpu_limit(self):
+        """Test runaway computations are cut off by the CPU time limit"""
+        result = solve_text("9^9^9^9", cpu_limit=0.2)
+        assert result.outcome == "timeout"
+    
+    def test_unicode_is_normalized(self):
+        """Test common math symbols typed on phones are understood"""
+        text = normalize_text("3 × 4 − 2²")
+        assert text == "3 * 4 - 2^2"
+        assert looks_supported(text)
+
+
+class TestSymbolicSolver:
+    """Test the process-pool wrapper"""
+    
+    async def test_disabled_returns_none(self):
+        """Test a disabled solver never answers"""
+        solver = SymbolicSolver(enabled=False)
+        assert await solver.solve("1 + 1") is None
+    
+    async def test_solves_in_worker_process(self):
+        """Test answers and counters through the real process pool"""
+        solver = SymbolicSolver(workers=1)
+        try:
+            assert await solver.solve("2x + 3 = 11") == (
+                "Answer: x = 4\nExplanation: Solving 2x + 3 = 11 for x gives x = 4."
+            )
+            assert await solver.solve("explain photosynthesis") is None
+        finally:
+            solver.close()
+        stats = solver.stats()
+        assert stats["solved"] == 1
+        assert stats["unsupported"] == 1
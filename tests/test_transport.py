@@ -0,0 +1,127 @@
+"""Tests for the tuned upstream HTTP transport"""
+
+import asyncio
+import logging
+
+import pytest
+
+from app.transport import UpstreamTransport
+
+
+@pytest.fixture
+async def upstream():
+    """Local keep-alive HTTP/1.1 server answering every request with 404"""
+    async def handle(reader, writer):
+        try:
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/v1beta"
+    server.close()
+
+
+class TestUpstreamTransport:
+    """Test client construction, warm-up and pool statistics"""
+    
+    def test_client_uses_configured_limits_and_timeouts(self):
+        """Test the httpx client is built from the transport settings"""
+        transport = UpstreamTransport(http2=False, max_connections=8, connect_timeout=2.0, read_timeout=30.0)
+        http_client = transport.client()
+        
+        assert http_client.timeout.connect == 2.0
+        assert http_client.timeout.read == 30.0
+        assert transport.client() is http_client
+        assert transport.stats()["max_connections"] == 8
+    
+    def test_http2_falls_back_without_h2(self, monkeypatch, caplog):
+        """Test HTTP/2 is only enabled when the h2 package is installed"""
+        monkeypatch.setattr("app.transport.http2_available", lambda: False)
+        transport = UpstreamTransport(http2=True)
+        
+        with caplog.at_level(logging.WARNING, logger="app.transport"):
+            transport.client()
+        
+        assert transport.stats()["http2"] is False
+        assert "HTTP/1.1" in caplog.text
+    
+    def test_http2_enabled_with_h2(self):
+        """Test HTTP/2 is negotiated when the h2 package is installed"""
+        pytest.importorskip("h2")
+        transport = UpstreamTransport(http2=True)
+        http_client = transport.client()
+        
+        assert transport.stats()["http2"] is True
+        # httpx only builds an HTTP/2-capable pool when h2 is importable
+        assert http_client._transport._pool._http2 is True
+    
+    def test_stats_before_first_use(self):
+        """Test stats are reported before any client exists"""
+        stats = UpstreamTransport().stats()
+        assert stats["connections"] == 0
+        assert stats["warm_up_seconds"] is None
+    
+    async def test_warm_up_opens_pooled_connections(self, upstream):
+        """Test warm-up leaves idle keep-alive connections in the pool"""
+        transport = UpstreamTransport(http2=False)
+        try:
+            opened = await transport.warm_up(upstream, connections=3)
+            stats = transport.stats()
+        finally:
+            await transport.close()
+        
+        assert opened == 3
+        assert stats["connections"] == 3
+        assert stats["idle"] == 3
+        assert stats["warmed"] == 3
+        assert stats["warm_up_failed"] == 0
+    
+    async def test_warm_up_is_capped_by_keepalive_limit(self, upstream):
+        """Test warm-up never opens more connections than the pool keeps alive"""
+        transport = UpstreamTransport(http2=False, max_keepalive=2)
+        try:
+            assert await transport.warm_up(upstream, connections=10) == 2
+        finally:
+            await transport.close()
+    
+    async def test_warm_up_failure_does_not_raise(self):
+        """Test an unreachable upstream is logged and counted, not raised"""
+        transport = UpstreamTransport(http2=False, connect_timeout=0.5)
+        try:
+            opened = await transport.warm_up("http://127.0.0.1:1/", connections=2)
+        finally:
+            await transport.close()
+        
+        assert opened == 0
+        assert transport.stats()["warm_up_failed"] == 2
+    
+    async def test_warm_up_respects_timeout(self, monkeypatch):
+        """Test a hanging upstream cannot hold up startup past the warm-up timeout"""
+        transport = UpstreamTransport(http2=False)
+        
+        async def hang(url):
+            await asyncio.sleep(10)
+        
+        monkeypatch.setattr(transport.client(), "head", hang)
+        try:
+            opened = await asyncio.wait_for(transport.warm_up("http://upstream", timeout=0.05), 1)
+        finally:
+            await transport.close()
+        
+        assert opened == 0
+    
+    async def test_close_allows_reuse(self):
+        """Test a closed transport builds a fresh client on next use"""
+        transport = UpstreamTransport(http2=False)
+        first = transport.client()
+        await transport.close()
+        
+        assert first.is_closed
+        assert transport.client() is not first
+        await transport.close()
@@ -0,0 +1,28 @@
+"""Tests for worker process pools"""
+
+import asyncio
+import time
+
+from app.workers import WorkerPool
+
+
+class TestWorkerPool:
+    """Test the shared process pool lifecycle"""
+    
+    async def test_runs_in_worker_process(self):
+        """Test tasks run and return their result"""
+        pool = WorkerPool("test")
+        try:
+            assert await pool.run(abs, -3) == 3
+        finally:
+            pool.close()
+    
+    async def test_close_cancels_queued_tasks(self):
+        """Test tasks still waiting for a worker are cancelled on close"""
+        pool = WorkerPool("test")
+        tasks = [asyncio.ensure_future(pool.run(time.sleep, 0.5)) for _ in range(4)]
+        await asyncio.sleep(0.1)
+        pool.close()
+        
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        assert any(isinstance(result, asyncio.CancelledError) for result in results)
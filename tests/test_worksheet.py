@@ -0,0 +1,127 @@
+"""Tests for worksheet segmentation"""
+
+import io
+
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from app import worksheet
+from app.worksheet import WorksheetSegmenter, segment_page
+
+
+def make_page(problems, size=(1200, 1600), font_size=28):
+    """Render problems as (x, y, text) onto a white page and return JPEG bytes"""
+    font = ImageFont.load_default(size=font_size)
+    page = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(page)
+    for x, y, text in problems:
+        draw.text((x, y), text, fill="black", font=font)
+    buffer = io.BytesIO()
+    page.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def two_column_page():
+    """Four problems per column, each a statement and a second line"""
+    problems = []
+    for column, x in enumerate((60, 640)):
+        for row in range(4):
+            y = 120 + row * 360
+            problems.append((x, y, f"{column * 4 + row + 1}) 3x + {row} = {row + 7}"))
+            problems.append((x + 30, y + 40, "Show your work."))
+    return make_page(problems)
+
+
+class TestSegmentPage:
+    """Test the XY-cut layout pass"""
+    
+    def test_regions_in_reading_order(self):
+        """Test columns are read left to right and problems top to bottom"""
+        tiles = segment_page(two_column_page())
+        
+        assert len(tiles) == 8
+        lefts = [tile.box[0] for tile in tiles]
+        tops = [tile.box[1] for tile in tiles]
+        assert max(lefts[:4]) < 0.5 <= min(lefts[4:])
+        assert tops[:4] == sorted(tops[:4])
+        assert tops[4:] == sorted(tops[4:])
+    
+    def test_multi_line_problem_stays_together(self):
+        """Test a problem's lines are not split into separate tiles"""
+        tile = segment_page(two_column_page())[0]
+        left, top, right, bottom = tile.box
+        # Statement and "Show your work." line, plus padding
+        assert bottom - top > 0.05
+        with Image.open(io.BytesIO(tile.data)) as img:
+            assert img.format == "JPEG"
+            assert img.width == pytest.approx((right - left) * 1200, abs=2)
+    
+    def test_short_problems_are_kept(self):
+        """Test one-line problems are not mistaken for specks"""
+        tiles = segment_page(make_page([
+            (100, 200, "3) 5x - 2 = 13"), (100, 500, "4) 2x + 2 = 8"), (100, 800, "2) 7*8"),
+        ]))
+        
+        assert len(tiles) == 3
+        assert [tile.box[1] for tile in tiles] == sorted(tile.box[1] for tile in tiles)
+    
+    def test_specks_are_dropped(self):
+        """Test dust and scanner noise do not become problems"""
+        with Image.open(io.BytesIO(two_column_page())) as img:
+            page = img.convert("RGB")
+        draw = ImageDraw.Draw(page)
+        draw.ellipse((1100, 60, 1106, 66), fill="black")
+        draw.ellipse((560, 1500, 563, 1503), fill="black")
+        buffer = io.BytesIO()
+        page.save(buffer, format="JPEG")
+        
+        assert len(segment_page(buffer.getvalue())) == 8
+    
+    def test_faint_region_is_not_split(self, monkeypatch):
+        """Test a page is left whole rather than drop a region that may be a problem"""
+        monkeypatch.setattr(worksheet, "MIN_REGION_INK", 10_000)
+        assert segment_page(two_column_page()) == []
+    
+    def test_single_problem_is_not_split(self):
+        """Test a page with one problem is left whole"""
+        assert segment_page(make_page([(100, 300, "2x + 3 = 11")])) == []
+    
+    def test_blank_page(self):
+        """Test a page without ink is left whole"""
+        assert segment_page(make_page([])) == []
+    
+    def test_too_many_regions_is_not_split(self):
+        """Test over-segmented pages fall back to a whole-page solve"""
+        assert len(segment_page(two_column_page(), max_problems=8)) == 8
+        assert segment_page(two_column_page(), max_problems=7) == []
+    
+    def test_undecodable_image(self):
+        """Test bytes Pillow cannot decode raise ValueError"""
+        with pytest.raises(ValueError):
+            segment_page(b"\x89PNG\r\n\x1a\n" + b"\x00" * 32)
+
+
+class TestWorksheetSegmenter:
+    """Test the process-pool wrapper"""
+    
+    async def test_disabled_returns_no_tiles(self):
+        """Test a disabled segmenter always solves pages whole"""
+        segmenter = WorksheetSegmenter(enabled=False)
+        assert await segmenter.segment(two_column_page()) == []
+        assert segmenter.stats()["pages"] == 0
+    
+    async def test_segments_in_worker_process(self):
+        """Test tiles and counters through the real process pool"""
+        segmenter = WorksheetSegmenter(workers=1)
+        try:
+            tiles = await segmenter.segment(two_column_page())
+            assert await segmenter.segment(b"not an image") == []
+        finally:
+            segmenter.close()
+        
+        assert len(tiles) == 8
+        stats = segmenter.stats()
+        assert stats["pages"] == 2
+        assert stats["split"] == 1
+        assert stats["problems"] == 8
+        assert stats["errors"] == 1